@@ -0,0 +1,687 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线压测：用 fake_client 回放事件，测量 core 转发流程的吞吐、延迟与内存
+
+用法:
+    python benchmark.py                       # 运行全部场景
+    python benchmark.py senders media         # 只运行指定场景
+    python benchmark.py --replay events.jsonl # 回放录制的事件
+    python benchmark.py --sessions 500        # 对比 .session 文件与集中式 session 存储的磁盘开销
+    python benchmark.py --download 200        # 对比顺序下载与并行分片下载 200MB 文件
+    python benchmark.py --upload              # 对比顺序上传与并行分片上传 10/100/500MB 文件
+    python benchmark.py --journal 100000      # 预写日志的单条开销，以及中途取消后重启补发
+    python benchmark.py --blacklist 3000000   # 文件黑名单的编译、重新加载与查询开销
+    python benchmark.py --monitors 3          # 多个监听账号：其中一个卡顿、一个掉线时的事件到达延迟
+    python benchmark.py --formatting 2000     # 长格式消息：markdown 往返 vs 原始文本 + 实体的替换开销
+    python benchmark.py --rules 100000        # 过滤规则链的单条开销，以及省掉的 get_sender 调用
+"""
+import argparse
+import asyncio
+import configparser
+import dataclasses
+import logging
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from typing import Callable, Dict, List
+
+import core
+from core import Config, ConfigSnapshot
+from rpc_cache import CachedRPC
+from session_store import SessionDB
+from telethon.extensions import markdown
+from telethon.helpers import add_surrogate
+from telethon.tl.types import MessageEntityBold, MessageEntityCode, MessageEntityItalic, MessageEntityTextUrl
+from blacklist import FileBlacklist
+from journal import Journal
+from monitors import EventArbiter
+from rules import RuleChain, parse_rules
+from workspace import MediaWorkspace
+from fake_client import (FakeEvent, FakeMedia, FakeMessage, FakeTelegramClient, FakeUser, FakeTelegramServer, fake_file_connections, fake_file_location,
+                         load_recording, replay, synthetic_events)
+from parallel_download import ParallelDownloader
+from parallel_upload import ParallelUploader
+
+# 场景: 名称 -> synthetic_events 参数
+SCENARIOS: Dict[str, dict] = {
+    "senders": dict(count=5000, senders=1000),
+    "media": dict(count=1000, senders=50, media_ratio=0.8, media_size=512 * 1024),
+    "replies": dict(count=3000, senders=100, reply_ratio=0.7),
+    "albums": dict(count=1000, senders=50, album_ratio=0.5, media_size=256 * 1024),
+    # 文本夹杂少量大视频：配合 --bandwidth 观察文本延迟是否被大文件拖慢
+    "mixed": dict(count=1000, senders=20, media_ratio=0.1, media_size=256 * 1024,
+                  large_ratio=0.2, large_size=20 * 1024 * 1024),
+    # 三成消息是之前内容的重发（跨群推广、刷屏）
+    "duplicates": dict(count=2000, senders=200, media_ratio=0.3, media_size=256 * 1024, duplicate_ratio=0.3),
+}
+
+
+def reset_state() -> None:
+    """清空 core 的全局状态，保证各场景互不影响"""
+    core.clients_pool.clear()
+    core.client_locks.clear()
+    core.sender_locks.clear()
+    core.message_id_mapping.clear()
+    core.cloned_users.clear()
+    core.frozen_clients.clear()
+    core.client_names.clear()
+    core.client_last_active.clear()
+    core.client_last_used.clear()
+    core.client_last_sent.clear()
+    core.recycle_times.clear()
+    core.pool_stats["recycled"] = 0
+    core.pool_stats["removed"] = 0
+    core.reference_stats.update(hits=0, refreshed=0, fallbacks=0)
+    core.account_health.clear()
+    core.transfer_lanes = core.TransferLanes()
+    core.uploader = ParallelUploader()
+    core.dedupe = core.DedupeWindow()
+    core.workspace = MediaWorkspace(os.path.join(tempfile.mkdtemp(prefix="bench_"), "media_tmp"))
+    core.journal = Journal(os.path.join(tempfile.mkdtemp(prefix="bench_"), "journal.log"))
+    core.members = core.MemberDirectory(os.path.join(tempfile.mkdtemp(prefix="bench_"), "members.json"))
+    core.rpc_cache = CachedRPC()
+    core.assignments = core.AssignmentStore(os.path.join(tempfile.mkdtemp(prefix="bench_"), "assignments.json"))
+
+
+def setup_pool(server: FakeTelegramServer, accounts: int, frozen: float = 0.0) -> None:
+    """frozen: 预先被冻结的账号比例（均匀分布在账号池中）"""
+    step = round(1 / frozen) if frozen else 0
+    for i in range(accounts):
+        client = FakeTelegramClient(server, f"8613{i:09d}", frozen=bool(step) and i % step == 0)
+        core.register_client(client, client.phone)
+
+
+def make_downloader(server: FakeTelegramServer, connections: int = 4, part_size: int = 512 * 1024) -> ParallelDownloader:
+    return ParallelDownloader(FakeTelegramClient(server, "monitor-download"), connections, part_size,
+                              directory=server.tmp_dir, connect=partial(fake_file_connections, server),
+                              locate=fake_file_location)
+
+
+async def bench_download(size_mb: float, latency: tuple, bandwidth: float) -> None:
+    """同一个文件：telethon 式顺序下载 vs 不同连接数 / 分片大小的并行下载"""
+    size = int(size_mb * 1024 * 1024)
+    server = FakeTelegramServer(latency=latency, bandwidth=bandwidth, seed=1)
+    media = FakeMedia("video", 1, size)
+
+    async def timed(download) -> float:
+        start = time.perf_counter()
+        path = await download(media)
+        elapsed = time.perf_counter() - start
+        assert os.path.getsize(path) == size
+        os.remove(path)
+        return elapsed
+
+    base = await timed(FakeTelegramClient(server, "monitor").download_media)
+    print(f"[download] {size_mb:.0f}MB 顺序下载: {base:.2f}s ({size_mb / base:.1f} MB/s)")
+    for connections in (1, 2, 4, 8):
+        for part_kb in (256, 512, 1024):
+            elapsed = await timed(make_downloader(server, connections, part_kb * 1024).download_media)
+            print(f"[download] 并行 connections={connections} part={part_kb}KB: {elapsed:.2f}s "
+                  f"({size_mb / elapsed:.1f} MB/s, x{base / elapsed:.1f})")
+
+
+async def bench_upload(sizes_mb: tuple, latency: tuple, bandwidth: float) -> None:
+    """同一个文件：telethon 式逐片上传 vs 不同窗口 / 连接数的并行上传（稀疏文件，不占实际磁盘）"""
+    server = FakeTelegramServer(latency=latency, bandwidth=bandwidth, seed=1)
+    client = FakeTelegramClient(server, "8613000000000")
+    for size_mb in sizes_mb:
+        path = os.path.join(server.tmp_dir, f"upload_{size_mb}.bin")
+        with open(path, "wb") as f:
+            f.truncate(int(size_mb * 1024 * 1024))
+
+        start = time.perf_counter()
+        await client.upload_file(path)
+        base = time.perf_counter() - start
+        print(f"[upload] {size_mb}MB 顺序上传: {base:.2f}s ({size_mb / base:.1f} MB/s)")
+        for connections in (1, 4):
+            for window in (4, 8, 16):
+                uploader = ParallelUploader(window=window, connections=connections,
+                                            connect=lambda c, dc_id, n: fake_file_connections(server, dc_id, n))
+                start = time.perf_counter()
+                await uploader.upload_file(client, path)
+                elapsed = time.perf_counter() - start
+                await uploader.release(client)
+                print(f"[upload] 并行 connections={connections} window={window}: {elapsed:.2f}s "
+                      f"({size_mb / elapsed:.1f} MB/s, x{base / elapsed:.1f})")
+        os.remove(path)
+
+
+async def bench_journal(count: int, latency: tuple, accounts: int) -> None:
+    """预写日志：事件循环上的单条开销（组提交 vs 每条 fsync），以及处理中途取消后下次启动的补发"""
+    work = tempfile.mkdtemp(prefix="bench_journal_")
+    journal = Journal(os.path.join(work, "journal.log"))
+    journal.load()
+    writer = asyncio.create_task(journal.run())
+    on_loop = 0.0
+    for i in range(0, count, 1000):
+        start = time.perf_counter()
+        for j in range(i, min(count, i + 1000)):
+            journal.accept(-100, j)
+            journal.done(-100, j)
+        on_loop += time.perf_counter() - start
+        await asyncio.sleep(0.01)  # 每 10ms 到达 1000 条消息，期间组提交在线程池中写入
+    writer.cancel()
+    await asyncio.gather(writer, return_exceptions=True)
+
+    naive_count = min(count, 2000)
+    start = time.perf_counter()
+    with open(os.path.join(work, "naive.log"), "a", encoding="utf-8") as f:
+        for i in range(naive_count):
+            f.write(f'["A",-100,{i}]\n')
+            f.flush()
+            os.fsync(f.fileno())
+    naive = (time.perf_counter() - start) / naive_count
+    print(f"[journal] 组提交: 每条消息 {on_loop / count * 1e6:.1f}us（{count * 2} 条记录 {journal.commits} 次提交）/ "
+          f"每条 fsync: {naive * 1e6:.1f}us")
+
+    # 中途取消（相当于关闭窗口），再用同一个日志启动，检查每条消息恰好转发一次
+    reset_state()
+    core.journal = Journal(os.path.join(work, "replay.log"))
+    core.journal.load()
+    server = FakeTelegramServer(latency=latency, seed=1)
+    setup_pool(server, accounts)
+    events = synthetic_events(server, 500, senders=50, seed=1)
+    monitor = FakeTelegramClient(server, "monitor")
+    Config.SNAPSHOT = dataclasses.replace(Config.SNAPSHOT, send_delay=(0.0, 0.05))
+    writer = asyncio.create_task(core.journal.run())
+    run = asyncio.create_task(replay(events, core.build_message_handler(monitor)))
+    await asyncio.sleep(0.5)
+    run.cancel()
+    writer.cancel()
+    await asyncio.gather(run, writer, return_exceptions=True)
+    sent_before = len(server.sent)
+
+    core.message_id_mapping.clear()
+    core.journal = Journal(os.path.join(work, "replay.log"))
+    unfinished = core.journal.load()
+    await core.replay_journal(monitor, unfinished)
+    texts = [m.text for m in server.sent.values()]
+    print(f"[journal] 取消前已发送 {sent_before} / {len(events)}，重启补发 {len(unfinished)} 条，"
+          f"合计 {len(texts)} 条（重复 {len(texts) - len(set(texts))}，遗漏 {len(events) - len(set(texts))}）")
+
+    # 发送成功后、done 记录写入之前中断：重新转发前按 sent 记录跳过已发出的消息
+    reset_state()
+    core.journal = LostDoneJournal(os.path.join(work, "lost_done.log"))
+    core.journal.load()
+    server = FakeTelegramServer(latency=latency, seed=1)
+    setup_pool(server, accounts)
+    events = synthetic_events(server, 500, senders=50, seed=1)
+    monitor = FakeTelegramClient(server, "monitor")
+    writer = asyncio.create_task(core.journal.run())
+    await replay(events, core.build_message_handler(monitor))
+    writer.cancel()
+    await asyncio.gather(writer, return_exceptions=True)
+    sent_before = len(server.sent)
+
+    core.message_id_mapping.clear()
+    core.journal = Journal(os.path.join(work, "lost_done.log"))
+    unfinished = core.journal.load()
+    await core.replay_journal(monitor, unfinished)
+    texts = [m.text for m in server.sent.values()]
+    print(f"[journal] 丢失 done 记录 {len(unfinished)} 条（均已发出），重启后新发送 {len(server.sent) - sent_before} 条，"
+          f"合计 {len(texts)} 条（重复 {len(texts) - len(set(texts))}，遗漏 {len(events) - len(set(texts))}）")
+    shutil.rmtree(work, ignore_errors=True)
+
+
+class LostDoneJournal(Journal):
+    """丢掉一半消息的 done 记录，相当于发送成功后、done 写入之前进程被中断"""
+
+    def done(self, chat_id: int, msg_id: int) -> None:
+        if msg_id % 2 == 0:
+            super().done(chat_id, msg_id)
+
+
+async def check_filtered_duplicate(latency: tuple, accounts: int) -> None:
+    """被规则丢弃的第一条不能挡住其他群组里的相同内容：去重指纹只在消息真正发出后记录"""
+    reset_state()
+    server = FakeTelegramServer(latency=latency, seed=1)
+    setup_pool(server, accounts)
+    monitor = FakeTelegramClient(server, "monitor")
+    previous = Config.SNAPSHOT
+    Config.SNAPSHOT = dataclasses.replace(
+        previous, rules=RuleChain(parse_rules([("muted_chat", "drop\nchat = -1001")])))
+    try:
+        handler = core.build_message_handler(monitor)
+        text = "今日特价，私聊了解详情"
+        for chat_id, user_id in ((-1001, 10_001), (-1002, 10_002)):
+            message = FakeMessage(chat_id, 1, text=text, sender=FakeUser(user_id, first_name=f"user{user_id}"))
+            server.add_source_message(message)
+            await handler(FakeEvent(message, server))
+    finally:
+        Config.SNAPSHOT = previous
+    passed = len(server.sent) == 1 and core.dedupe.hits == 0
+    print(f"[duplicates] 第一条被规则丢弃，其他群组的相同内容照常转发: {'通过' if passed else '失败'}"
+          f"（sent={len(server.sent)} dup={core.dedupe.hits}）")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+async def run_scenario(name: str, make_events: Callable[[FakeTelegramServer], list], accounts: int,
+                       latency: tuple, flood_rate: float, frozen_rate: float, warmup: bool = False,
+                       bandwidth: float = 0.0, lanes: bool = True, frozen_accounts: float = 0.0,
+                       health: bool = False, stale_references: float = 0.0, workspace_budget: int = 0) -> dict:
+    reset_state()
+    core.workspace.budget = workspace_budget
+    server = FakeTelegramServer(latency=latency, flood_rate=flood_rate, frozen_rate=frozen_rate, seed=1,
+                                bandwidth=bandwidth, stale_reference_rate=stale_references)
+    setup_pool(server, accounts, frozen_accounts)
+    events = make_events(server)
+    monitor = FakeTelegramClient(server, "monitor")
+    if lanes:
+        core.transfer_lanes.download_clients[monitor] = make_downloader(server)
+    else:
+        # 对照组：不分道，所有下载共用监听连接
+        core.transfer_lanes.configure(concurrency=(0, 0, 0))
+    message_handler = core.build_message_handler(monitor)
+    text_latencies: List[float] = []
+
+    async def handler(event) -> None:
+        start = time.perf_counter()
+        await message_handler(event)
+        if not event.message.media:
+            text_latencies.append(time.perf_counter() - start)
+
+    if warmup:
+        await core.warm_up_members(monitor, list(server.participants))
+        server.calls.clear()
+    if health:
+        # 相当于健康检查已经跑完一轮（探测请求不计入统计）
+        await asyncio.gather(*(core.check_account(c) for c in list(core.clients_pool)))
+        server.calls.clear()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    latencies = await replay(events, handler, timed=isinstance(events[0], tuple) if events else False)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "scenario": name,
+        "events": len(latencies),
+        "sent": len(server.sent),
+        "msg_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": (statistics.mean(latencies) * 1000) if latencies else 0.0,
+        "text_p99_ms": percentile(text_latencies, 99) * 1000,
+        "peak_mem_mb": peak / 1024 / 1024,
+        "rpc_calls": sum(server.calls.values()),
+        "resolve_calls": server.calls["get_input_entity"],
+        "recycled": core.pool_stats["recycled"],
+        "cache_hit_rate": core.rpc_cache.stats()["hit_rate"],
+        "duplicates": core.dedupe.hits,
+        "removed": core.pool_stats["removed"],
+        "by_reference": core.reference_stats["hits"],
+        "transfer_mb": (server.bytes_down + server.bytes_up) / 1024 / 1024,
+        "workspace_waits": core.workspace.waits,
+        "leftover_files": len(os.listdir(core.workspace.directory)) if os.path.isdir(core.workspace.directory) else 0,
+    }
+
+
+def print_result(result: dict) -> None:
+    print(f"[{result['scenario']}] events={result['events']} sent={result['sent']} "
+          f"rate={result['msg_per_sec']:.1f} msg/s p50={result['p50_ms']:.2f}ms "
+          f"p99={result['p99_ms']:.2f}ms mean={result['mean_ms']:.2f}ms text_p99={result['text_p99_ms']:.2f}ms "
+          f"peak_mem={result['peak_mem_mb']:.2f}MB rpc={result['rpc_calls']} resolve={result['resolve_calls']} recycled={result['recycled']} "
+          f"cache_hit={result['cache_hit_rate']:.0%} dup={result['duplicates']} removed={result['removed']} "
+          f"by_ref={result['by_reference']} transfer={result['transfer_mb']:.1f}MB "
+          f"disk_waits={result['workspace_waits']} leftover={result['leftover_files']}")
+
+
+def bench_sessions(count: int, messages: int = 5000, senders: int = 100) -> None:
+    """启动加载与每条消息的实体缓存写入：每账号一个 SQLite 文件 vs 集中式 SessionDB"""
+    from telethon.crypto import AuthKey
+    from telethon.sessions import SQLiteSession
+    from telethon.tl.types import User
+
+    work = tempfile.mkdtemp(prefix="bench_sessions_")
+    legacy_dir = os.path.join(work, "sessions")
+    os.makedirs(legacy_dir)
+    for i in range(count):
+        session = SQLiteSession(os.path.join(legacy_dir, f"8613{i:09d}"))
+        session.set_dc(2, "149.154.167.51", 443)
+        session.auth_key = AuthKey(data=os.urandom(256))
+        session.save()
+        session.close()
+
+    start = time.perf_counter()
+    legacy = [SQLiteSession(os.path.join(legacy_dir, f"8613{i:09d}")) for i in range(count)]
+    legacy_load = time.perf_counter() - start
+
+    db_path = os.path.join(work, "sessions.db")
+    start = time.perf_counter()
+    SessionDB(db_path).load(legacy_dir)
+    import_time = time.perf_counter() - start
+    db = SessionDB(db_path)
+    start = time.perf_counter()
+    sessions = db.load(legacy_dir)
+    db_load = time.perf_counter() - start
+
+    users = [User(id=10_000 + i, access_hash=i * 7919, first_name=f"user{i}", phone=f"1555{i:07d}")
+             for i in range(senders)]
+    batches = [[users[(n * 13 + k) % senders] for k in range(3)] for n in range(messages)]
+
+    old, new = legacy[0], sessions[sorted(sessions)[0]]
+    start = time.perf_counter()
+    for batch in batches:
+        old.process_entities(batch)
+        old.save()  # telethon 的 SQLite session 在更新处理中频繁提交
+    legacy_msg = time.perf_counter() - start
+    start = time.perf_counter()
+    for batch in batches:
+        new.process_entities(batch)
+    db_msg = time.perf_counter() - start
+    pending = db.pending
+    start = time.perf_counter()
+    db.flush()
+    flush_time = time.perf_counter() - start
+
+    for session in legacy:
+        session.close()
+    shutil.rmtree(work, ignore_errors=True)
+    print(f"[sessions] accounts={count} 启动: 逐个打开 .session {legacy_load * 1000:.1f}ms / "
+          f"首次导入 {import_time * 1000:.1f}ms / 集中存储 {db_load * 1000:.1f}ms")
+    print(f"[sessions] messages={messages} 事件循环上的实体写入: .session {legacy_msg * 1000:.1f}ms / "
+          f"集中存储 {db_msg * 1000:.1f}ms（后台批量写入 {pending} 行 {flush_time * 1000:.1f}ms）")
+
+
+async def deliver_events(count: int, monitors: int, latency: tuple, rate: float = 200.0) -> tuple:
+    """
+    每条事件分别投递给每个监听账号（各自的网络延迟）：m0 在 30%-60% 期间卡顿 2 秒，m1 在最后 30% 掉线。
+    返回 (每条事件最先到达的延迟列表, 处理次数, 仲裁统计)
+    """
+    server = FakeTelegramServer(seed=1)
+    events = synthetic_events(server, count, senders=50, seed=1)
+    core.monitor_events = EventArbiter()
+    rng = random.Random(1)
+    emitted: Dict[tuple, float] = {}
+    delivered: List[float] = []
+    handled = 0
+
+    async def handler(event) -> None:
+        nonlocal handled
+        handled += 1
+        delivered.append(time.perf_counter() - emitted[(event.chat_id, event.message.id)])
+
+    names = [f"m{i}" for i in range(monitors)]
+    for name in names:
+        core.monitor_events.register(name)
+    handlers = {name: core.arbitrated(handler, name, core.new_message_key) for name in names}
+    loop = asyncio.get_running_loop()
+    begin = time.perf_counter()
+    for i, event in enumerate(events):
+        delay = i / rate - (time.perf_counter() - begin)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        emitted[(event.chat_id, event.message.id)] = time.perf_counter()
+        progress = i / count
+        for name in names:
+            if name == "m1" and progress >= 0.7:
+                continue  # 掉线
+            lag = rng.uniform(*latency) + (2.0 if name == "m0" and 0.3 <= progress < 0.6 else 0.0)
+            loop.call_later(lag, lambda h=handlers[name], e=event: asyncio.ensure_future(h(e)))
+    await asyncio.sleep(latency[1] + 2.5)
+    return delivered, handled, core.monitor_events.stats()
+
+
+async def bench_monitors(count: int, monitors: int, latency: tuple) -> None:
+    for n in sorted({1, monitors}):
+        delivered, handled, stats = await deliver_events(count, n, latency)
+        print(f"[monitors] n={n} events={count} handled={handled} 到达延迟 p50={percentile(delivered, 50) * 1000:.1f}ms "
+              f"p99={percentile(delivered, 99) * 1000:.1f}ms max={max(delivered) * 1000:.1f}ms")
+        for name, s in stats.items():
+            print(f"[monitors]   {name}: received={s['received']} first={s['first_rate']:.0%} "
+                  f"behind_p50={s['behind_p50'] * 1000:.1f}ms")
+
+
+def formatted_message(paragraphs: int = 40, seed: int = 1) -> tuple:
+    """生成带大量格式实体与 emoji 的长消息 -> (raw_text, entities)"""
+    rng = random.Random(seed)
+    words = ["加微信", "联系", "优惠", "price", "10*2", "a_b", "😀", "🚀", "推广", "群"]
+    text, entities, offset = [], [], 0
+    kinds = [MessageEntityBold, MessageEntityItalic, MessageEntityCode, MessageEntityTextUrl]
+    for _ in range(paragraphs):
+        for _ in range(rng.randint(5, 12)):
+            word = rng.choice(words) + " "
+            size = len(add_surrogate(word)) - 1
+            if rng.random() < 0.5:
+                kind = rng.choice(kinds)
+                extra = {"url": "https://example.com"} if kind is MessageEntityTextUrl else {}
+                entities.append(kind(offset=offset, length=size, **extra))
+            text.append(word)
+            offset += size + 1
+        text.append("\n")
+        offset += 1
+    return "".join(text), entities
+
+
+def bench_formatting(count: int) -> None:
+    """替换词生效的长格式消息：旧路径（渲染 markdown -> 替换 -> 再解析）与原始文本 + 实体的开销与保真度"""
+    snapshot = ConfigSnapshot.build(target_group="target", send_delay=(0.0, 0.0), black_list=frozenset(),
+                                    key_words=frozenset(), replacements={"加微信": "加VX", "推广": "**推广**",
+                                                                         "price": "价格_"})
+    raw, entities = formatted_message()
+    expected_text, expected = snapshot.replace_entities(raw, entities)
+
+    start = time.perf_counter()
+    for _ in range(count):
+        old_text, old_entities = markdown.parse(snapshot.replace(markdown.unparse(raw, entities)))
+    old_time = (time.perf_counter() - start) / count
+    start = time.perf_counter()
+    for _ in range(count):
+        new_text, new_entities = snapshot.replace_entities(raw, entities)
+    new_time = (time.perf_counter() - start) / count
+
+    def spans(items):
+        return sorted((type(e).__name__, e.offset, e.length) for e in items)
+    plain = snapshot.replace(raw)  # 替换后应得到的纯文本
+    print(f"[formatting] 消息 {len(raw)} 字符 / {len(entities)} 个实体，每条: markdown 往返 {old_time * 1e6:.0f}µs / "
+          f"原始文本 + 实体 {new_time * 1e6:.0f}µs (x{old_time / new_time:.1f})")
+    print(f"[formatting] 文本一致: markdown 往返 {old_text == plain} / 原始文本 + 实体 {new_text == plain}；"
+          f"实体一致: markdown 往返 {spans(old_entities) == spans(expected)} "
+          f"({len(old_entities)}/{len(expected)}) / 原始文本 + 实体 {spans(new_entities) == spans(expected)}")
+
+
+BENCH_RULES = """
+[rules]
+no_bots_in_ads = drop
+    chat = -1001000000002
+    bot = true
+vip = allow
+    sender = 1, 2, 3
+no_stickers = drop
+    media = sticker, gif, video
+spam_links = drop
+    regex = (?i)(t\\.me/|https?://)\\S+
+    media != photo
+too_short = drop
+    length = <4
+"""
+
+
+def bench_rules(count: int) -> None:
+    """规则链逐条检查消息：消息头阶段能决定的消息不需要再请求发送者实体"""
+    config = configparser.ConfigParser()
+    config.read_string(BENCH_RULES)
+    snapshot = ConfigSnapshot.build(target_group="target", send_delay=(0.0, 0.0),
+                                    black_list=frozenset(range(1000, 1100)), key_words=frozenset({"广告", "推广"}),
+                                    replacements={}, rules=parse_rules(config.items("rules", raw=True)))
+    rng = random.Random(1)
+    texts = ["你好", "ok", "看看这个 https://t.me/joinchat/abc", "今日推广，私聊", "明天几点开会？大家记得带电脑",
+             "收到"]
+    users = [FakeUser(i, bot=i % 50 == 0) for i in range(1, 1200)]
+    messages = [FakeMessage(rng.choice((-1001000000001, -1001000000002)), i, text=rng.choice(texts),
+                            sender=rng.choice(users),
+                            media=FakeMedia("video", i, 1024) if rng.random() < 0.1 else None)
+                for i in range(count)]
+    chain = snapshot.rules
+    senders = kept = 0
+    start = time.perf_counter()
+    for message in messages:
+        verdict, pending = chain.check_header(message)
+        if pending is not None:
+            senders += 1
+            verdict = chain.check_sender(message, message.sender, pending)
+        kept += verdict != "drop"
+    elapsed = time.perf_counter() - start
+    header = sum(1 for rule in chain.rules if not rule.needs_sender)
+    print(f"[rules] {len(chain)} 条规则（只依赖消息头 {header} 条），每条消息 {elapsed / count * 1e6:.1f}µs；"
+          f"保留 {kept}/{count}，需要 get_sender {senders}/{count}（原流程 {count}/{count}）")
+    for r in chain.stats():
+        print(f"[rules]   {r['name']:<16} {r['action']:<5} {r['stage']:<6} 命中 {r['hits']:>7} / {r['evaluations']:<7}"
+              f" 平均 {r['avg_us']:.2f}µs")
+
+
+def bench_blacklist(count: int, lookups: int = 100_000) -> None:
+    work = tempfile.mkdtemp(prefix="bench_blacklist_")
+    source = os.path.join(work, "ids.txt")
+    rng = random.Random(1)
+    ids = [rng.randrange(1, 8_000_000_000) for _ in range(count)]
+    with open(source, "w") as f:
+        f.writelines(f"{user_id}\n" for user_id in ids)
+    probes = [ids[rng.randrange(count)] if i % 2 else rng.randrange(1, 8_000_000_000) for i in range(lookups)]
+    set_bytes = sys.getsizeof(set(ids[:100_000])) / 100_000 * count + 32 * count  # set 槽位 + int 对象
+    del ids
+
+    cache = os.path.join(work, "cache")
+    black = FileBlacklist(cache)
+    black.configure([source])
+    start = time.perf_counter()
+    black.refresh()
+    compile_time = time.perf_counter() - start
+
+    restarted = FileBlacklist(cache)
+    restarted.configure([source])
+    start = time.perf_counter()
+    restarted.refresh()
+    reopen = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hits = sum(user_id in restarted for user_id in probes)
+    lookup = (time.perf_counter() - start) / lookups
+
+    extra = os.path.join(work, "extra.txt")
+    with open(extra, "w") as f:
+        f.write("# 新增\n1,2,3\n")
+    restarted.configure([os.path.join(work, "*.txt")])
+    start = time.perf_counter()
+    restarted.refresh()
+    incremental = time.perf_counter() - start
+
+    stats = restarted.stats()
+    black._swap({})
+    restarted._swap({})
+    shutil.rmtree(work, ignore_errors=True)
+    print(f"[blacklist] ids={count} 首次编译 {compile_time:.2f}s / 重启后打开缓存 {reopen * 1000:.1f}ms / "
+          f"新增一个文件 {incremental * 1000:.1f}ms")
+    print(f"[blacklist] 映射 {stats['mapped_bytes'] / 1024 / 1024:.1f}MB（Python set 约 {set_bytes / 1024 / 1024:.0f}MB）"
+          f" / 查询 {lookup * 1e6:.2f}µs（命中 {hits}/{lookups}）")
+
+
+async def main(args) -> None:
+    Config.TARGET_GROUP = "target"
+    Config.SNAPSHOT = ConfigSnapshot.build(target_group="target", send_delay=(0.0, 0.0), black_list=frozenset(),
+                                           key_words=frozenset(), replacements={}, album_window=0.05)
+    Config.RECYCLE_MIN_IDLE = args.min_idle
+    Config.WARMUP_RATE = 0
+    Config.DEDUPE_ENABLED = not args.no_dedupe
+    Config.REFERENCE_SEND = not args.no_reference
+    latency = (args.latency_min / 1000, args.latency_max / 1000)
+
+    if args.download:
+        await bench_download(args.download, latency, (args.bandwidth or 50) * 1024 * 1024)
+        return
+
+    if args.monitors:
+        await bench_monitors(2000, args.monitors, (max(latency[0], 0.005), max(latency[1], 0.05)))
+        return
+
+    if args.formatting:
+        bench_formatting(args.formatting)
+        return
+
+    if args.blacklist:
+        bench_blacklist(args.blacklist)
+        return
+
+    if args.rules:
+        bench_rules(args.rules)
+        return
+
+    if args.journal:
+        await bench_journal(args.journal, latency, args.accounts)
+        return
+
+    if args.upload:
+        await bench_upload((10, 100, 500), latency, (args.bandwidth or 50) * 1024 * 1024)
+        return
+
+    if args.replay:
+        result = await run_scenario("replay", lambda server: load_recording(server, args.replay),
+                                    args.accounts, latency, args.flood_rate, args.frozen_rate, args.warmup,
+                                    args.bandwidth * 1024 * 1024, not args.no_lanes, args.frozen_accounts,
+                                    args.health, args.stale_references, int(args.workspace_budget * 1024 * 1024))
+        print_result(result)
+        return
+
+    for name in args.scenarios or list(SCENARIOS):
+        params = SCENARIOS[name]
+        result = await run_scenario(name, lambda server: synthetic_events(server, seed=1, **params),
+                                    args.accounts, latency, args.flood_rate, args.frozen_rate, args.warmup,
+                                    args.bandwidth * 1024 * 1024, not args.no_lanes, args.frozen_accounts,
+                                    args.health, args.stale_references, int(args.workspace_budget * 1024 * 1024))
+        print_result(result)
+        if name == "duplicates" and Config.DEDUPE_ENABLED:
+            await check_filtered_duplicate(latency, args.accounts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Telegram Group Cloner 离线压测")
+    parser.add_argument("scenarios", nargs="*", help=f"要运行的场景: {', '.join(SCENARIOS)}")
+    parser.add_argument("--replay", help="回放录制的事件文件（JSONL）")
+    parser.add_argument("--download", type=float, help="对比顺序下载与并行分片下载（指定文件大小 MB）")
+    parser.add_argument("--upload", action="store_true", help="对比顺序上传与并行分片上传")
+    parser.add_argument("--journal", type=int, help="预写日志开销与取消后补发（指定消息数）")
+    parser.add_argument("--monitors", type=int, help="多个监听账号的事件去重与到达延迟（指定账号数）")
+    parser.add_argument("--formatting", type=int, help="长格式消息的替换开销与格式保真度（指定重复次数）")
+    parser.add_argument("--blacklist", type=int, help="文件黑名单的编译与查询开销（指定 id 数）")
+    parser.add_argument("--rules", type=int, help="过滤规则链的开销与省掉的 get_sender 调用（指定消息数）")
+    parser.add_argument("--sessions", type=int, help="对比 session 存储方式（指定账号数）")
+    parser.add_argument("--accounts", type=int, default=1000, help="克隆账号数量")
+    parser.add_argument("--min-idle", type=float, default=0.0, help="账号可被回收的最短空闲时间（秒）")
+    parser.add_argument("--latency-min", type=float, default=5.0, help="模拟 RPC 最小延迟（毫秒）")
+    parser.add_argument("--latency-max", type=float, default=20.0, help="模拟 RPC 最大延迟（毫秒）")
+    parser.add_argument("--warmup", action="store_true", help="回放前预热源群组成员（成员列表请求不计入统计）")
+    parser.add_argument("--bandwidth", type=float, default=0.0, help="模拟每个连接的带宽（MB/s），0 表示不模拟")
+    parser.add_argument("--no-dedupe", action="store_true", help="不做内容去重（对照组）")
+    parser.add_argument("--no-reference", action="store_true", help="媒体总是下载后上传（对照组）")
+    parser.add_argument("--stale-references", type=float, default=0.0, help="按引用发送时引用已过期的媒体比例")
+    parser.add_argument("--workspace-budget", type=float, default=0.0, help="临时媒体目录的磁盘预算（MB），0 表示不限")
+    parser.add_argument("--no-lanes", action="store_true", help="不分道传输（对照组）")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="写操作触发 FloodWait 的概率")
+    parser.add_argument("--frozen-accounts", type=float, default=0.0, help="账号池中预先被冻结的账号比例")
+    parser.add_argument("--health", action="store_true", help="回放前先做一轮账号健康检查")
+    parser.add_argument("--frozen-rate", type=float, default=0.0, help="写操作触发 FROZEN 的概率")
+    parsed = parser.parse_args()
+    unknown = [name for name in parsed.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+    logging.getLogger().setLevel(logging.WARNING)
+    if parsed.sessions:
+        bench_sessions(parsed.sessions)
+    else:
+        asyncio.run(main(parsed))
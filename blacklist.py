@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件黑名单
+
+从外部 id 文件（每行一个或逗号/空白分隔，# 开头为注释）读取大量用户 id，
+每个源文件按块编译成排好序的 int64 文件（setting/blacklist_cache/），通过 mmap 映射后二分查找：
+每个 id 只占 8 字节且在页缓存中，不占 Python 堆，查询为 O(块数 * log n)。
+源文件变化时只重新编译变化的文件；编译在线程中进行，完成后整体替换。
+"""
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_ID = re.compile(rb"\d+")
+_COMMENT = re.compile(rb"#[^\n]*")
+READ_SIZE = 1024 * 1024
+RUN_SIZE = 1_000_000  # 每个有序块的 id 数，编译时内存约为 run_size * 40 字节
+
+
+class _Segment:
+    """一个源文件编译后的若干有序 id 块（mmap）"""
+
+    def __init__(self, source: str, mtime: int, size: int, runs: List[str]):
+        self.source = source
+        self.mtime = mtime
+        self.size = size
+        self.runs = runs
+        self._maps: List[tuple] = []
+        self.views: List[memoryview] = []
+
+    def open(self) -> "_Segment":
+        for path in self.runs:
+            if not os.path.getsize(path):
+                continue
+            f = open(path, "rb")
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps.append((f, mapped))
+            self.views.append(memoryview(mapped).cast("q"))
+        return self
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self.views)
+
+    def __contains__(self, user_id: int) -> bool:
+        for ids in self.views:
+            i = bisect_left(ids, user_id)
+            if i < len(ids) and ids[i] == user_id:
+                return True
+        return False
+
+    def close(self) -> None:
+        for view in self.views:
+            view.release()
+        for f, mapped in self._maps:
+            mapped.close()
+            f.close()
+        self.views, self._maps = [], []
+
+
+class FileBlacklist:
+    def __init__(self, cache_dir: str = "setting/blacklist_cache"):
+        self.cache_dir = cache_dir
+        self.patterns: List[str] = []
+        self._segments: Dict[str, _Segment] = {}
+        self._refresh_lock = threading.Lock()
+
+    def configure(self, patterns: List[str]) -> None:
+        """设置源文件（可用通配符）；下一次 refresh 时生效"""
+        self.patterns = list(patterns)
+
+    def __contains__(self, user_id: int) -> bool:
+        for segment in self._segments.values():
+            if user_id in segment:
+                return True
+        return False
+
+    def __len__(self) -> int:
+        return sum(len(s) for s in self._segments.values())
+
+    def _sources(self) -> List[str]:
+        sources = []
+        for pattern in self.patterns:
+            matched = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+            sources.extend(os.path.abspath(p) for p in matched if os.path.isfile(p))
+        return list(dict.fromkeys(sources))
+
+    def _prepare(self) -> Optional[Dict[str, _Segment]]:
+        """在线程中执行：检查源文件，重新编译有变化的文件；没有任何变化时返回 None"""
+        with self._refresh_lock:
+            sources = self._sources()
+            segments: Dict[str, _Segment] = {}
+            changed = set(self._segments) != set(sources)
+            for source in sources:
+                stat = os.stat(source)
+                current = self._segments.get(source)
+                if current is not None and (current.mtime, current.size) == (stat.st_mtime_ns, stat.st_size):
+                    segments[source] = current
+                    continue
+                changed = True
+                # 缓存文件名由源文件路径、修改时间与大小决定：重启后直接复用；旧版本仍在映射中时也不会被覆盖
+                name = hashlib.sha1(f"{source}\0{stat.st_mtime_ns}\0{stat.st_size}".encode()).hexdigest()[:16]
+                runs = _load_manifest(os.path.join(self.cache_dir, name + ".json"))
+                if runs is None:
+                    runs, count = compile_ids(source, os.path.join(self.cache_dir, name))
+                    logger.info(f"已编译黑名单文件 {source}: {count} 个 id")
+                segments[source] = _Segment(source, stat.st_mtime_ns, stat.st_size, runs).open()
+            if not changed:
+                return None
+            # 删除不再使用的缓存；仍在映射中的（Windows 下删不掉）留到下次
+            keep = {os.path.basename(run).split(".")[0] for s in segments.values() for run in s.runs}
+            for path in glob.glob(os.path.join(self.cache_dir, "*")):
+                if os.path.basename(path).split(".")[0] not in keep:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            return segments
+
+    def _swap(self, segments: Optional[Dict[str, _Segment]]) -> bool:
+        if segments is None:
+            return False
+        old, self._segments = self._segments, segments
+        for source, segment in old.items():
+            if segments.get(source) is not segment:
+                segment.close()
+        logger.info(f"文件黑名单已更新: {len(segments)} 个文件，共 {len(self)} 个 id")
+        return True
+
+    def refresh(self) -> bool:
+        return self._swap(self._prepare())
+
+    async def refresh_async(self) -> bool:
+        """在线程中检查与编译，再在事件循环上替换；查询不会看到编译到一半的数据"""
+        return self._swap(await asyncio.to_thread(self._prepare))
+
+    def stats(self) -> dict:
+        entries = len(self)
+        return {"files": len(self._segments), "entries": entries, "mapped_bytes": entries * 8}
+
+
+def _read_ids(path: str) -> Iterator[int]:
+    with open(path, "rb") as f:
+        while True:
+            lines = f.readlines(READ_SIZE)  # 按整行分批读取，每批约 READ_SIZE 字节
+            if not lines:
+                return
+            data = b"".join(lines)
+            if b"#" in data:
+                data = _COMMENT.sub(b"", data)
+            yield from map(int, _ID.findall(data))
+
+
+def compile_ids(source: str, prefix: str, run_size: int = RUN_SIZE) -> Tuple[List[str], int]:
+    """
+    把 id 文件编译成若干有序的 int64 块（prefix.N.bin），每块最多 run_size 个 id，
+    编译时内存只占一块；最后写入 prefix.json 列出全部块，之前中断的编译不会被误用。
+    """
+    os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+    runs: List[str] = []
+    count = 0
+    buffer: List[int] = []
+
+    def write_run() -> None:
+        nonlocal count
+        buffer.sort()  # 原地排序，不另建副本；块内重复的 id 不影响二分查找
+        block = array("q", buffer)
+        path = f"{prefix}.{len(runs)}.bin"
+        with open(path, "wb") as f:
+            block.tofile(f)
+        runs.append(path)
+        count += len(block)
+
+    for user_id in _read_ids(source):
+        buffer.append(user_id)
+        if len(buffer) >= run_size:
+            write_run()
+            buffer = []
+    if buffer or not runs:
+        write_run()
+    manifest = prefix + ".json"
+    with open(manifest + ".tmp", "w", encoding="utf-8") as f:
+        json.dump([os.path.basename(p) for p in runs], f)
+    os.replace(manifest + ".tmp", manifest)
+    return runs, count
+
+
+def _load_manifest(path: str) -> Optional[List[str]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            names = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    runs = [os.path.join(os.path.dirname(path), name) for name in names]
+    return runs if all(os.path.exists(p) for p in runs) else None
@@ -1,26 +1,443 @@
 import configparser
+import contextlib
+import dataclasses
+import json
 import logging
 import os
 import asyncio
 import random
-from typing import Dict, Optional, Union
-from collections import defaultdict
+import re
+import time
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional, Pattern, Tuple, Union
+from collections import OrderedDict, defaultdict, deque
 
 import telethon.events
-from telethon import TelegramClient, events
-from telethon.errors import SessionPasswordNeededError
-from telethon.tl.functions.account import UpdateProfileRequest
+from telethon import TelegramClient, events, utils
+from telethon.errors import (FloodWaitError, MessageNotModifiedError, RPCError, SessionPasswordNeededError,
+                             UnauthorizedError, UserNotParticipantError)
+from telethon.tl.functions.account import UpdateProfileRequest, UpdateStatusRequest
 from telethon.tl.functions.photos import UploadProfilePhotoRequest, DeletePhotosRequest
-from telethon.tl.functions.channels import JoinChannelRequest
-from telethon.tl.types import InputPhoto, InputChannel, PeerChat
+from telethon.tl.functions.channels import GetParticipantRequest, JoinChannelRequest
+from telethon.sessions import MemorySession
+from telethon.tl.custom import Message
+from telethon.tl.types import (InputPeerSelf, InputPhoto, InputChannel, InputMediaUploadedDocument,
+                               InputMediaUploadedPhoto, InputMessageEntityMentionName, MessageEntityMentionName,
+                               PeerChannel, PeerChat, PeerUser, ChannelParticipantsRecent)
+
+from blacklist import FileBlacklist
+from dedupe import DedupeWindow
+from text_entities import prepend, replace_with_entities
+from journal import Journal
+from monitors import EventArbiter
+from parallel_download import ParallelDownloader, media_extension, valid_part_size
+from parallel_upload import ParallelUploader
+from proxy_pool import ProxyPool, parse_proxy_url
+from rpc_cache import CachedRPC
+from rules import Condition, Rule, RuleChain, parse_rules
+from session_store import SessionDB
+from workspace import MediaWorkspace
+
+
+class MessageIndex:
+    """
+    源消息 (chat_id, msg_id) -> (目标消息 id, 发送该消息的克隆账号)
+
+    另按 msg_id 建二级索引，用于处理不带 chat_id 的删除事件（普通群组）。
+    超过 max_size 时淘汰最早写入的条目，避免长期运行内存无限增长。
+    """
+
+    def __init__(self, max_size: int = 200_000):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[int, object]]" = OrderedDict()
+        self._by_id: Dict[int, set] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Tuple[int, int]) -> bool:
+        return key in self._entries
+
+    def put(self, chat_id: int, msg_id: int, target_id: int, client) -> None:
+        key = (chat_id, msg_id)
+        self._entries[key] = (target_id, client)
+        self._entries.move_to_end(key)
+        self._by_id[msg_id].add(chat_id)
+        while len(self._entries) > self.max_size:
+            old_key, _ = self._entries.popitem(last=False)
+            self._unlink(old_key)
+
+    def get(self, chat_id: int, msg_id: int) -> Optional[int]:
+        entry = self._entries.get((chat_id, msg_id))
+        return entry[0] if entry else None
+
+    def lookup(self, chat_id: int, msg_id: int) -> Optional[Tuple[int, object]]:
+        return self._entries.get((chat_id, msg_id))
+
+    def find(self, msg_ids: Iterable[int], chat_id: Optional[int] = None) -> List[Tuple[Tuple[int, int], int, object]]:
+        """按 msg_id 查找条目；chat_id 为空时只匹配非频道会话（这类消息 id 在账号内唯一）"""
+        result = []
+        for msg_id in msg_ids:
+            if chat_id is not None:
+                chats = (chat_id,) if (chat_id, msg_id) in self._entries else ()
+            else:
+                chats = [c for c in self._by_id.get(msg_id, ()) if not _is_channel(c)]
+            for c in chats:
+                target_id, client = self._entries[(c, msg_id)]
+                result.append(((c, msg_id), target_id, client))
+        return result
+
+    def pop(self, chat_id: int, msg_id: int) -> Optional[Tuple[int, object]]:
+        key = (chat_id, msg_id)
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._unlink(key)
+        return entry
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_id.clear()
+
+    def _unlink(self, key: Tuple[int, int]) -> None:
+        chat_id, msg_id = key
+        chats = self._by_id.get(msg_id)
+        if chats is not None:
+            chats.discard(chat_id)
+            if not chats:
+                del self._by_id[msg_id]
+
+
+def _is_channel(chat_id: int) -> bool:
+    return utils.resolve_id(chat_id)[1] is PeerChannel
+
+
+class RateLimiter:
+    """令牌桶限速：rate 为每秒令牌数，burst 为桶容量；rate <= 0 表示不限速"""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= min(tokens, self.burst):
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((min(tokens, self.burst) - self._tokens) / self.rate)
+
+
+class TransferLane:
+    """一条传输通道：并发上限（0 表示不限）+ 带宽上限（字节/秒，0 表示不限）"""
+
+    def __init__(self, name: str, concurrency: int = 0, bandwidth: float = 0.0):
+        self.name = name
+        self.semaphore = asyncio.Semaphore(concurrency) if concurrency > 0 else None
+        self.limiter = RateLimiter(bandwidth, burst=bandwidth)
+        self.active = 0
+        self.waiting = 0
+        self.done = 0
+        self.bytes = 0
+
+    @contextlib.asynccontextmanager
+    async def slot(self, size: int = 0):
+        semaphore = self.semaphore
+        self.waiting += 1
+        try:
+            if semaphore is not None:
+                await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            if size:
+                await self.limiter.acquire(size)
+            yield self
+        finally:
+            self.active -= 1
+            self.done += 1
+            self.bytes += size
+            if semaphore is not None:
+                semaphore.release()
+
+
+def media_size(message) -> int:
+    """媒体大小（字节），未知时为 0"""
+    return getattr(getattr(message, 'file', None), 'size', None) or 0
+
+
+class TransferLanes:
+    """
+    按大小分道传输：文本、小媒体、大媒体各自限制并发与带宽，互不排队
+
+    大媒体通过单独的下载器（ParallelDownloader 多连接分片下载）下载，不占用监听账号接收更新的连接。
+    每个监听账号各有一个下载器（download_clients），消息只能由收到它的账号下载：
+    file_reference 与 access_hash 属于该账号，换一个账号的授权下载会失败。
+    """
+
+    def __init__(self):
+        self.large_threshold = 10 * 1024 * 1024
+        self.lanes: Dict[str, TransferLane] = {}
+        self.download_clients: Dict[TelegramClient, ParallelDownloader] = {}  # {监听账号: 大文件下载器}
+        self.configure()
+
+    def configure(self, large_threshold: int = 10 * 1024 * 1024, concurrency: Tuple[int, int, int] = (0, 8, 2),
+                  bandwidth: Tuple[float, float, float] = (0.0, 0.0, 0.0)) -> None:
+        """重新配置时换新的通道对象，进行中的传输继续使用旧通道直到结束"""
+        self.large_threshold = large_threshold
+        self.lanes = {name: TransferLane(name, limit, rate)
+                      for name, limit, rate in zip(("text", "small", "large"), concurrency, bandwidth)}
+
+    def lane_for(self, size: int) -> TransferLane:
+        return self.lanes["large" if size >= self.large_threshold else "small"]
+
+    @property
+    def text(self) -> TransferLane:
+        return self.lanes["text"]
+
+    async def download(self, monitor_client: TelegramClient, message, file: Optional[str] = None) -> Optional[str]:
+        """file 为临时目录租约分配的路径，下载结束后由租约负责删除"""
+        size = media_size(message)
+        lane = self.lane_for(size)
+        client = self.download_clients.get(monitor_client, monitor_client) if lane.name == "large" else monitor_client
+        async with lane.slot(size):
+            return await client.download_media(message, file=file)
+
+    def stats(self) -> Dict[str, Tuple[int, int, int]]:
+        """{通道: (传输中, 排队, 已完成)}"""
+        return {name: (lane.active, lane.waiting, lane.done) for name, lane in self.lanes.items()}
+
+
+class CheckpointStore:
+    """
+    每个源群组已转发到的最大消息 id，定期写入 setting/checkpoints.json
+
+    开启预写日志时每次推进也随日志组提交（与 done 记录同一批写入），启动时 merge() 取两者中较大的，
+    崩溃前最后几秒转发的消息不会因为进度文件落后而被补发第二次。
+    群组补发历史期间，实时消息在 wait_live() 处等待该群组的补发结束，
+    保证目标群组中先出现历史消息、再出现实时消息，且补发进度不会被实时消息覆盖。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data: Dict[str, int] = {}
+        self._dirty = False
+        self._backfilling: Dict[int, asyncio.Event] = {}
+        self._live_floor: Dict[int, int] = {}
+
+    def load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._data = {str(k): int(v) for k, v in json.load(f).items()}
+        except FileNotFoundError:
+            self._data = {}
+        except Exception as e:
+            logger.error(f"读取补发进度失败: {e}")
+            self._data = {}
+
+    def get(self, chat_id: int) -> Optional[int]:
+        return self._data.get(str(chat_id))
+
+    def mark(self, chat_id: int, msg_id: int) -> None:
+        key = str(chat_id)
+        if msg_id > self._data.get(key, 0):
+            self._data[key] = msg_id
+            self._dirty = True
+            if Config.JOURNAL_ENABLED:
+                journal.checkpoint(chat_id, msg_id)
+
+    def merge(self, positions: Mapping[int, int]) -> None:
+        """合并日志中记录的进度（可能比进度文件新）"""
+        for chat_id, msg_id in positions.items():
+            self.mark(chat_id, msg_id)
+
+    def begin_backfill(self, chat_id: int) -> None:
+        self._backfilling[chat_id] = asyncio.Event()
+
+    def end_backfill(self, chat_id: int) -> None:
+        done = self._backfilling.pop(chat_id, None)
+        if done:
+            done.set()
+
+    def is_backfilling(self, chat_id: int) -> bool:
+        return chat_id in self._backfilling
+
+    async def wait_live(self, chat_id: int, msg_id: int) -> None:
+        """实时消息到达：记录该群组最早的实时消息 id（补发的上界），补发中则等待其结束"""
+        done = self._backfilling.get(chat_id)
+        if done is None:
+            return
+        floor = self._live_floor.get(chat_id)
+        if floor is None or msg_id < floor:
+            self._live_floor[chat_id] = msg_id
+        await done.wait()
+
+    def live_floor(self, chat_id: int) -> Optional[int]:
+        return self._live_floor.get(chat_id)
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        _write_json(self.path, self._data)
+        self._dirty = False
+
+    async def autosave(self, interval: float = 5.0) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.save()
+            except Exception as e:
+                logger.error(f"保存补发进度失败: {e}")
+
+
+def profile_fingerprint(user) -> str:
+    """昵称 + 头像 id，用于判断发送者资料是否变化"""
+    photo_id = getattr(getattr(user, 'photo', None), 'photo_id', None)
+    return f"{user.first_name or ''}\x1f{user.last_name or ''}\x1f{photo_id or ''}"
+
+
+class AssignmentStore:
+    """克隆账号（session 名）-> 绑定的发送者 id 与其资料指纹，保存在 setting/assignments.json"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data: Dict[str, dict] = {}
+
+    def load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._data = json.load(f)
+        except FileNotFoundError:
+            self._data = {}
+        except Exception as e:
+            logger.error(f"读取账号绑定记录失败: {e}")
+            self._data = {}
+
+    def sender_for(self, name: Optional[str]) -> Optional[int]:
+        entry = self._data.get(name) if name else None
+        return entry["sender_id"] if entry else None
+
+    def fingerprint_for(self, name: Optional[str]) -> Optional[str]:
+        entry = self._data.get(name) if name else None
+        return entry["fingerprint"] if entry else None
+
+    def bind(self, name: Optional[str], sender_id: int, fingerprint: str) -> None:
+        if not name:
+            return
+        self._data[name] = {"sender_id": sender_id, "fingerprint": fingerprint}
+        self.save()
+
+    def release(self, name: Optional[str]) -> None:
+        if name and self._data.pop(name, None) is not None:
+            self.save()
+
+    def invalidate(self, name: Optional[str]) -> None:
+        """保留绑定但清掉资料指纹：该发送者的下一条消息会重新同步昵称与头像"""
+        entry = self._data.get(name) if name else None
+        if entry is not None and entry["fingerprint"] is not None:
+            entry["fingerprint"] = None
+            self.save()
+
+    def save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            _write_json(self.path, self._data)
+        except Exception as e:
+            logger.error(f"保存账号绑定记录失败: {e}")
+
+
+class MemberDirectory:
+    """
+    源群组成员目录：{chat_id: {user_id: [access_hash, 资料指纹]}}，保存在 setting/members.json
+
+    启动监听时按页拉取成员列表预热实体缓存；已知成员发第一条消息时不再需要解析实体。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._chats: Dict[str, Dict[str, list]] = {}
+        self._known: set = set()
+        self._dirty = False
+
+    def load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._chats = json.load(f)
+        except FileNotFoundError:
+            self._chats = {}
+        except Exception as e:
+            logger.error(f"读取成员目录失败: {e}")
+            self._chats = {}
+        self._known = {int(uid) for members_ in self._chats.values() for uid in members_}
+
+    def count(self, chat_id: int) -> int:
+        return len(self._chats.get(str(chat_id), ()))
+
+    def knows(self, user_id: int) -> bool:
+        return user_id in self._known
+
+    def update(self, chat_id: int, user) -> bool:
+        """记录成员，返回是否为新成员或资料有变化"""
+        entry = [getattr(user, 'access_hash', None) or 0, profile_fingerprint(user)]
+        members_ = self._chats.setdefault(str(chat_id), {})
+        if members_.get(str(user.id)) == entry:
+            return False
+        members_[str(user.id)] = entry
+        self._known.add(user.id)
+        self._dirty = True
+        return True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        try:
+            _write_json(self.path, self._chats)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"保存成员目录失败: {e}")
+
 
 # 全局变量
 clients_pool = {}  # {client: cloned_user_id or None}
 client_locks = {}  # {client: asyncio.Lock}
 sender_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
-message_id_mapping = {}
+message_id_mapping = MessageIndex()  # (源 chat_id, 源 msg_id) -> (目标 msg_id, 克隆账号)
 cloned_users = set()
 frozen_clients = set()  # 冻结账号集合
+account_health: Dict[object, Tuple[str, float]] = {}  # {client: (健康状态, 检查时间)}，由 health_sweep 更新
+HEALTH_LABELS = {"ok": "正常", "restricted": "受限", "frozen": "冻结", "unauthorized": "已失效"}
+client_names = {}  # {client: session 名}
+client_last_active: Dict[object, float] = {}  # {client: 最近一次转发的时间戳}
+client_last_used: Dict[object, float] = {}  # {client: 最近一次使用连接的时间戳}
+client_last_sent: Dict[object, float] = {}  # {client: 最近一次成功发出消息的时间戳}，没发过的账号没有记录
+proxy_pool = ProxyPool()  # 克隆账号使用的代理池
+session_db = SessionDB("setting/sessions.db")  # 全部克隆账号的 session
+transfer_lanes = TransferLanes()  # 文本 / 小媒体 / 大媒体分道传输
+uploader = ParallelUploader()  # 克隆账号发送媒体、设置头像时的并行分片上传
+dedupe = DedupeWindow()  # 跨源群组的重复内容去重窗口
+dedupe_inflight: Dict[bytes, asyncio.Future] = {}  # 正在转发的内容指纹 -> 转发结束时完成
+background_tasks: set = set()  # spawn() 启动、不等待结果的任务，结束前保留引用
+unresolved_mentions: Dict[object, set] = defaultdict(set)  # {client: 该账号无法解析的被提及用户 id}
+file_blacklist = FileBlacklist("setting/blacklist_cache")  # 外部 id 文件黑名单（mmap 有序数组）
+workspace = MediaWorkspace("media_tmp")  # 下载媒体与头像的临时目录（唯一文件名、磁盘预算、定时清理）
+monitor_events = EventArbiter()  # 多个监听账号的事件去重（最先到达的处理）与延迟统计
+monitor_clients: Dict[str, TelegramClient] = {}  # 正在监听的账号 {session 名: client}
+journal = Journal("setting/journal.log")  # 已接收未发送消息的预写日志，重启后重新转发
+recycle_times: deque = deque()  # 最近一小时内的账号回收时间
+pool_stats = {"recycled": 0, "removed": 0}  # 账号池累计统计
+reference_stats = {"hits": 0, "refreshed": 0, "fallbacks": 0}  # 按引用重发媒体的累计统计（条）
+assignments = AssignmentStore("setting/assignments.json")  # 克隆账号与发送者的绑定，重启后恢复
+checkpoints = CheckpointStore("setting/checkpoints.json")  # 源群组转发进度
+members = MemberDirectory("setting/members.json")  # 源群组成员（实体缓存预热）
+rpc_cache = CachedRPC()  # 监听/克隆账号的只读 RPC 去重与短期缓存
 
 logging.getLogger('telethon').setLevel(logging.WARNING)
 logging.basicConfig(
@@ -35,102 +452,542 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+@dataclasses.dataclass(frozen=True)
+class ConfigSnapshot:
+    """
+    一次配置加载的不可变快照（黑名单、关键词、替换词、目标群组等）
+
+    解析与编译在热路径之外完成，处理一条消息时只读取同一个快照，
+    重新加载配置时整体替换 Config.SNAPSHOT，不会出现新旧混合的状态。
+    """
+    version: int = 0
+    target_group: Optional[str] = None
+    send_delay: Tuple[float, float] = (1.0, 5.5)
+    unmapped_reply: str = "skip"  # 被回复消息没有映射时: skip 跳过 / plain 普通消息 / quote 带引用发送
+    album_window: float = 0.8  # 相册聚合窗口（秒）
+    black_list: FrozenSet[int] = frozenset()
+    key_words: FrozenSet[str] = frozenset()
+    replacements: Mapping[str, str] = dataclasses.field(default_factory=lambda: MappingProxyType({}))
+    keyword_pattern: Optional[Pattern] = None
+    replacement_pattern: Optional[Pattern] = None
+    rules: RuleChain = dataclasses.field(default_factory=RuleChain)  # [rules] 段与内置过滤编译成的规则链
+
+    @classmethod
+    def build(cls, target_group: Optional[str], send_delay: Tuple[float, float], black_list: FrozenSet[int],
+              key_words: FrozenSet[str], replacements: Dict[str, str],
+              unmapped_reply: str = "skip", album_window: float = 0.8,
+              rules: Iterable[Rule] = ()) -> "ConfigSnapshot":
+        # 关键词与替换词各编译成一个正则，长词优先，一次扫描完成匹配/替换
+        keyword_pattern = None
+        if key_words:
+            keyword_pattern = re.compile("|".join(map(re.escape, sorted(key_words, key=len, reverse=True))))
+        replacements = {k: v for k, v in replacements.items() if k}
+        replacement_pattern = None
+        if replacements:
+            replacement_pattern = re.compile(
+                "|".join(map(re.escape, sorted(replacements, key=len, reverse=True))))
+        return cls(
+            target_group=target_group,
+            send_delay=send_delay,
+            unmapped_reply=unmapped_reply,
+            album_window=album_window,
+            black_list=frozenset(black_list),
+            key_words=frozenset(key_words),
+            replacements=MappingProxyType(dict(replacements)),
+            keyword_pattern=keyword_pattern,
+            replacement_pattern=replacement_pattern,
+            rules=RuleChain(list(rules) + builtin_rules(frozenset(black_list), keyword_pattern)),
+        )
+
+    def is_blacklisted(self, user_id: int) -> bool:
+        return user_id in self.black_list
+
+    def replace(self, text: str) -> str:
+        if not text or self.replacement_pattern is None:
+            return text
+        replacements = self.replacements
+        return self.replacement_pattern.sub(lambda m: replacements[m.group(0)], text)
+
+    def replace_entities(self, text: str, entities) -> Tuple[str, list]:
+        """在原始文本上替换，同时调整格式实体的偏移（UTF-16）"""
+        if not text or self.replacement_pattern is None:
+            return text, list(entities or [])
+        replacements = self.replacements
+        return replace_with_entities(self.replacement_pattern, lambda m: replacements[m.group(0)], text, entities)
+
+
 class Config:
     PROXY = None
     SOURCE_GROUPS = []
+    MONITOR_SESSIONS = ["monitor"]  # 监听账号的 session 名，多个账号同时监听同一批源群组
+    MONITOR_EVENT_WINDOW = 10_000  # 多个监听账号间去重时记住的最近事件数
     TARGET_GROUP: Union[PeerChat, InputChannel]
-    BLACK_LIST = set()
-    KEY_WORDS = set()
-    REPLACEMENTS = {}
+    BLACK_LIST: FrozenSet[int] = frozenset()
+    BLACKLIST_FILES: List[str] = []  # 外部黑名单 id 文件（可用通配符）
+    KEY_WORDS: FrozenSet[str] = frozenset()
+    REPLACEMENTS: Dict[str, str] = {}
     API_ID = None
     API_HASH = None
+    SEND_DELAY = (1.0, 5.5)  # 已克隆用户转发前的随机延迟（秒）
+    BACKFILL_ENABLED = False  # 启动监听时先补发历史/停机期间的消息
+    BACKFILL_RATE = 1.0  # 补发速率（条/秒）
+    BACKFILL_HISTORY_LIMIT = 0  # 没有进度记录的源群组最多补发的历史消息数
+    LANE_LARGE_THRESHOLD = 10 * 1024 * 1024  # 达到该大小（字节）的媒体走大文件通道
+    LANE_CONCURRENCY = (0, 8, 2)  # 文本 / 小媒体 / 大媒体通道的并发上限，0 表示不限
+    LANE_BANDWIDTH = (0.0, 0.0, 0.0)  # 各通道的下载带宽上限（字节/秒），0 表示不限
+    DOWNLOAD_CONNECTIONS = 4  # 大文件并行下载的连接数
+    DOWNLOAD_PART_SIZE = 512 * 1024  # 大文件并行下载的分片大小（字节）
+    UPLOAD_PART_SIZE = 512 * 1024  # 并行上传的分片大小（字节）
+    UPLOAD_WINDOW = 8  # 每个文件同时在途的上传分片数
+    UPLOAD_CONNECTIONS = 1  # 每个克隆账号用于上传的连接数，1 表示只用账号自己的连接
+    REFERENCE_SEND = True  # 媒体先尝试按原文件引用重发，不下载也不上传
+    WORKSPACE_DIR = "media_tmp"  # 临时媒体目录，可指向 tmpfs
+    WORKSPACE_BUDGET = 2 * 1024 * 1024 * 1024  # 临时媒体占用的磁盘上限（字节），0 表示不限
+    WORKSPACE_JANITOR_INTERVAL = 600.0  # 清理残留临时文件的间隔（秒）
+    DEDUPE_ENABLED = True  # 窗口内相同内容（文本 + 媒体）只转发第一条
+    DEDUPE_WINDOW = 600.0  # 去重窗口（秒）
+    DEDUPE_MIN_LENGTH = 10  # 文字短于该长度时不去重（包括没有说明的媒体）
+    DEDUPE_MAX_ENTRIES = 100_000  # 窗口内最多记录的指纹数
+    DEDUPE_BLOOM = False  # 使用 Bloom 过滤器（内存固定，有少量误判）
+    DEDUPE_ERROR_RATE = 0.001  # Bloom 过滤器的误判率
+    DEDUPE_MEDIA_ONLY = False  # 没有说明的媒体也按媒体 id 去重（贴纸/GIF 除外）
+    JOURNAL_ENABLED = True  # 记录已接收未完成的消息，崩溃或关闭后下次启动时重新转发
+    JOURNAL_INTERVAL = 0.05  # 组提交间隔（秒）
+    JOURNAL_FSYNC = True  # 每次提交后 fsync
+    JOURNAL_MAX_REPLAYS = 3  # 未完成的消息在重启后最多重新转发几次，仍失败则放弃；0 表示不限
+    WARMUP_ENABLED = True  # 启动监听时拉取源群组成员列表，预热实体缓存
+    WARMUP_REFRESH = 3600.0  # 成员列表增量刷新间隔（秒），0 表示只在启动时拉取
+    WARMUP_RATE = 2.0  # 拉取成员列表的速率（页/秒，每页 200 人）
+    RECYCLE_ENABLED = True  # 账号用完时回收最久未活跃的账号
+    RECYCLE_MIN_IDLE = 600.0  # 可被回收的最短空闲时间（秒）
+    PROXY_POOL = []  # 克隆账号使用的代理列表，为空时使用 PROXY
+    PROXY_PER_LIMIT = 0  # 每个代理最多分配的账号数，0 表示不限
+    IDLE_DISCONNECT = 300.0  # 克隆账号闲置多少秒后断开连接，0 表示保持常连
+    HEALTH_ENABLED = True  # 后台轮流探测克隆账号，提前移除冻结/失效账号
+    HEALTH_INTERVAL = 1800.0  # 每个账号的探测周期（秒），探测均匀分散在周期内
+    JOIN_CONCURRENCY = 5  # 批量加入目标群组的并发账号数
+    JOIN_RATE = 1.0  # 批量加入目标群组的全局速率（次/秒）
+    SNAPSHOT = ConfigSnapshot()  # 当前生效的配置快照，只整体替换不原地修改
+
+async def get_me_cached(client: TelegramClient):
+    """账号自身信息：同一账号的并发调用合并为一次请求，结果缓存一小时"""
+    async def fetch():
+        await ensure_connected(client)
+        return await client.get_me()
+
+    return await rpc_cache.call(("get_me", client), fetch, ttl=3600)
+
+
+def cached_me(client: TelegramClient):
+    """只读取缓存中的账号信息，不发请求也不连接（没有缓存时返回 None）"""
+    return rpc_cache.peek(("get_me", client))
+
+
+async def ensure_connected(client: TelegramClient) -> None:
+    """按需连接：闲置断开的账号在下次使用时重连（所在代理不可用时先换代理），并记录使用时间"""
+    client_last_used[client] = time.time()
+    if client.is_connected():
+        return
+    name = client_names.get(client)
+    if name is not None and not proxy_pool.is_healthy(name):
+        client.set_proxy(proxy_pool.assign(name))
+    await rpc_cache.flight.do(("connect", client), client.connect)
+
+
+async def disconnect_idle_clients(interval: float = 30.0) -> None:
+    """断开超过 IDLE_DISCONNECT 秒未使用的克隆账号连接，冷账号不占用代理和套接字"""
+    while True:
+        await asyncio.sleep(interval)
+        if Config.IDLE_DISCONNECT <= 0:
+            continue
+        for client in list(clients_pool):
+            lock = client_locks.get(client)
+            if lock is None or lock.locked() or not is_idle(client):
+                continue
+            # 持有账号锁断开：转发不会在断开期间拿到锁、通过 ensure_connected 后连接被断开；拿到锁后重新判断
+            async with lock:
+                if client not in clients_pool or not is_idle(client):
+                    continue
+                try:
+                    await uploader.release(client)
+                    await client.disconnect()
+                except Exception as e:
+                    logger.warning(f"断开闲置账号失败: {e}")
+
+
+def is_idle(client: TelegramClient) -> bool:
+    return (client.is_connected()
+            and time.time() - client_last_used.get(client, 0.0) >= Config.IDLE_DISCONNECT)
+
+
+async def resolve_input_entity(client: TelegramClient, peer):
+    return await rpc_cache.call(("input_entity", client, peer), lambda: client.get_input_entity(peer))
+
+
+async def get_profile_photos_cached(client: TelegramClient, user) -> list:
+    """发送者最新头像；缓存键包含头像 id，换头像后自然失效"""
+    photo_id = getattr(getattr(user, 'photo', None), 'photo_id', None)
+    return await rpc_cache.call(("profile_photos", client, user.id, photo_id),
+                                lambda: client.get_profile_photos(user, limit=1))
+
+
+def register_client(client: TelegramClient, name: str) -> None:
+    """加入克隆账号池，并恢复上次运行时该账号绑定的发送者"""
+    sender_id = assignments.sender_for(name)
+    clients_pool[client] = sender_id
+    client_locks[client] = asyncio.Lock()
+    client_names[client] = name
+    client_last_active[client] = time.time()
+    if sender_id:
+        cloned_users.add(sender_id)
+
 
 async def load_existing_sessions(choice: str) -> None:
-    for filename in os.listdir('sessions'):
-        if filename.endswith('.session'):
-            session_name = filename.replace('.session', '')
-            logger.info(f"正在加载 session: {session_name}")
-            client = TelegramClient(f"sessions/{session_name}", Config.API_ID, Config.API_HASH, proxy=Config.PROXY)
-            await client.connect()
-            if await client.is_user_authorized():
-                logger.info(f"加载成功 session: {session_name}")
-                if choice == '3':
-                    await delete_profile_photos(client)
-                elif choice == '4':
-                    await check_and_join_target(client)
-                clients_pool[client] = None
-                client_locks[client] = asyncio.Lock()
-            else:
+    assignments.load()
+    # 一次读库得到全部 session（首次运行时导入 sessions/ 下的 .session 文件）
+    sessions = await asyncio.to_thread(session_db.load, "sessions")
+    for session_name in sorted(sessions):
+        logger.info(f"正在加载 session: {session_name}")
+        proxy = proxy_pool.assign(session_name)
+        client = TelegramClient(sessions[session_name], Config.API_ID, Config.API_HASH, proxy=proxy)
+        if choice == '2' and Config.IDLE_DISCONNECT > 0:
+            # 懒连接：只确认 session 中有授权密钥，第一次使用时再连接
+            if client.session.auth_key is None:
                 logger.warning(f"未授权 session: {session_name}")
-                await client.disconnect()
+                proxy_pool.release(session_name)
+                continue
+            register_client(client, session_name)
+            logger.info(f"加载成功 session: {session_name}（按需连接）")
+            continue
+        await client.connect()
+        client_last_used[client] = time.time()
+        if await client.is_user_authorized():
+            logger.info(f"加载成功 session: {session_name}")
+            if choice == '3':
+                await delete_profile_photos(client, session_name)
+            register_client(client, session_name)
+        else:
+            logger.warning(f"未授权 session: {session_name}")
+            proxy_pool.release(session_name)
+            await client.disconnect()
+    if choice == '4':
+        await bulk_join_target(list(clients_pool))
 
 
-def load_config() -> None:
-    config_path = "setting/config.ini"
-    default_content = """[telegram]
+CONFIG_PATH = "setting/config.ini"
+JOIN_JOB_PATH = "setting/join_job.json"
+DEFAULT_CONFIG = """[telegram]
 api_id = 3642180
 api_hash = 636c15dbfe0b01f6fab88600d62667d0
 source_group = https://t.me/amlhcgj
 target_group = https://t.me/amlhcgj
 
+[monitor]
+sessions = monitor
+event_window = 10000
+
 [proxy]
 is_enabled = false
 host = 127.0.0.1
 port = 7890
 type = socks5
+pool =
+per_proxy_limit = 0
+
+[forward]
+delay_min = 1
+delay_max = 5.5
+unmapped_reply = skip
+album_window = 0.8
+by_reference = true
+
+[pool]
+recycle = true
+min_idle = 600
+idle_disconnect = 300
+
+[health]
+is_enabled = true
+interval = 1800
+
+[join]
+concurrency = 5
+rate = 1
+
+[backfill]
+is_enabled = false
+rate = 1
+history_limit = 0
+
+[lanes]
+large_threshold = 10
+text_concurrency = 0
+small_concurrency = 8
+large_concurrency = 2
+small_bandwidth = 0
+large_bandwidth = 0
+download_connections = 4
+part_size = 512
+upload_part_size = 512
+upload_window = 8
+upload_connections = 1
+
+[workspace]
+directory = media_tmp
+budget = 2048
+janitor_interval = 600
+
+[dedupe]
+is_enabled = true
+window = 600
+min_length = 10
+max_entries = 100000
+bloom = false
+error_rate = 0.001
+media_only = false
+
+[journal]
+is_enabled = true
+commit_interval = 50
+fsync = true
+max_replays = 3
+
+[warmup]
+is_enabled = true
+refresh_interval = 3600
+rate = 2
 
 [blacklist]
 user_ids = 123,12345
 keywords = 广告，推广
+files =
 
 [replacements]
 a = b
 你好 = 我好
+
+[rules]
 """
+UNMAPPED_REPLY_MODES = ("skip", "plain", "quote")
+_config_mtime: Optional[int] = None  # 最近一次加载的 config.ini 修改时间
 
-    os.makedirs("setting", exist_ok=True)
-    os.makedirs('sessions', exist_ok=True)
-    if not os.path.exists(config_path):
-        with open(config_path, "w", encoding="utf-8") as f:
-            f.write(default_content)
-            logger.info(f"已初始化配置文件: {config_path}")
 
+def _split_list(raw: str) -> list:
+    return [item.strip() for item in re.split(r"[,，]", raw or "") if item.strip()]
+
+
+def _parse_config(path: str) -> Dict[str, object]:
+    """解析并校验配置文件，返回 Config 属性 -> 新值，同时编译好 SNAPSHOT；不修改全局状态"""
     config = configparser.ConfigParser()
-    try:
-        config.read(config_path, encoding="utf-8-sig")
+    if not config.read(path, encoding="utf-8-sig"):
+        raise FileNotFoundError(path)
+
+    values: Dict[str, object] = {
+        "API_HASH": config.get("telegram", "api_hash"),
+        "API_ID": config.getint("telegram", "api_id"),
+        "SOURCE_GROUPS": _split_list(config.get("telegram", "source_group")),
+        "TARGET_GROUP": config.get("telegram", "target_group").strip(),
+        "PROXY": None,
+    }
+    if not values["TARGET_GROUP"]:
+        raise ValueError("target_group 不能为空")
+
+    # 监听账号（新增或移除账号需重新开始监听）
+    values["MONITOR_SESSIONS"] = list(dict.fromkeys(
+        _split_list(config.get("monitor", "sessions", fallback="monitor")))) or ["monitor"]
+    values["MONITOR_EVENT_WINDOW"] = max(100, config.getint("monitor", "event_window", fallback=10_000))
+
+    if config.getboolean("proxy", "is_enabled", fallback=False):
+        host = config.get("proxy", "host")
+        port = config.getint("proxy", "port")
+        proxy_type = config.get("proxy", "type")
+        values["PROXY"] = (proxy_type, host, port)
+
+    # 代理池: 逗号分隔的 type://[user:pass@]host:port，未配置时所有账号共用上面的代理
+    proxies = [parse_proxy_url(url) for url in _split_list(config.get("proxy", "pool", fallback=""))]
+    values["PROXY_POOL"] = proxies or ([values["PROXY"]] if values["PROXY"] else [])
+    values["PROXY_PER_LIMIT"] = config.getint("proxy", "per_proxy_limit", fallback=0)
+
+    # 转发延迟
+    send_delay = (config.getfloat("forward", "delay_min", fallback=1.0),
+                  config.getfloat("forward", "delay_max", fallback=5.5))
+    if not 0 <= send_delay[0] <= send_delay[1]:
+        raise ValueError(f"转发延迟配置无效: {send_delay}")
+    values["SEND_DELAY"] = send_delay
+    unmapped_reply = config.get("forward", "unmapped_reply", fallback="skip").strip().lower()
+    if unmapped_reply not in UNMAPPED_REPLY_MODES:
+        raise ValueError(f"unmapped_reply 只能是 {'/'.join(UNMAPPED_REPLY_MODES)}: {unmapped_reply}")
+    album_window = config.getfloat("forward", "album_window", fallback=0.8)
+    if album_window < 0:
+        raise ValueError(f"album_window 不能为负数: {album_window}")
+    values["REFERENCE_SEND"] = config.getboolean("forward", "by_reference", fallback=True)
+
+    # 账号回收
+    values["RECYCLE_ENABLED"] = config.getboolean("pool", "recycle", fallback=True)
+    values["RECYCLE_MIN_IDLE"] = config.getfloat("pool", "min_idle", fallback=600.0)
+    values["IDLE_DISCONNECT"] = config.getfloat("pool", "idle_disconnect", fallback=300.0)
+
+    # 账号健康检查
+    values["HEALTH_ENABLED"] = config.getboolean("health", "is_enabled", fallback=True)
+    values["HEALTH_INTERVAL"] = config.getfloat("health", "interval", fallback=1800.0)
+    if values["HEALTH_INTERVAL"] <= 0:
+        raise ValueError("health interval 必须大于 0")
 
-        Config.API_HASH = config.get("telegram", "api_hash")
-        Config.API_ID = config.getint("telegram", "api_id")
+    # 批量加群
+    values["JOIN_CONCURRENCY"] = config.getint("join", "concurrency", fallback=5)
+    values["JOIN_RATE"] = config.getfloat("join", "rate", fallback=1.0)
 
-        raw_source_gps = config.get("telegram", "source_group")
-        Config.SOURCE_GROUPS = [source_gp for source_gp in raw_source_gps.split(",") if source_gp.strip()]
-        Config.TARGET_GROUP = config.get("telegram", "target_group")
+    # 历史补发
+    values["BACKFILL_ENABLED"] = config.getboolean("backfill", "is_enabled", fallback=False)
+    values["BACKFILL_RATE"] = config.getfloat("backfill", "rate", fallback=1.0)
+    values["BACKFILL_HISTORY_LIMIT"] = config.getint("backfill", "history_limit", fallback=0)
+    if values["BACKFILL_HISTORY_LIMIT"] < 0:
+        raise ValueError("history_limit 不能为负数")
 
-        if config.getboolean("proxy", "is_enabled"):
-            host = config.get("proxy", "host")
-            port = config.getint("proxy", "port")
-            proxy_type = config.get("proxy", "type")
-            Config.PROXY = (proxy_type, host, port)
+    # 分道传输（阈值单位 MB，带宽单位 KB/s）
+    values["LANE_LARGE_THRESHOLD"] = int(config.getfloat("lanes", "large_threshold", fallback=10.0) * 1024 * 1024)
+    values["LANE_CONCURRENCY"] = tuple(config.getint("lanes", f"{lane}_concurrency", fallback=default)
+                                       for lane, default in (("text", 0), ("small", 8), ("large", 2)))
+    values["LANE_BANDWIDTH"] = (0.0,) + tuple(config.getfloat("lanes", f"{lane}_bandwidth", fallback=0.0) * 1024
+                                              for lane in ("small", "large"))
 
-        # 黑名单
-        blacklist_str = config.get("blacklist", "user_ids", fallback="")
-        keywords_str = config.get("blacklist", "keywords", fallback="")
-        Config.BLACK_LIST.update(int(uid) for uid in blacklist_str.split(",") if uid.strip().isdigit())
-        Config.KEY_WORDS.update(keyword.strip() for keyword in keywords_str.split(",") if keyword.strip())
+    values["DOWNLOAD_CONNECTIONS"] = max(1, config.getint("lanes", "download_connections", fallback=4))
+    values["DOWNLOAD_PART_SIZE"] = valid_part_size(config.getint("lanes", "part_size", fallback=512) * 1024)
+    values["UPLOAD_PART_SIZE"] = config.getint("lanes", "upload_part_size", fallback=512) * 1024
+    values["UPLOAD_WINDOW"] = max(1, config.getint("lanes", "upload_window", fallback=8))
+    values["UPLOAD_CONNECTIONS"] = max(1, config.getint("lanes", "upload_connections", fallback=1))
 
-        # 替换词
-        if config.has_section("replacements"):
-            Config.REPLACEMENTS.update(dict(config.items("replacements")))
+    # 临时媒体目录（预算单位 MB）
+    values["WORKSPACE_DIR"] = config.get("workspace", "directory", fallback="media_tmp").strip() or "media_tmp"
+    values["WORKSPACE_BUDGET"] = int(config.getfloat("workspace", "budget", fallback=2048.0) * 1024 * 1024)
+    values["WORKSPACE_JANITOR_INTERVAL"] = config.getfloat("workspace", "janitor_interval", fallback=600.0)
+    if values["WORKSPACE_BUDGET"] < 0 or values["WORKSPACE_JANITOR_INTERVAL"] <= 0:
+        raise ValueError("workspace 的 budget 不能为负数，janitor_interval 必须大于 0")
+
+    # 内容去重
+    values["DEDUPE_ENABLED"] = config.getboolean("dedupe", "is_enabled", fallback=True)
+    values["DEDUPE_WINDOW"] = config.getfloat("dedupe", "window", fallback=600.0)
+    values["DEDUPE_MIN_LENGTH"] = config.getint("dedupe", "min_length", fallback=10)
+    values["DEDUPE_MAX_ENTRIES"] = config.getint("dedupe", "max_entries", fallback=100_000)
+    values["DEDUPE_BLOOM"] = config.getboolean("dedupe", "bloom", fallback=False)
+    values["DEDUPE_ERROR_RATE"] = config.getfloat("dedupe", "error_rate", fallback=0.001)
+    values["DEDUPE_MEDIA_ONLY"] = config.getboolean("dedupe", "media_only", fallback=False)
+    if values["DEDUPE_WINDOW"] <= 0 or values["DEDUPE_MAX_ENTRIES"] <= 0:
+        raise ValueError("去重窗口与 max_entries 必须大于 0")
+    if not 0 < values["DEDUPE_ERROR_RATE"] < 1:
+        raise ValueError(f"error_rate 应在 0 与 1 之间: {values['DEDUPE_ERROR_RATE']}")
+
+    # 预写日志（提交间隔单位毫秒）
+    values["JOURNAL_ENABLED"] = config.getboolean("journal", "is_enabled", fallback=True)
+    values["JOURNAL_INTERVAL"] = max(0.0, config.getfloat("journal", "commit_interval", fallback=50.0) / 1000)
+    values["JOURNAL_FSYNC"] = config.getboolean("journal", "fsync", fallback=True)
+    values["JOURNAL_MAX_REPLAYS"] = config.getint("journal", "max_replays", fallback=3)
+    if values["JOURNAL_MAX_REPLAYS"] < 0:
+        raise ValueError(f"max_replays 不能为负数: {values['JOURNAL_MAX_REPLAYS']}")
+
+    # 成员列表预热
+    values["WARMUP_ENABLED"] = config.getboolean("warmup", "is_enabled", fallback=True)
+    values["WARMUP_REFRESH"] = config.getfloat("warmup", "refresh_interval", fallback=3600.0)
+    values["WARMUP_RATE"] = config.getfloat("warmup", "rate", fallback=2.0)
+
+    # 黑名单
+    values["BLACK_LIST"] = frozenset(
+        int(uid) for uid in _split_list(config.get("blacklist", "user_ids", fallback="")) if uid.isdigit())
+    values["KEY_WORDS"] = frozenset(_split_list(config.get("blacklist", "keywords", fallback="")))
+    values["BLACKLIST_FILES"] = _split_list(config.get("blacklist", "files", fallback=""))
+
+    # 替换词
+    values["REPLACEMENTS"] = dict(config.items("replacements")) if config.has_section("replacements") else {}
+
+    # 过滤规则（按声明顺序，第一条命中的规则生效）
+    rules = parse_rules(config.items("rules", raw=True)) if config.has_section("rules") else []
+
+    values["SNAPSHOT"] = ConfigSnapshot.build(
+        target_group=values["TARGET_GROUP"],
+        send_delay=send_delay,
+        black_list=values["BLACK_LIST"],
+        key_words=values["KEY_WORDS"],
+        replacements=values["REPLACEMENTS"],
+        unmapped_reply=unmapped_reply,
+        album_window=album_window,
+        rules=rules,
+    )
+    return values
+
+
+def _apply_config(values: Dict[str, object], mtime: Optional[int]) -> None:
+    """整体替换 Config 属性；中间没有 await，协程不会看到新旧混合的配置"""
+    global _config_mtime
+    old_sources = Config.SOURCE_GROUPS
+    values["SNAPSHOT"] = dataclasses.replace(values["SNAPSHOT"], version=Config.SNAPSHOT.version + 1)
+    values["SNAPSHOT"].rules.adopt(Config.SNAPSHOT.rules)
+    for name, value in values.items():
+        setattr(Config, name, value)
+    proxy_pool.configure(Config.PROXY_POOL, Config.PROXY_PER_LIMIT)
+    transfer_lanes.configure(Config.LANE_LARGE_THRESHOLD, Config.LANE_CONCURRENCY, Config.LANE_BANDWIDTH)
+    uploader.configure(Config.UPLOAD_PART_SIZE, Config.UPLOAD_WINDOW, Config.UPLOAD_CONNECTIONS)
+    workspace.configure(Config.WORKSPACE_DIR, Config.WORKSPACE_BUDGET)
+    monitor_events.window = Config.MONITOR_EVENT_WINDOW
+    dedupe.configure(Config.DEDUPE_WINDOW, Config.DEDUPE_MAX_ENTRIES, Config.DEDUPE_MIN_LENGTH,
+                     Config.DEDUPE_BLOOM, Config.DEDUPE_ERROR_RATE, Config.DEDUPE_MEDIA_ONLY)
+    journal.interval, journal.fsync = Config.JOURNAL_INTERVAL, Config.JOURNAL_FSYNC
+    file_blacklist.configure(Config.BLACKLIST_FILES)
+    _config_mtime = mtime
+    if Config.SNAPSHOT.version > 1 and old_sources != Config.SOURCE_GROUPS:
+        logger.warning("源群组已变更，需要重新开始监听才能生效")
+
+
+def load_config() -> None:
+    os.makedirs("setting", exist_ok=True)
+    os.makedirs('sessions', exist_ok=True)
+    if not os.path.exists(CONFIG_PATH):
+        with open(CONFIG_PATH, "w", encoding="utf-8") as f:
+            f.write(DEFAULT_CONFIG)
+            logger.info(f"已初始化配置文件: {CONFIG_PATH}")
 
-        logger.info(f"成功加载配置文件: {config_path}")
+    try:
+        mtime = os.stat(CONFIG_PATH).st_mtime_ns
+        _apply_config(_parse_config(CONFIG_PATH), mtime)
+        logger.info(f"成功加载配置文件: {CONFIG_PATH}")
     except Exception as e:
         logger.error(f"配置加载失败: {e}")
 
 
-async def delete_profile_photos(client: TelegramClient) -> None:
+async def watch_config(interval: float = 2.0) -> None:
+    """轮询 config.ini 的修改时间，变化后在线程中解析编译，再原子替换到 Config"""
+    global _config_mtime
+    while True:
+        await asyncio.sleep(interval)
+        # 黑名单文件的变化单独检查，只重新编译变化的文件
+        try:
+            await file_blacklist.refresh_async()
+        except Exception as e:
+            logger.error(f"更新文件黑名单失败: {e}")
+        try:
+            mtime = os.stat(CONFIG_PATH).st_mtime_ns
+        except OSError:
+            continue
+        if mtime == _config_mtime:
+            continue
+        try:
+            values = await asyncio.to_thread(_parse_config, CONFIG_PATH)
+        except Exception as e:
+            _config_mtime = mtime
+            logger.error(f"配置热加载失败，继续使用旧配置: {e}")
+            continue
+        _apply_config(values, mtime)
+        logger.info(f"配置已热加载 (版本 {Config.SNAPSHOT.version})")
+
+
+async def delete_profile_photos(client: TelegramClient, name: Optional[str] = None) -> None:
+    """清空账号头像；账号已绑定发送者时作废保存的资料指纹，下次转发时重新设置头像"""
     try:
-        me = await client.get_me()
+        await ensure_connected(client)
+        me = await get_me_cached(client)
         photos = await client.get_profile_photos(me.id)
+        if photos:
+            # 删除前先作废：中途失败、只删掉部分头像时也会重新同步
+            assignments.invalidate(name or client_names.get(client))
         for photo in photos:
             await client(DeletePhotosRequest([InputPhoto(
                 id=photo.id,
@@ -142,17 +999,111 @@ async def delete_profile_photos(client: TelegramClient) -> None:
         logger.error(e)
 
 
-async def check_and_join_target(client: TelegramClient) -> None:
+async def check_and_join_target(client: TelegramClient) -> bool:
     try:
+        await ensure_connected(client)
         await client(JoinChannelRequest(Config.TARGET_GROUP))
-        me = await client.get_me()
+        me = await get_me_cached(client)
         logger.info(f"[{me.phone}] 加入目标群组成功")
+        return True
+    except FloodWaitError:
+        raise
     except Exception as e:
         if "FROZEN_METHOD_INVALID" in str(e):
             await cleanup_frozen_client(client)
             logger.error(f"克隆账号加入目标群组失败: {e}")
         else:
             logger.info(e)
+        return False
+
+
+async def is_target_member(client: TelegramClient) -> bool:
+    """用 GetParticipant 查询自己是否已在目标群组（只读、比重新加入便宜）"""
+    await ensure_connected(client)
+    try:
+        await client(GetParticipantRequest(Config.TARGET_GROUP, InputPeerSelf()))
+        return True
+    except UserNotParticipantError:
+        return False
+
+
+async def bulk_join_target(clients: List[TelegramClient], progress=None) -> Dict[str, int]:
+    """
+    并发让克隆账号加入目标群组：并发数 JOIN_CONCURRENCY，全局速率 JOIN_RATE（次/秒）
+
+    已完成的账号记录在 setting/join_job.json，中断后再次执行会跳过；全部完成后删除记录。
+    progress(done, total) 在每个账号处理完后调用。
+    """
+    job = {"target": Config.TARGET_GROUP, "done": []}
+    try:
+        with open(JOIN_JOB_PATH, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("target") == Config.TARGET_GROUP:
+            job = saved
+            logger.info(f"继续上次未完成的加群任务，已完成 {len(job['done'])} 个账号")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"读取加群任务记录失败，重新开始: {e}")
+
+    done_names = set(job["done"])
+    summary = {"joined": 0, "member": 0, "skipped": 0, "failed": 0}
+    total = len(clients)
+    finished = 0
+    semaphore = asyncio.Semaphore(max(1, Config.JOIN_CONCURRENCY))
+    limiter = RateLimiter(Config.JOIN_RATE)
+
+    def record(name: Optional[str], status: str) -> None:
+        nonlocal finished
+        finished += 1
+        summary[status] += 1
+        if name and status in ("joined", "member"):
+            done_names.add(name)
+            job["done"] = sorted(done_names)
+            _write_json(JOIN_JOB_PATH, job)
+        if progress:
+            progress(finished, total)
+
+    async def join_one(client: TelegramClient) -> None:
+        name = client_names.get(client)
+        if name in done_names:
+            record(None, "skipped")
+            return
+        async with semaphore:
+            try:
+                if await is_target_member(client):
+                    record(name, "member")
+                    return
+                for attempt in range(2):
+                    await limiter.acquire()
+                    try:
+                        joined = await check_and_join_target(client)
+                        break
+                    except FloodWaitError as e:
+                        logger.warning(f"加群触发限流，等待 {e.seconds} 秒")
+                        await asyncio.sleep(e.seconds)
+                else:
+                    joined = False
+                record(name, "joined" if joined else "failed")
+            except Exception as e:
+                if "FROZEN_METHOD_INVALID" in str(e):
+                    await cleanup_frozen_client(client)
+                logger.warning(f"加入目标群失败: {e}")
+                record(name, "failed")
+
+    await asyncio.gather(*(join_one(client) for client in clients))
+    if summary["failed"] == 0 and os.path.exists(JOIN_JOB_PATH):
+        os.remove(JOIN_JOB_PATH)
+    logger.info(f"加群完成: 新加入 {summary['joined']}，已在群 {summary['member']}，"
+                f"跳过 {summary['skipped']}，失败 {summary['failed']}")
+    return summary
+
+
+def _write_json(path: str, data) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
 
 
 async def check_and_join_source(client: TelegramClient, group: InputChannel) -> None:
@@ -165,175 +1116,760 @@ async def check_and_join_source(client: TelegramClient, group: InputChannel) ->
             logger.error(f"监听账号加入源群组失败: {e}")
 
 
-async def clone_and_forward_message(event, monitor_client: TelegramClient) -> None:
-    sender = await event.get_sender()
-    if not sender or sender.bot:
+def spawn(coro) -> asyncio.Task:
+    """启动不等待结果的任务：保留引用直到结束（事件循环只持有弱引用），异常写入日志"""
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_task_done)
+    return task
+
+
+def _task_done(task: asyncio.Task) -> None:
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"后台任务出错: {task.exception()}")
+
+
+class AlbumCollector:
+    """
+    按 grouped_id 暂存相册消息，窗口内没有新成员到达后整组交给 handler 处理
+
+    add() 对相册消息返回该组共享的 Future（整组处理完成后结束，结果为 handler 的返回值），非相册消息返回 None。
+    """
+
+    def __init__(self, handler):
+        self._handler = handler
+        self._pending: Dict[int, list] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._futures: Dict[int, asyncio.Future] = {}
+
+    def add(self, event) -> Optional[asyncio.Future]:
+        grouped_id = getattr(event.message, 'grouped_id', None)
+        if not grouped_id:
+            return None
+        loop = asyncio.get_running_loop()
+        self._pending.setdefault(grouped_id, []).append(event)
+        if grouped_id not in self._futures:
+            self._futures[grouped_id] = loop.create_future()
+        timer = self._timers.pop(grouped_id, None)
+        if timer:
+            timer.cancel()
+        self._timers[grouped_id] = loop.call_later(Config.SNAPSHOT.album_window, self._flush, grouped_id)
+        return self._futures[grouped_id]
+
+    def _flush(self, grouped_id: int) -> None:
+        self._timers.pop(grouped_id, None)
+        album = sorted(self._pending.pop(grouped_id, []), key=lambda e: e.message.id)
+        future = self._futures.pop(grouped_id)
+        task = spawn(self._handler(album))
+        task.add_done_callback(lambda t: future.done() or future.set_result(
+            t.result() if not t.cancelled() and t.exception() is None else FAILED))
+
+
+def new_message_key(event):
+    return ("new", event.chat_id, event.message.id), event.message.date
+
+
+def edit_key(event):
+    return ("edit", event.chat_id, event.message.id, event.message.edit_date), None
+
+
+def delete_key(event):
+    return ("delete", event.chat_id, tuple(event.deleted_ids)), None
+
+
+def arbitrated(handler, name: str, key_of):
+    """
+    把 name 监听账号收到的事件交给共用的 handler；其他账号已经先收到同一事件时直接丢弃。
+    key_of(event) -> (事件键, 消息发送时间或 None)
+    """
+    async def on_event(event) -> None:
+        key, sent_at = key_of(event)
+        if monitor_events.first(name, key, sent_at):
+            await handler(event)
+    return on_event
+
+
+# 转发结果：FAILED 为假值，调用方用 if ok 判断是否处理完成（记录进度、日志 done）；
+# SKIPPED 是被规则过滤、按配置跳过或重复内容等没有发出的消息，只有 SENT 才真正发到了目标群组
+FAILED, SKIPPED, SENT = 0, 1, 2
+
+
+async def forward_unique(messages: list, forward) -> int:
+    """
+    内容去重：多个源群组的同一条推广、短时间内的重复刷屏只转发第一条，不再取发送者、占用克隆账号
+
+    指纹只在 forward() 返回 SENT 后记录，被规则过滤、跳过或发送失败的第一条不会挡住之后的相同内容；
+    相同内容正在转发时先等它的结果。跳过的重复内容返回 SKIPPED。
+    """
+    key = dedupe.fingerprint(messages) if Config.DEDUPE_ENABLED else None
+    if key is None:
+        return await forward()
+    while key in dedupe_inflight:
+        await asyncio.wait([dedupe_inflight[key]])  # 不用 await future：等待方被取消时不能取消它
+    if dedupe.seen(key):
+        logger.info(f"跳过重复内容: {messages[0].chat_id}/{messages[0].id}")
+        return SKIPPED
+    done = asyncio.get_running_loop().create_future()
+    dedupe_inflight[key] = done
+    ok = FAILED
+    try:
+        ok = await forward()
+        if ok == SENT:
+            dedupe.add(key)
+        return ok
+    finally:
+        del dedupe_inflight[key]
+        done.set_result(ok)
+
+
+def receiving_client(event, monitor_client: TelegramClient) -> TelegramClient:
+    """由最先收到这条消息的监听账号获取发送者与下载媒体：事件里的实体与媒体引用属于该账号"""
+    return getattr(event, "client", None) or monitor_client
+
+
+def build_message_handler(monitor_client: TelegramClient):
+    """构造 NewMessage 处理函数（相册先聚合再整组转发），多个监听账号共用"""
+
+    def receiver(event) -> TelegramClient:
+        return receiving_client(event, monitor_client)
+
+    async def process_album(album: list) -> int:
+        try:
+            # 相册整组去重：部分成员重复时也整组转发，不会缺图
+            return await forward_unique([e.message for e in album],
+                                        lambda: clone_and_forward_message(album[0], receiver(album[0]), album))
+        except Exception as e:
+            logger.error(f"处理相册时出错: {e}")
+            return FAILED
+
+    albums = AlbumCollector(process_album)
+
+    async def handler(event: telethon.events.NewMessage.Event):
+        try:
+            await checkpoints.wait_live(event.chat_id, event.message.id)
+            # 先记入日志再处理：排队或延迟等待期间被取消的消息，下次启动时重新转发
+            if Config.JOURNAL_ENABLED:
+                journal.accept(event.chat_id, event.message.id)
+            pending = albums.add(event)
+            if pending is not None:
+                ok = await pending
+            else:
+                ok = await forward_unique([event.message], lambda: clone_and_forward_message(event, receiver(event)))
+            # 发送失败的消息留在日志中，下次启动时重新转发
+            if ok:
+                checkpoints.mark(event.chat_id, event.message.id)
+                journal.done(event.chat_id, event.message.id)
+        except Exception as e:
+            logger.error(f"处理消息时出错: {e}")
+
+    return handler
+
+
+class DeleteBatcher:
+    """短时间内到达的删除按克隆账号合并，每个账号只发一次 delete_messages"""
+
+    def __init__(self, window: float = 0.5):
+        self.window = window
+        self._pending: Dict[object, List[int]] = defaultdict(list)
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def add(self, client, target_id: int) -> None:
+        self._pending[client].append(target_id)
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+    def _flush(self) -> None:
+        self._timer = None
+        pending, self._pending = self._pending, defaultdict(list)
+        for client, target_ids in pending.items():
+            spawn(self._delete(client, target_ids))
+
+    async def _delete(self, client: TelegramClient, target_ids: List[int]) -> None:
+        lock = client_locks.get(client)
+        if lock is None or client in frozen_clients:
+            return
+        try:
+            async with lock:
+                await ensure_connected(client)
+                await client.delete_messages(Config.SNAPSHOT.target_group, target_ids)
+            logger.info(f"同步删除 {len(target_ids)} 条消息")
+        except Exception as e:
+            if "FROZEN_METHOD_INVALID" in str(e):
+                await cleanup_frozen_client(client)
+            logger.warning(f"同步删除失败: {e}")
+
+
+async def propagate_edit(event, deletes: DeleteBatcher) -> None:
+    """源消息被编辑：由原发送账号重新套用替换词后编辑目标消息；编辑后的消息被规则链（含关键词）丢弃时删除"""
+    entry = message_id_mapping.lookup(event.chat_id, event.message.id)
+    if entry is None:
+        return
+    target_id, client = entry
+    lock = client_locks.get(client)
+    if lock is None or client in frozen_clients:
         return
 
+    snapshot = Config.SNAPSHOT
+    message = event.message
+    # 与新消息相同：先用消息头阶段的规则，结果取决于发送者时才请求发送者
+    verdict, pending = snapshot.rules.check_header(message)
+    if pending is not None:
+        verdict = snapshot.rules.check_sender(message, await event.get_sender(), pending)
+    if verdict == "drop":
+        message_id_mapping.pop(event.chat_id, message.id)
+        deletes.add(client, target_id)
+        return
+    text, entities = snapshot.replace_entities(message.raw_text or "", message.entities)
+    try:
+        async with lock:
+            await ensure_connected(client)
+            entities = await resolve_mentions(client, entities)
+            await client.edit_message(snapshot.target_group, target_id, text,
+                                      formatting_entities=entities, parse_mode=None)
+        logger.info(f"同步编辑消息 {event.message.id} -> {target_id}")
+    except MessageNotModifiedError:
+        pass
+    except Exception as e:
+        if "FROZEN_METHOD_INVALID" in str(e):
+            await cleanup_frozen_client(client)
+        logger.warning(f"同步编辑失败: {e}")
+
+
+def build_edit_delete_handlers():
+    """构造 MessageEdited / MessageDeleted 处理函数，二者共用同一个删除合并器"""
+    deletes = DeleteBatcher()
+
+    async def on_edit(event: telethon.events.MessageEdited.Event):
+        try:
+            await propagate_edit(event, deletes)
+        except Exception as e:
+            logger.error(f"处理编辑时出错: {e}")
+
+    async def on_delete(event: telethon.events.MessageDeleted.Event):
+        try:
+            for key, target_id, client in message_id_mapping.find(event.deleted_ids, event.chat_id):
+                message_id_mapping.pop(*key)
+                deletes.add(client, target_id)
+        except Exception as e:
+            logger.error(f"处理删除时出错: {e}")
+
+    return on_edit, on_delete
+
+
+def builtin_rules(black_list: FrozenSet[int], keyword_pattern: Optional[Pattern]) -> List[Rule]:
+    """原有的黑名单、关键词与机器人过滤，排在 [rules] 之后：allow 规则可以放行这些消息"""
+    def blacklisted(message, sender) -> bool:
+        # 配置中的 user_ids 与外部 id 文件，只需要消息头里的发送者 id
+        user_id = message.sender_id
+        return user_id is not None and (user_id in black_list or user_id in file_blacklist)
+
+    rules = [Rule("blacklist", "drop", [Condition("blacklist", blacklisted, 1)])]
+    if keyword_pattern is not None:
+        rules.append(Rule("keywords", "drop", [Condition(
+            "keywords", lambda m, s: keyword_pattern.search(m.raw_text or "") is not None, 5)]))
+    rules.append(Rule("bot", "drop", [Condition("bot", lambda m, s: bool(getattr(s, "bot", False)), 1, True)]))
+    return rules
+
+
+def filter_messages(snapshot: ConfigSnapshot, messages: list) -> Tuple[bool, list]:
+    """
+    消息头阶段：返回 (是否丢弃, 仍需发送者才能决定的 (消息, pending))
+
+    相册按整体处理：任一条被丢弃则整组丢弃，与原来的关键词过滤一致。
+    """
+    undecided = []
+    for message in messages:
+        verdict, pending = snapshot.rules.check_header(message)
+        if verdict == "drop":
+            return True, []
+        if pending is not None:
+            undecided.append((message, pending))
+    return False, undecided
+
+
+async def clone_and_forward_message(event, monitor_client: TelegramClient, album: Optional[list] = None) -> int:
+    """
+    以克隆账号转发一条消息（或整个相册）
+
+    返回 SENT（已发送）或 SKIPPED（按规则过滤、按配置跳过）表示已处理完；发送失败或没有可用账号时返回 FAILED，
+    调用方不记录进度，留给日志重放或之后的补发。
+    """
+    # 整条处理流程使用同一个配置快照，期间重新加载配置不影响本条消息
+    snapshot = Config.SNAPSHOT
+    # 只依赖消息头的规则（黑名单、关键词、媒体类型等）在请求发送者实体之前执行
+    dropped, undecided = filter_messages(snapshot, [e.message for e in (album or [event])])
+    if dropped:
+        return SKIPPED
+    sender = await event.get_sender()
+    if not sender:
+        return SKIPPED
+    if any(snapshot.rules.check_sender(message, sender, pending) == "drop" for message, pending in undecided):
+        return SKIPPED
+
     sender_id = sender.id
     lock = sender_locks[sender_id]
     async with lock:
-        if sender_id in Config.BLACK_LIST:
-            return
-
-        if any(keyword in (event.message.text or "") for keyword in Config.KEY_WORDS):
-            return
-
         # 已分配过的 client
-        for client, cloned_user in list(clients_pool.items()):
-            if cloned_user == sender_id:
-                if client in frozen_clients:
+        for _ in range(2):
+            client = next((c for c, cloned_user in clients_pool.items()
+                           if cloned_user == sender_id and is_usable(c)), None)
+            if client is None:
+                break
+            lock = client_locks[client]
+            async with lock:
+                # 等锁期间账号可能被回收给了其他发送者，重新选择
+                if clients_pool.get(client) != sender_id:
                     continue
-                lock = client_locks[client]
-                async with lock:
-                    try:
-                        await asyncio.sleep(random.uniform(1, 5.5))
-                        me = await client.get_me()
-                        await forward_message_as(client, event, monitor_client)
+                ok = FAILED
+                try:
+                    await ensure_connected(client)
+                    # 发送者改了昵称/头像才重新同步资料，否则沿用上次的克隆结果
+                    fingerprint = profile_fingerprint(sender)
+                    if assignments.fingerprint_for(client_names.get(client)) != fingerprint:
+                        me = await get_me_cached(client)
+                        logger.info(f"[{me.phone}] 用户 {sender_id} 资料已变化，重新同步")
+                        if not await provision_profile(client, sender, monitor_client, me):
+                            return FAILED
+                        assignments.bind(client_names.get(client), sender_id, fingerprint)
+                    await asyncio.sleep(random.uniform(*snapshot.send_delay))
+                    me = await get_me_cached(client)
+                    ok = await forward_message_as(client, event, monitor_client, snapshot, album)
+                    client_last_active[client] = time.time()
+                    if ok:
                         logger.info(f"[{me.phone}] 转发 {sender_id} 的新消息")
-                    except Exception as e:
-                        if "FROZEN_METHOD_INVALID" in str(e):
-                            await cleanup_frozen_client(client, sender_id)
-                        logger.info(f"转发失败（已克隆用户）: {e}")
-                return
+                except Exception as e:
+                    if "FROZEN_METHOD_INVALID" in str(e):
+                        await cleanup_frozen_client(client, sender_id)
+                    logger.info(f"转发失败（已克隆用户）: {e}")
+            return ok
 
         # 未分配的 client
         for client, cloned_user in list(clients_pool.items()):
-            if cloned_user is None and client not in frozen_clients:
+            if cloned_user is None and is_usable(client):
                 lock = client_locks[client]
                 async with lock:
+                    ok = FAILED
                     try:
-                        await monitor_client.get_input_entity(sender_id)
-                        me = await client.get_me()
+                        await ensure_connected(client)
+                        # 预热过的成员已在监听账号的实体缓存中，无需解析
+                        if not members.knows(sender_id):
+                            await resolve_input_entity(monitor_client, sender_id)
+                        me = await get_me_cached(client)
                         logger.info(f"[{me.phone}] 正在克隆新用户: {sender_id}")
 
-                        # 再次检查是否已分配
-                        if clients_pool[client] is not None:
+                        # 再次检查是否已分配（等锁期间也可能被健康检查移出账号池）
+                        if clients_pool.get(client, sender_id) is not None:
                             continue
 
-                        # 设置昵称
-                        try:
-                            await client(UpdateProfileRequest(
-                                first_name=sender.first_name or " ",
-                                last_name=sender.last_name or "",
-                            ))
-                            logger.info(f"[{me.phone}] 设置昵称成功")
-                        except Exception as e:
-                            if "FROZEN_METHOD_INVALID" in str(e):
-                                await cleanup_frozen_client(client, sender_id)
-                                return
-                            logger.error(f"设置昵称失败: {e}")
-
-                        # 设置头像
-                        try:
-                            photos = await monitor_client.get_profile_photos(sender, limit=1)
-                            if photos:
-                                profile_path = await monitor_client.download_media(photos[0])
-                                if profile_path and os.path.exists(profile_path):
-                                    uploaded = await client.upload_file(file=profile_path)
-                                    if photos[0].video_sizes:
-                                        await client(UploadProfilePhotoRequest(video=uploaded))
-                                    else:
-                                        await client(UploadProfilePhotoRequest(file=uploaded))
-                                    os.remove(profile_path)
-                                    logger.info(f"[{me.phone}] 设置头像成功")
-                        except Exception as e:
-                            if "FROZEN_METHOD_INVALID" in str(e):
-                                await cleanup_frozen_client(client, sender_id)
-                                return
-                            logger.error(f"设置头像失败: {e}")
-
-                        # 转发消息
-                        await forward_message_as(client, event, monitor_client)
-
-                        clients_pool[client] = sender_id
-                        cloned_users.add(sender_id)
-                        logger.info(f"[{me.phone}] 完成新用户克隆: {sender_id}")
+                        ok = await clone_onto(client, sender, event, monitor_client, snapshot, album, me)
                     except Exception as e:
                         if "FROZEN_METHOD_INVALID" in str(e):
                             await cleanup_frozen_client(client, sender_id)
                         logger.warning(f"克隆失败: {e}")
-                return
+                return ok
+
+        # 账号已全部分配：回收最久未活跃的账号给新发送者
+        client = pick_recycle_candidate()
+        if client is not None:
+            async with client_locks[client]:
+                if client in clients_pool and is_recyclable(client):
+                    ok = FAILED
+                    try:
+                        await ensure_connected(client)
+                        me = await get_me_cached(client)
+                        old_sender = clients_pool[client]
+                        release_client(client)
+                        logger.info(f"[{me.phone}] 回收账号: {old_sender} -> {sender_id}")
+                        ok = await clone_onto(client, sender, event, monitor_client, snapshot, album, me)
+                    except Exception as e:
+                        if "FROZEN_METHOD_INVALID" in str(e):
+                            await cleanup_frozen_client(client, sender_id)
+                        logger.warning(f"回收账号克隆失败: {e}")
+                    return ok
 
         logger.info("无可用账号进行克隆")
+        return FAILED
+
+
+async def clone_onto(client: TelegramClient, sender, event, monitor_client: TelegramClient,
+                     snapshot: ConfigSnapshot, album: Optional[list], me) -> int:
+    """在持有账号锁的情况下，把空闲账号克隆成 sender 并转发消息（调用方负责异常处理）；返回 forward_message_as 的结果"""
+    if not await provision_profile(client, sender, monitor_client, me):
+        return FAILED
+
+    # 转发消息
+    ok = await forward_message_as(client, event, monitor_client, snapshot, album)
+
+    clients_pool[client] = sender.id
+    cloned_users.add(sender.id)
+    client_last_active[client] = time.time()
+    assignments.bind(client_names.get(client), sender.id, profile_fingerprint(sender))
+    logger.info(f"[{me.phone}] 完成新用户克隆: {sender.id}")
+    return ok
+
+
+def is_usable(client: TelegramClient) -> bool:
+    """未冻结、且健康检查没有发现受限的账号才会分配给发送者"""
+    return client not in frozen_clients and account_health.get(client, ("ok", 0.0))[0] == "ok"
+
+
+def is_recyclable(client: TelegramClient) -> bool:
+    return (Config.RECYCLE_ENABLED and clients_pool.get(client) is not None and is_usable(client)
+            and time.time() - client_last_active.get(client, 0.0) >= Config.RECYCLE_MIN_IDLE)
+
+
+def pick_recycle_candidate() -> Optional[TelegramClient]:
+    """已分配账号中最久没有转发过消息、且空闲时间达到 RECYCLE_MIN_IDLE 的账号"""
+    if not Config.RECYCLE_ENABLED:
+        return None
+    candidates = [c for c in clients_pool if is_recyclable(c) and not client_locks[c].locked()]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda c: client_last_active.get(c, 0.0))
+
+
+def release_client(client: TelegramClient) -> None:
+    """解除账号与发送者的绑定（账号池、已克隆用户、绑定记录同时更新）并计入回收统计"""
+    old_sender = clients_pool.get(client)
+    clients_pool[client] = None
+    if old_sender is not None and old_sender not in clients_pool.values():
+        cloned_users.discard(old_sender)
+    assignments.release(client_names.get(client))
+    pool_stats["recycled"] += 1
+    recycle_times.append(time.time())
+
+
+def recycle_stats() -> Dict[str, float]:
+    """累计回收次数与最近一小时的回收速率，用于评估账号池大小"""
+    now = time.time()
+    while recycle_times and now - recycle_times[0] > 3600:
+        recycle_times.popleft()
+    return {"total": pool_stats["recycled"], "last_hour": len(recycle_times)}
+
+
+async def provision_profile(client: TelegramClient, sender, monitor_client: TelegramClient, me) -> bool:
+    """把克隆账号的昵称、头像设置成发送者的；账号被冻结时清理并返回 False"""
+    # 设置昵称
+    try:
+        await client(UpdateProfileRequest(
+            first_name=sender.first_name or " ",
+            last_name=sender.last_name or "",
+        ))
+        logger.info(f"[{me.phone}] 设置昵称成功")
+    except Exception as e:
+        if "FROZEN_METHOD_INVALID" in str(e):
+            await cleanup_frozen_client(client, sender.id)
+            return False
+        logger.error(f"设置昵称失败: {e}")
+
+    # 设置头像
+    try:
+        photos = await get_profile_photos_cached(monitor_client, sender)
+        if photos:
+            async with workspace.lease() as lease:
+                profile_path = await transfer_lanes.download(monitor_client, photos[0],
+                                                             lease.path(media_extension(photos[0])))
+                if profile_path and os.path.exists(profile_path):
+                    uploaded = await uploader.upload_file(client, profile_path)
+                    if photos[0].video_sizes:
+                        await client(UploadProfilePhotoRequest(video=uploaded))
+                    else:
+                        await client(UploadProfilePhotoRequest(file=uploaded))
+                    logger.info(f"[{me.phone}] 设置头像成功")
+    except Exception as e:
+        if "FROZEN_METHOD_INVALID" in str(e):
+            await cleanup_frozen_client(client, sender.id)
+            return False
+        logger.error(f"设置头像失败: {e}")
+    return True
 
 
 async def forward_message_as(client: TelegramClient, event: telethon.events.NewMessage.Event,
-                             monitor_client: TelegramClient) -> None:
+                             monitor_client: TelegramClient, snapshot: Optional[ConfigSnapshot] = None,
+                             album: Optional[list] = None) -> int:
+    """发送成功返回 SENT，按配置跳过没有映射的回复返回 SKIPPED，发送失败（异常已记录）时返回 FAILED"""
+    snapshot = snapshot or Config.SNAPSHOT
+    if album and len(album) > 1:
+        return await forward_album_as(client, album, monitor_client, snapshot)
     message = event.message
-    text = apply_replacements(message.text or "")
-    target_group = Config.TARGET_GROUP
+    # 直接使用原始文本与格式实体，不经过 markdown 渲染/解析
+    text, entities = snapshot.replace_entities(message.raw_text or "", message.entities)
+    target_group = snapshot.target_group
 
     try:
+        reply_to_msg_id = None
         if message.is_reply:
-            reply = await event.get_reply_message()
-            if not reply:
-                logger.warning("无法获取被回复消息")
-                return
-
-            reply_to_msg_id = message_id_mapping.get(reply.id)
+            # 被回复消息的 id 就在消息头里，直接查映射，不再请求 get_reply_message
+            source_reply_id = getattr(message.reply_to, 'reply_to_msg_id', None)
+            reply_to_msg_id = message_id_mapping.get(event.chat_id, source_reply_id) if source_reply_id else None
             if reply_to_msg_id is None:
-                logger.info("没有找到对应的克隆账号消息，跳过回复")
-                return
-
-            if message.media:
-                file_path = await monitor_client.download_media(message)
-                original_attributes = getattr(message.media, 'document', None)
-                sent_reply = await client.send_file(
-                    target_group,
-                    file_path,
-                    attributes=getattr(original_attributes, 'attributes', None),
-                    reply_to=reply_to_msg_id,
-                    caption=text
-                )
-                if file_path and os.path.exists(file_path):
-                    os.remove(file_path)
-            else:
-                sent_reply = await client.send_message(target_group, text, reply_to=reply_to_msg_id)
+                if snapshot.unmapped_reply == "skip":
+                    logger.info("没有找到对应的克隆账号消息，跳过回复")
+                    return SKIPPED
+                if snapshot.unmapped_reply == "quote":
+                    text, entities = prepend(await quote_reply(event, snapshot), text, entities)
+        entities = await resolve_mentions(client, entities)
 
-            message_id_mapping[message.id] = sent_reply.id
+        sent = None
+        if message.media and Config.REFERENCE_SEND:
+            async def send_reference(media: list):
+                async with transfer_lanes.text.slot():  # 不传输文件，与文本消息同一通道
+                    return await client.send_file(target_group, media[0], reply_to=reply_to_msg_id, caption=text,
+                                                  formatting_entities=entities, parse_mode=None)
+            sent = await send_by_reference(monitor_client, event.chat_id, [message], send_reference)
 
-        else:
-            if message.media:
-                file_path = await monitor_client.download_media(message)
+        if sent is None and message.media:
+            # 文件在租约结束时删除，发送失败也不会留在磁盘上
+            async with workspace.lease(media_size(message)) as lease:
+                file_path = await transfer_lanes.download(monitor_client, message,
+                                                          lease.path(media_extension(message)))
                 original_attributes = getattr(message.media, 'document', None)
+                uploaded = await uploader.upload_file(client, file_path)
                 sent = await client.send_file(
                     target_group,
-                    file_path,
+                    uploaded,
                     attributes=getattr(original_attributes, 'attributes', None),
-                    caption=text
+                    reply_to=reply_to_msg_id,
+                    caption=text,
+                    formatting_entities=entities,
+                    parse_mode=None
                 )
-                if file_path and os.path.exists(file_path):
-                    os.remove(file_path)
-            else:
-                sent = await client.send_message(target_group, text)
+        elif sent is None:
+            async with transfer_lanes.text.slot():
+                sent = await client.send_message(target_group, text, reply_to=reply_to_msg_id,
+                                                 formatting_entities=entities, parse_mode=None)
 
-            message_id_mapping[message.id] = sent.id
+        record_sent(event.chat_id, message.id, sent.id, client)
+        return SENT
 
     except Exception as e:
         if "FROZEN_METHOD_INVALID" in str(e):
             await cleanup_frozen_client(client)
         logger.error(f"发送消息失败: {e}")
+        return FAILED
+
 
+async def forward_album_as(client: TelegramClient, album: list, monitor_client: TelegramClient,
+                           snapshot: ConfigSnapshot) -> int:
+    """
+    相册：先尝试按引用整组重发，否则并发下载全部媒体，一次 send_file 发出，逐条记录源消息到目标消息的映射
+
+    发送失败或全部媒体下载失败时返回 FAILED。
+    """
+    messages = [e.message for e in album]
+    target_group = snapshot.target_group
+    try:
+        reply_to_msg_id = None
+        head = next((m for m in messages if m.is_reply), None)
+        if head is not None:
+            source_reply_id = getattr(head.reply_to, 'reply_to_msg_id', None)
+            reply_to_msg_id = message_id_mapping.get(album[0].chat_id, source_reply_id) if source_reply_id else None
+            if reply_to_msg_id is None and snapshot.unmapped_reply == "skip":
+                logger.info("没有找到对应的克隆账号消息，跳过回复")
+                return SKIPPED
 
-def apply_replacements(text: str) -> str:
-    if not text:
-        return text
-    for k, v in Config.REPLACEMENTS.items():
-        text = text.replace(k, v)
-    return text
+        captions, entities = map(list, zip(*(snapshot.replace_entities(m.raw_text or "", m.entities)
+                                             for m in messages)))
+        if reply_to_msg_id is None and head is not None and snapshot.unmapped_reply == "quote":
+            captions[0], entities[0] = prepend(await quote_reply(album[messages.index(head)], snapshot),
+                                               captions[0], entities[0])
+        entities = [await resolve_mentions(client, e) for e in entities]
 
+        async def send(files: list, keep: List[int]):
+            return await client.send_file(
+                target_group,
+                files,
+                caption=[captions[i] for i in keep],
+                formatting_entities=[entities[i] for i in keep],  # 每条说明各自的实体列表；全部为空时也不会回退到 markdown 解析
+                parse_mode=None,
+                reply_to=reply_to_msg_id
+            )
 
-async def cleanup_frozen_client(client: TelegramClient, sender_id: Optional[int] = None) -> None:
+        everything = list(range(len(messages)))
+        sent = None
+        if Config.REFERENCE_SEND:
+            async def send_reference(media: list):
+                async with transfer_lanes.text.slot():
+                    return await send(media, everything)
+            sent = await send_by_reference(monitor_client, album[0].chat_id, messages, send_reference)
+        if sent is not None:
+            keep = everything
+        else:
+            # 整个相册一次占用预算，避免多个相册各占一部分后互相等待
+            async with workspace.lease(sum(media_size(m) for m in messages)) as lease:
+                # 相册成员可能由不同的监听账号先收到，各自由收到它的账号下载
+                downloads = await asyncio.gather(
+                    *(transfer_lanes.download(receiving_client(e, monitor_client), e.message,
+                                              lease.path(media_extension(e.message))) for e in album),
+                    return_exceptions=True)
+                keep = []
+                for i, path in enumerate(downloads):
+                    if isinstance(path, Exception) or not path:
+                        logger.warning(f"相册媒体下载失败: {path}")
+                        continue
+                    keep.append(i)
+                if not keep:
+                    return FAILED
+                uploaded = await asyncio.gather(*(uploader.upload_file(client, downloads[i]) for i in keep))
+                sent = await send([uploaded_media(messages[i], f) for i, f in zip(keep, uploaded)], keep)
+        if not isinstance(sent, list):
+            sent = [sent]
+        for i, s in zip(keep, sent):
+            record_sent(album[0].chat_id, messages[i].id, s.id, client)
+        return SENT
+
+    except Exception as e:
+        if "FROZEN_METHOD_INVALID" in str(e):
+            await cleanup_frozen_client(client)
+        logger.error(f"发送相册失败: {e}")
+        return FAILED
+
+
+def uploaded_media(message, uploaded):
+    """
+    上传后的相册成员带上源文件的属性（时长、尺寸、流媒体、文件名）与 mime 类型
+
+    send_file 发送相册时不接受 attributes，只能按临时文件的扩展名推断；直接交给它 InputMedia 则原样使用。
+    """
+    document = getattr(message.media, 'document', None)
+    if document is None:
+        return InputMediaUploadedPhoto(uploaded)
+    mime_type = document.mime_type or "application/octet-stream"
+    return InputMediaUploadedDocument(
+        file=uploaded,
+        mime_type=mime_type,
+        attributes=list(document.attributes),
+        # 与 send_file 相同：相册里的无声视频不要被当成 GIF
+        nosound_video=True if mime_type.startswith("video/") else None,
+    )
+
+
+def record_sent(chat_id: int, msg_id: int, target_id: int, client: TelegramClient) -> None:
+    """
+    发送请求一返回就记录映射，并写入日志：之后没来得及记 done 时，重新转发前据此跳过。
+    同时记下账号最近一次成功发送的时间，健康检查据此跳过刚证明可用的账号。
+    """
+    message_id_mapping.put(chat_id, msg_id, target_id, client)
+    client_last_sent[client] = time.time()
+    journal.mark_sent(chat_id, msg_id, target_id, client_names.get(client))
+
+
+def reference_media(message):
+    """可以按原文件引用直接重发的媒体（照片/文件，含贴纸与 GIF）；阅后即焚或来自禁止转发群组的返回 None"""
+    media = getattr(message, "media", None)
+    if media is None or getattr(message, "noforwards", False) or getattr(media, "ttl_seconds", None):
+        return None
+    if getattr(media, "photo", None) is None and getattr(media, "document", None) is None:
+        return None
+    return media
+
+
+async def send_by_reference(monitor_client: TelegramClient, chat_id: int, messages: list, send):
+    """
+    把源消息的媒体引用（id + access_hash + file_reference）交给 send 直接发送，不下载也不上传。
+    file_reference 过期时由监听账号重新获取源消息、换上新的引用再试一次；
+    其他原因无法按引用发送时返回 None，由调用方走下载/上传。FloodWait 与冻结错误照常抛出。
+    """
+    media = [reference_media(m) for m in messages]
+    if any(m is None for m in media):
+        return None
+    for attempt in range(2):
+        try:
+            sent = await send(media)
+            reference_stats["hits"] += len(messages)
+            return sent
+        except FloodWaitError:
+            raise
+        except RPCError as e:
+            if "FROZEN_METHOD_INVALID" in str(e):
+                raise
+            if attempt or "FILE_REFERENCE" not in str(e):
+                reason = e
+                break
+        # 引用过期：重新获取源消息（只读请求，不传输文件）
+        try:
+            fresh = await monitor_client.get_messages(chat_id, ids=[m.id for m in messages])
+        except Exception as e:
+            reason = e
+            break
+        media = [reference_media(m) if m is not None else None for m in fresh]
+        if any(m is None for m in media):
+            reason = "源消息已删除或媒体不可用"
+            break
+        reference_stats["refreshed"] += 1
+    reference_stats["fallbacks"] += len(messages)
+    logger.info(f"无法按引用重发媒体，改为下载后上传: {reason}")
+    return None
+
+
+async def quote_reply(event, snapshot: ConfigSnapshot) -> str:
+    """被回复消息没有映射时，取其文本作为引用前缀（只在这个兜底分支才请求被回复消息）"""
+    try:
+        reply = await event.get_reply_message()
+    except Exception as e:
+        logger.warning(f"无法获取被回复消息: {e}")
+        return ""
+    quoted = apply_replacements(getattr(reply, 'raw_text', None) or "", snapshot).strip()
+    if not quoted:
+        return ""
+    if len(quoted) > 60:
+        quoted = quoted[:60] + "…"
+    return "\n".join(f"> {line}" for line in quoted.splitlines()) + "\n\n"
+
+
+async def resolve_mentions(client: TelegramClient, entities: list) -> list:
+    """
+    源消息里的 MessageEntityMentionName 只带用户 id，用 formatting_entities 原样发送会被服务器拒绝；
+    换成克隆账号自己解析出的 InputMessageEntityMentionName，解析不了的去掉链接，只保留文字
+    """
+    if not any(isinstance(e, MessageEntityMentionName) for e in entities):
+        return entities
+    failed = unresolved_mentions[client]
+    result = []
+    for entity in entities:
+        if not isinstance(entity, MessageEntityMentionName):
+            result.append(entity)
+            continue
+        if entity.user_id in failed:  # 解析失败过的用户不再每条消息都请求一次
+            continue
+        try:
+            user = utils.get_input_user(await client.get_input_entity(PeerUser(entity.user_id)))
+        except (ValueError, TypeError, RPCError) as e:
+            failed.add(entity.user_id)
+            logger.info(f"克隆账号无法解析被提及的用户 {entity.user_id}，改为纯文本: {e}")
+            continue
+        result.append(InputMessageEntityMentionName(entity.offset, entity.length, user))
+    return result
+
+
+def apply_replacements(text: str, snapshot: Optional[ConfigSnapshot] = None) -> str:
+    return (snapshot or Config.SNAPSHOT).replace(text)
+
+
+async def cleanup_frozen_client(client: TelegramClient, sender_id: Optional[int] = None,
+                                status: str = "frozen") -> None:
+    """从账号池移除冻结（或已失效）的账号；失效账号无法再请求 get_me，只用缓存的信息取手机号"""
     try:
-        me = await client.get_me()
-        phone = me.phone
-        logger.warning(f"[{phone}][FROZEN] 账号被冻结，已移除")
+        me = cached_me(client)
+        phone = me.phone if me and me.phone else client_names.get(client, "未知手机号")
+        logger.warning(f"[{phone}][{status.upper()}] 账号{HEALTH_LABELS.get(status, status)}，已移除")
         frozen_clients.add(client)
+        sender_id = sender_id or clients_pool.get(client)
+        pool_stats["removed"] += 1
 
+        await uploader.release(client)
         await client.disconnect()
         clients_pool.pop(client, None)
         client_locks.pop(client, None)
+        name = client_names.pop(client, None)
+        assignments.release(name)
+        proxy_pool.release(name)
+        client_last_active.pop(client, None)
+        client_last_used.pop(client, None)
+        client_last_sent.pop(client, None)
+        account_health.pop(client, None)
+        unresolved_mentions.pop(client, None)
 
         if sender_id:
             cloned_users.discard(sender_id)
@@ -341,13 +1877,338 @@ async def cleanup_frozen_client(client: TelegramClient, sender_id: Optional[int]
         logger.warning(f"清理被冻结账号失败: {e}")
 
 
-async def start_monitor() -> None:
-    session_file = 'monitor'
-    monitor_client = TelegramClient(session_file, Config.API_ID, Config.API_HASH, proxy=Config.PROXY)
+async def probe_account(client: TelegramClient) -> Optional[str]:
+    """
+    用两个廉价请求探测账号：get_me（失效账号返回 None 或 401，受限账号带 restricted 标记）、
+    UpdateStatus(offline)（冻结账号对写操作返回 FROZEN_METHOD_INVALID）。
+    账号正在转发时跳过；网络等临时错误返回 None，保留上次的结果。
+    闲置断开的账号只为探测临时连接，探测完重新断开，不会因为健康检查一直保持在线。
+    """
+    lock = client_locks.get(client)
+    if lock is None or lock.locked():
+        return None
+    async with lock:
+        reconnected = not client.is_connected()
+        try:
+            await ensure_connected(client)
+            me = await client.get_me()
+            if me is None:
+                return "unauthorized"
+            rpc_cache.put(("get_me", client), me, ttl=3600)
+            # 冻结账号仍能正常执行读取类请求（get_me、拉取消息等），只有写操作才返回 FROZEN_METHOD_INVALID，
+            # 所以必须发一个写请求才能在转发失败之前发现冻结。选 UpdateStatus(offline) 是因为它最轻、
+            # 不产生任何消息或资料变更，被探测的又都是空闲账号，设为离线与实际状态一致。
+            await client(UpdateStatusRequest(offline=True))
+            return "restricted" if getattr(me, "restricted", False) else "ok"
+        except UnauthorizedError:
+            return "unauthorized"
+        except Exception as e:
+            if "FROZEN_METHOD_INVALID" in str(e):
+                return "frozen"
+            logger.debug(f"账号探测失败: {e}")
+            return None
+        finally:
+            if reconnected and Config.IDLE_DISCONNECT > 0:
+                with contextlib.suppress(Exception):
+                    await client.disconnect()
+
+
+async def check_account(client: TelegramClient) -> Optional[str]:
+    """探测一个账号并处理结果：冻结/失效的移出账号池，受限的解除绑定且不再分配，恢复后重新可用"""
+    status = await probe_account(client)
+    if status is None or client not in clients_pool:
+        return status
+    previous = account_health.get(client, ("ok", 0.0))[0]
+    account_health[client] = (status, time.time())
+    if status in ("frozen", "unauthorized"):
+        await cleanup_frozen_client(client, status=status)
+    elif status == "restricted" and previous != "restricted":
+        sender_id = clients_pool.get(client)
+        logger.warning(f"[{client_names.get(client)}] 账号受限，暂停分配")
+        if sender_id is not None:
+            clients_pool[client] = None
+            if sender_id not in clients_pool.values():
+                cloned_users.discard(sender_id)
+            assignments.release(client_names.get(client))
+    elif status == "ok" and previous == "restricted":
+        logger.info(f"[{client_names.get(client)}] 账号限制已解除")
+    return status
+
+
+async def health_sweep() -> None:
+    """
+    后台轮流检查克隆账号：每轮把 HEALTH_INTERVAL 均分给各账号，逐个探测并带随机抖动，
+    不会集中发出请求。最近一个周期内成功发出过消息的账号视为正常，不再探测；
+    刚加载、还没发过消息的账号在第一轮就会被探测，冻结或失效的 session 在分配给发送者之前被发现。
+    """
+    while True:
+        clients = [c for c in clients_pool if c not in frozen_clients]
+        if not clients or not Config.HEALTH_ENABLED:
+            await asyncio.sleep(60)
+            continue
+        random.shuffle(clients)
+        step = Config.HEALTH_INTERVAL / len(clients)
+        for client in clients:
+            await asyncio.sleep(step * random.uniform(0.5, 1.5))
+            if client not in clients_pool or client in frozen_clients:
+                continue
+            last_sent = client_last_sent.get(client)
+            if (last_sent is not None and time.time() - last_sent < Config.HEALTH_INTERVAL
+                    and account_health.get(client, ("ok", 0.0))[0] == "ok"):
+                account_health[client] = ("ok", last_sent)
+                continue
+            try:
+                await check_account(client)
+            except Exception as e:
+                logger.warning(f"账号健康检查失败: {e}")
+
+
+def health_stats() -> Dict[str, int]:
+    """各健康状态的账号数（只读缓存的检查结果，不发请求）"""
+    counts = {status: 0 for status in HEALTH_LABELS}
+    counts["unchecked"] = 0
+    for client in clients_pool:
+        health = account_health.get(client)
+        counts[health[0] if health else "unchecked"] += 1
+    counts["removed"] = pool_stats["removed"]
+    return counts
+
+
+class HistoryEvent:
+    """把 iter_messages 取到的历史消息包装成 clone_and_forward_message 需要的事件接口"""
+
+    def __init__(self, message: Message):
+        self.message = message
+        self.chat_id = message.chat_id
+        self.sender_id = message.sender_id
+
+    async def get_sender(self):
+        return await self.message.get_sender()
+
+    async def get_reply_message(self):
+        return await self.message.get_reply_message()
+
+
+async def _history(monitor_client: TelegramClient, chat_id: int, start: Optional[int], upper: int):
+    """按时间正序产出 (start, upper] 之间的历史消息；start 为空时取最近 BACKFILL_HISTORY_LIMIT 条"""
+    if start is None:
+        recent = [m async for m in monitor_client.iter_messages(
+            chat_id, limit=Config.BACKFILL_HISTORY_LIMIT, max_id=upper + 1)]
+        for message in reversed(recent):
+            yield message
+    else:
+        async for message in monitor_client.iter_messages(chat_id, min_id=start, max_id=upper + 1, reverse=True):
+            yield message
+
+
+async def backfill_group(monitor_client: TelegramClient, chat_id: int, limiter: RateLimiter) -> None:
+    """
+    从进度记录处补发一个源群组的消息，补发到第一条实时消息之前为止
+
+    没有进度记录时按 BACKFILL_HISTORY_LIMIT 补发最近的历史（0 表示只记录当前位置）。
+    """
+    latest = await monitor_client.get_messages(chat_id, limit=1)
+    upper = latest[0].id if latest else 0
+    floor = checkpoints.live_floor(chat_id)
+    if floor is not None:
+        upper = min(upper, floor - 1)
+
+    start = checkpoints.get(chat_id)
+    if start is None and not Config.BACKFILL_HISTORY_LIMIT:
+        checkpoints.mark(chat_id, upper)
+        return
+    if start is not None and start >= upper:
+        return
+
+    logger.info(f"开始补发群组 {chat_id} 的消息 ({start or 0} -> {upper})")
+    count = 0
+    album: list = []
+
+    async def forward(events_: list) -> bool:
+        """成功时推进进度；失败的消息交给日志，下次启动时由 replay_journal 重新转发"""
+        try:
+            ok = await clone_and_forward_message(events_[0], monitor_client, events_ if len(events_) > 1 else None)
+        except Exception as e:
+            logger.error(f"补发消息 {events_[0].message.id} 失败: {e}")
+            ok = FAILED
+        if ok:
+            checkpoints.mark(chat_id, events_[-1].message.id)
+            return True
+        if not Config.JOURNAL_ENABLED:
+            return False
+        for e in events_:
+            journal.accept(chat_id, e.message.id)
+        return True
+
+    async for message in _history(monitor_client, chat_id, start, upper):
+        # 日志中未完成的消息由 replay_journal 重新转发
+        if getattr(message, 'action', None) or journal.is_pending(chat_id, message.id):
+            continue
+        if album and message.grouped_id != album[0].message.grouped_id:
+            if not await forward(album):
+                break
+            album = []
+        await limiter.acquire()
+        count += 1
+        if message.grouped_id:
+            album.append(HistoryEvent(message))
+        elif not await forward([HistoryEvent(message)]):
+            break
+    else:
+        if album:
+            await forward(album)
+        logger.info(f"群组 {chat_id} 补发完成，共 {count} 条")
+        return
+    # 没有日志可以记录失败的消息：停在这里，进度不越过它，下次启动从这条继续补发
+    logger.warning(f"群组 {chat_id} 补发到第 {count} 条时转发失败，下次启动从失败处继续")
+
+
+async def run_backfill(monitor_client: TelegramClient, chat_ids: List[int]) -> None:
+    """各群组同时补发、共用一个限速器：历史少的群组很快结束，它的实时消息不用排在其他群组的补发后面"""
+    limiter = RateLimiter(Config.BACKFILL_RATE)
+
+    async def backfill(chat_id: int) -> None:
+        try:
+            await backfill_group(monitor_client, chat_id, limiter)
+        except Exception as e:
+            logger.error(f"补发群组 {chat_id} 失败: {e}")
+        finally:
+            checkpoints.end_backfill(chat_id)
+            checkpoints.save()
+
+    await asyncio.gather(*(backfill(chat_id) for chat_id in chat_ids))
+
+
+async def replay_journal(monitor_client: TelegramClient, pending: List[Tuple[int, int]]) -> None:
+    """
+    重新转发上次运行中已接收但未处理完的消息
+
+    日志中有 sent 记录的消息（发出后没来得及记 done）不再发送，只恢复映射并标记完成；
+    已经重新转发过 JOURNAL_MAX_REPLAYS 次仍未完成的消息放弃并记录日志；
+    其余按群组批量取回源消息，相册整组转发；已删除的消息、本次运行中已转发过（有映射）的消息直接标记完成。
+    """
+    if not pending:
+        return
+    by_chat: Dict[int, List[int]] = defaultdict(list)
+    by_name = {name: client for client, name in client_names.items()}
+    given_up = 0
+    for chat_id, msg_id in pending:
+        sent = journal.sent_target(chat_id, msg_id)
+        if sent is None:
+            replays = journal.replayed(chat_id, msg_id)
+            if Config.JOURNAL_MAX_REPLAYS and replays > Config.JOURNAL_MAX_REPLAYS:
+                # 每次都转发失败的消息（如无法下载的媒体）不再无限重试
+                logger.warning(f"消息 {chat_id}/{msg_id} 已重新转发 {replays - 1} 次仍未成功，放弃")
+                journal.done(chat_id, msg_id)
+                given_up += 1
+                continue
+            by_chat[chat_id].append(msg_id)
+            continue
+        target_id, name = sent
+        if name in by_name:
+            message_id_mapping.put(chat_id, msg_id, target_id, by_name[name])
+        checkpoints.mark(chat_id, msg_id)
+        journal.done(chat_id, msg_id)
+    resend = sum(len(ids) for ids in by_chat.values())
+    logger.info(f"上次未完成 {len(pending)} 条消息，其中 {len(pending) - resend - given_up} 条已发出，"
+                f"放弃 {given_up} 条，重新转发 {resend} 条")
+
+    async def forward(chat_id: int, album: list) -> None:
+        try:
+            ok = await clone_and_forward_message(album[0], monitor_client, album if len(album) > 1 else None)
+        except Exception as e:
+            logger.error(f"重新转发消息 {album[0].message.id} 失败: {e}")
+            ok = FAILED
+        if not ok:
+            return  # 仍留在日志中，下次启动再试
+        for e in album:
+            checkpoints.mark(chat_id, e.message.id)
+            journal.done(chat_id, e.message.id)
+
+    for chat_id, msg_ids in by_chat.items():
+        msg_ids.sort()
+        for i in range(0, len(msg_ids), 100):
+            ids = msg_ids[i:i + 100]
+            try:
+                messages = await monitor_client.get_messages(chat_id, ids=ids)
+            except Exception as e:
+                logger.error(f"取回群组 {chat_id} 的未完成消息失败: {e}")
+                continue
+            album: list = []
+            for msg_id, message in zip(ids, messages):
+                if message is None or (chat_id, msg_id) in message_id_mapping:
+                    journal.done(chat_id, msg_id)
+                    continue
+                if album and message.grouped_id != album[0].message.grouped_id:
+                    await forward(chat_id, album)
+                    album = []
+                if message.grouped_id:
+                    album.append(HistoryEvent(message))
+                else:
+                    await forward(chat_id, [HistoryEvent(message)])
+            if album:
+                await forward(chat_id, album)
+
+
+PARTICIPANTS_PAGE = 200  # GetParticipants 每页最多返回的人数
+
+
+async def warm_up_members(monitor_client: TelegramClient, chat_ids: List[int], full: bool = False) -> None:
+    """
+    按页拉取源群组成员，成员实体由 telethon 写入监听账号的实体缓存，同时记录资料指纹
+
+    增量刷新按最近加入排序拉取，遇到一整页都是已知且资料未变的成员就停止；
+    full 或该群组还没有记录时拉取完整列表。
+    """
+    limiter = RateLimiter(Config.WARMUP_RATE)
+    for chat_id in chat_ids:
+        incremental = not full and members.count(chat_id) > 0
+        fetched = changed = unchanged_run = 0
+        try:
+            await limiter.acquire()
+            async for user in monitor_client.iter_participants(chat_id, filter=ChannelParticipantsRecent()):
+                fetched += 1
+                if members.update(chat_id, user):
+                    changed += 1
+                    unchanged_run = 0
+                else:
+                    unchanged_run += 1
+                if incremental and unchanged_run >= PARTICIPANTS_PAGE:
+                    break
+                if fetched % PARTICIPANTS_PAGE == 0:
+                    await limiter.acquire()
+        except Exception as e:
+            logger.error(f"拉取群组 {chat_id} 成员失败: {e}")
+        finally:
+            members.save()
+        logger.info(f"群组 {chat_id} 成员{'增量刷新' if incremental else '预热'}完成：拉取 {fetched} 人，新增或变化 {changed} 人")
+
+
+async def refresh_members(monitor_client: TelegramClient, chat_ids: List[int]) -> None:
+    """启动时预热一次，之后按 WARMUP_REFRESH 间隔增量刷新"""
+    await warm_up_members(monitor_client, chat_ids)
+    while Config.WARMUP_REFRESH > 0:
+        await asyncio.sleep(Config.WARMUP_REFRESH)
+        await warm_up_members(monitor_client, chat_ids)
+
+
+async def open_download_client(monitor_client: TelegramClient, proxy) -> TelegramClient:
+    """大文件专用的下载连接：复用监听账号的授权密钥，另建一条不接收更新的连接"""
+    session = MemorySession()
+    session.set_dc(monitor_client.session.dc_id, monitor_client.session.server_address, monitor_client.session.port)
+    session.auth_key = monitor_client.session.auth_key
+    client = TelegramClient(session, Config.API_ID, Config.API_HASH, proxy=proxy, receive_updates=False)
+    await client.connect()
+    return client
+
+
+async def open_monitor(session_name: str, proxy) -> TelegramClient:
+    """连接并登录一个监听账号（未登录时在控制台输入手机号与验证码）"""
+    monitor_client = TelegramClient(session_name, Config.API_ID, Config.API_HASH, proxy=proxy)
     await monitor_client.connect()
 
     if not await monitor_client.is_user_authorized():
-        phone = input('请输入监听账号手机号: ')
+        phone = input(f'请输入监听账号（{session_name}）手机号: ')
         y = await monitor_client.send_code_request(phone)
         code = input('输入验证码: ')
         try:
@@ -356,19 +2217,117 @@ async def start_monitor() -> None:
             password = input("请输入2FA 密码: ")
             await monitor_client.sign_in(password=password)
 
-    me = await monitor_client.get_me()
-    logger.info(f"监听账号登录成功: {me.phone}")
+    me = await get_me_cached(monitor_client)
+    logger.info(f"监听账号 {session_name} 登录成功: {me.phone}")
+    return monitor_client
 
-    for group in Config.SOURCE_GROUPS:
-        await check_and_join_source(monitor_client, group)
 
-    logger.info("开始监听消息")
+async def run_monitor(name: str, client: TelegramClient) -> None:
+    try:
+        await client.run_until_disconnected()
+    except Exception as e:
+        logger.error(f"监听账号 {name} 出错: {e}")
+    remaining = sum(1 for c in monitor_clients.values() if c is not client and c.is_connected())
+    logger.warning(f"监听账号 {name} 已断开，其余 {remaining} 个监听账号继续接收消息")
 
-    @monitor_client.on(events.NewMessage(chats=Config.SOURCE_GROUPS))
-    async def handler(event: telethon.events.NewMessage.Event):
+
+async def start_monitor(ready: Optional[asyncio.Event] = None) -> None:
+    """
+    用 [monitor] sessions 中的全部账号监听源群组；第一个可用的账号负责补发与预热，
+    每个账号各自下载自己收到的消息里的大文件。
+    ready 在处理函数注册完成后置位（启动阶段结束，之后一直运行到全部监听账号断开）。
+    """
+    monitors: Dict[str, TelegramClient] = {}
+    proxies = {}
+    for i, name in enumerate(Config.MONITOR_SESSIONS):
+        proxies[name] = Config.PROXY or proxy_pool.assign("__monitor__" if i == 0 else f"__monitor__{name}")
         try:
-            await clone_and_forward_message(event, monitor_client)
+            monitors[name] = await open_monitor(name, proxies[name])
         except Exception as e:
-            logger.error(f"处理消息时出错: {e}")
+            logger.error(f"监听账号 {name} 启动失败，跳过: {e}")
+    if not monitors:
+        raise RuntimeError("没有可用的监听账号")
+    monitor_client = next(iter(monitors.values()))
+
+    download_connections = []
+    for name, client in monitors.items():
+        try:
+            download_client = await open_download_client(client, proxies[name])
+        except Exception as e:
+            logger.warning(f"监听账号 {name} 建立大文件下载连接失败，大文件将使用监听连接下载: {e}")
+            continue
+        download_connections.append(download_client)
+        transfer_lanes.download_clients[client] = ParallelDownloader(
+            download_client, Config.DOWNLOAD_CONNECTIONS, Config.DOWNLOAD_PART_SIZE)
+
+    for client in monitors.values():
+        for group in Config.SOURCE_GROUPS:
+            await check_and_join_source(client, group)
+
+    source_chats = []
+    for group in Config.SOURCE_GROUPS:
+        try:
+            source_chats.append(utils.get_peer_id(await monitor_client.get_input_entity(group)))
+        except Exception as e:
+            logger.error(f"解析源群组 {group} 失败，跳过补发与成员预热: {e}")
 
-    await monitor_client.run_until_disconnected()
\ No newline at end of file
+    # 先标记需要补发的群组，实时消息会在补发结束后再处理
+    checkpoints.load()
+    backfill_chats = source_chats if Config.BACKFILL_ENABLED else []
+    for chat_id in backfill_chats:
+        checkpoints.begin_backfill(chat_id)
+    members.load()
+    try:
+        await file_blacklist.refresh_async()
+    except Exception as e:
+        logger.error(f"加载文件黑名单失败: {e}")
+    # 读取日志要在注册处理函数之前，避免新消息的记录混入上次未完成的列表
+    unfinished = journal.load() if Config.JOURNAL_ENABLED else []
+    if Config.JOURNAL_ENABLED:
+        checkpoints.merge(journal.checkpoints)
+
+    logger.info(f"开始监听消息（{len(monitors)} 个监听账号）")
+
+    # 所有监听账号共用同一组处理函数，同一事件只处理最先到达的一次
+    on_message = build_message_handler(monitor_client)
+    on_edit, on_delete = build_edit_delete_handlers()
+    for name, client in monitors.items():
+        monitor_events.register(name)
+        client.add_event_handler(arbitrated(on_message, name, new_message_key),
+                                 events.NewMessage(chats=Config.SOURCE_GROUPS))
+        client.add_event_handler(arbitrated(on_edit, name, edit_key), events.MessageEdited(chats=Config.SOURCE_GROUPS))
+        # 普通群组的删除事件不带 chat_id，无法按 chats 过滤，由消息索引判断是否属于源群组
+        client.add_event_handler(arbitrated(on_delete, name, delete_key), events.MessageDeleted())
+    monitor_clients.update(monitors)
+
+    background = [asyncio.create_task(checkpoints.autosave()),
+                  asyncio.create_task(journal.run()),
+                  asyncio.create_task(disconnect_idle_clients()),
+                  asyncio.create_task(health_sweep()),
+                  asyncio.create_task(workspace.run_janitor(Config.WORKSPACE_JANITOR_INTERVAL))]
+    if proxy_pool.proxies:
+        background.append(asyncio.create_task(proxy_pool.run_health_checks()))
+    if Config.WARMUP_ENABLED and source_chats:
+        background.append(asyncio.create_task(refresh_members(monitor_client, source_chats)))
+    if unfinished:
+        background.append(asyncio.create_task(replay_journal(monitor_client, unfinished)))
+    if backfill_chats:
+        background.append(asyncio.create_task(run_backfill(monitor_client, backfill_chats)))
+    if ready is not None:
+        ready.set()
+    try:
+        # 某个账号断开时其余账号照常接收，全部断开才结束
+        await asyncio.gather(*(run_monitor(name, client) for name, client in monitors.items()))
+    finally:
+        for task in background:
+            task.cancel()
+        checkpoints.save()
+        journal.flush()
+        downloaders, transfer_lanes.download_clients = transfer_lanes.download_clients, {}
+        for downloader in downloaders.values():
+            await downloader.close()
+        for download_client in download_connections:
+            await download_client.disconnect()
+        monitor_clients.clear()
+        for client in monitors.values():
+            await client.disconnect()
\ No newline at end of file
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内容去重窗口
+
+同一条推广消息被转发到多个源群组，或几分钟内被反复重发时，只克隆转发第一条。
+指纹 = 规范化后的文本 + 媒体 id 的哈希，相册整组一个指纹；精确模式在内存中保存窗口内的指纹（有条目上限），
+Bloom 模式用两代轮换的 Bloom 过滤器，内存固定，适合很长的窗口，代价是少量误判。
+调用方先用 seen() 判断，消息真正发出后再 add()，被规则过滤、跳过或发送失败的第一条不会挡住之后的相同内容。
+"""
+import hashlib
+import math
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+from rules import media_kind
+
+_SPACES = re.compile(r"\s+")
+NEVER_DEDUPE = ("sticker", "gif")  # 群里常用的贴纸/GIF，不同成员发同一个很正常
+
+
+def normalize_text(text: str) -> str:
+    """全角/半角、大小写、空白差异不影响指纹"""
+    return _SPACES.sub(" ", unicodedata.normalize("NFKC", text or "")).strip().casefold()
+
+
+def media_id(message) -> Optional[int]:
+    media = getattr(message, "media", None)
+    if media is None:
+        return None
+    for name in ("photo", "document"):
+        item = getattr(media, name, None)
+        if item is not None and getattr(item, "id", None) is not None:
+            return item.id
+    return None
+
+
+def fingerprint(messages: Sequence, min_length: int = 0, media_only: bool = False) -> Optional[bytes]:
+    """
+    一条消息或整个相册的指纹；不参与去重时返回 None：
+    含贴纸/GIF 的消息，以及文字短于 min_length 的消息（如“好的”、没有说明的图片；media_only 时没有说明的媒体仍参与）
+    """
+    if any(m.media is not None and media_kind(m) in NEVER_DEDUPE for m in messages):
+        return None
+    text = normalize_text(" ".join(getattr(m, "raw_text", None) or "" for m in messages))
+    file_ids = [media_id(m) for m in messages]
+    has_media = any(i is not None for i in file_ids)
+    if len(text) < min_length and not (media_only and has_media):
+        return None
+    if not text and not has_media:
+        return None
+    return hashlib.blake2b(f"{file_ids}\x00{text}".encode(), digest_size=16).digest()
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: bytes):
+        # 双重哈希：由 16 字节指纹的两半派生 k 个位置
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key: bytes) -> None:
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+class DedupeWindow:
+    """
+    seen(key) 返回 True 表示窗口内已成功转发过相同内容（应跳过）；add(key) 在转发成功后记录指纹
+
+    精确模式：OrderedDict 按时间顺序保存指纹，过期或超过 max_entries 时从最早的开始淘汰。
+    Bloom 模式：当前代与上一代两个过滤器，每个窗口轮换一次，
+    因此重复内容在 window 到 2*window 之间都能被识别；过滤器大小按 max_entries 与 error_rate 计算。
+    """
+
+    def __init__(self, window: float = 600.0, max_entries: int = 100_000, min_length: int = 10,
+                 bloom: bool = False, error_rate: float = 0.001, media_only: bool = False, clock=time.monotonic):
+        self.clock = clock
+        self.checks = 0
+        self.hits = 0
+        self.configure(window, max_entries, min_length, bloom, error_rate, media_only)
+
+    def configure(self, window: float = 600.0, max_entries: int = 100_000, min_length: int = 10,
+                  bloom: bool = False, error_rate: float = 0.001, media_only: bool = False) -> None:
+        """更新参数；模式或容量变化时清空已记录的指纹"""
+        reset = (getattr(self, "bloom", None) != bloom or getattr(self, "max_entries", None) != max_entries
+                 or getattr(self, "error_rate", None) != error_rate)
+        self.window = window
+        self.max_entries = max(1, max_entries)
+        self.min_length = min_length
+        self.media_only = media_only
+        self.bloom = bloom
+        self.error_rate = error_rate
+        if reset:
+            self._seen: "OrderedDict[bytes, float]" = OrderedDict()
+            self._filters = [BloomFilter(self.max_entries, error_rate), BloomFilter(self.max_entries, error_rate)]
+            self._rotated = self.clock()
+
+    def __len__(self) -> int:
+        return sum(f.count for f in self._filters) if self.bloom else len(self._seen)
+
+    def fingerprint(self, messages: Sequence) -> Optional[bytes]:
+        return fingerprint(messages, self.min_length, self.media_only)
+
+    def seen(self, key: bytes) -> bool:
+        self.checks += 1
+        now = self.clock()
+        if self.bloom:
+            self._rotate(now)
+            duplicate = any(key in f for f in self._filters)
+        else:
+            self._expire(now)
+            duplicate = key in self._seen
+        if duplicate:
+            self.hits += 1
+        return duplicate
+
+    def add(self, key: bytes) -> None:
+        now = self.clock()
+        if self.bloom:
+            self._rotate(now)
+            self._filters[0].add(key)
+        else:
+            self._expire(now)
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+
+    def _expire(self, now: float) -> None:
+        seen = self._seen
+        while seen:
+            seen_at = next(iter(seen.values()))
+            if now - seen_at < self.window and len(seen) < self.max_entries:
+                break
+            seen.popitem(last=False)
+
+    def _rotate(self, now: float) -> None:
+        current = self._filters[0]
+        if now - self._rotated >= self.window or current.count >= self.max_entries:
+            self._filters = [BloomFilter(self.max_entries, self.error_rate), current]
+            self._rotated = now
+
+    def stats(self) -> dict:
+        return {"checks": self.checks, "hits": self.hits, "entries": len(self),
+                "hit_rate": self.hits / self.checks if self.checks else 0.0}
@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线测试用的 TelegramClient 替身与事件回放驱动
+
+不连接 Telegram，在本地模拟 send_message / send_file / download_media /
+get_profile_photos 等调用，可配置延迟、FloodWait 与 FROZEN 错误，
+用于回放录制或合成的 NewMessage 事件并压测 core 的转发流程。
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from telethon.errors import FloodWaitError, RPCError, UserNotParticipantError
+
+FAKE_PART_SIZE = 512 * 1024  # download_media 顺序下载时每片的大小
+
+
+class FakeUser:
+    def __init__(self, user_id: int, first_name: str = "", last_name: str = "",
+                 bot: bool = False, phone: Optional[str] = None, photo_count: int = 1):
+        self.id = user_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.bot = bot
+        self.phone = phone
+        self.username = None
+        self.restricted = False
+        self.deleted = False
+        self.photo_count = photo_count
+
+
+class FakePhoto:
+    def __init__(self, photo_id: int, size: int = 16 * 1024):
+        self.id = photo_id
+        self.access_hash = photo_id * 7
+        self.file_reference = b"ref"
+        self.video_sizes = None
+        self.size = size
+
+
+class FakeDocument:
+    def __init__(self, doc_id: int, size: int, mime_type: str = "video/mp4"):
+        self.id = doc_id
+        self.access_hash = doc_id * 7
+        self.file_reference = b"ref"
+        self.size = size
+        self.mime_type = mime_type
+        self.attributes = []
+
+
+class FakeMedia:
+    def __init__(self, kind: str, media_id: int, size: int):
+        self.kind = kind
+        if kind == "photo":
+            self.photo = FakePhoto(media_id, size)
+        else:
+            self.document = FakeDocument(media_id, size)
+
+    @property
+    def size(self) -> int:
+        return (getattr(self, "photo", None) or self.document).size
+
+    @property
+    def file_id(self) -> int:
+        return (getattr(self, "photo", None) or self.document).id
+
+
+class FakeFile:
+    def __init__(self, media: FakeMedia):
+        self.size = media.size
+        self.name = None
+        self.mime_type = getattr(getattr(media, "document", None), "mime_type", "image/jpeg")
+
+
+class FakeReplyHeader:
+    def __init__(self, reply_to_msg_id: int):
+        self.reply_to_msg_id = reply_to_msg_id
+
+
+class FakeMessage:
+    def __init__(self, chat_id: int, msg_id: int, text: str = "", sender: Optional[FakeUser] = None,
+                 media: Optional[FakeMedia] = None, reply_to_msg_id: Optional[int] = None,
+                 grouped_id: Optional[int] = None, date: Optional[datetime] = None):
+        self.chat_id = chat_id
+        self.id = msg_id
+        self.text = text
+        self.raw_text = text
+        self.message = text
+        self.entities = None
+        self.media = media
+        self.file = FakeFile(media) if media else None
+        self.reply_to = FakeReplyHeader(reply_to_msg_id) if reply_to_msg_id else None
+        self.grouped_id = grouped_id
+        self.date = date or datetime.now(timezone.utc)
+        self.sender = sender
+        self.sender_id = sender.id if sender else None
+        self.fwd_from = None
+
+    @property
+    def is_reply(self) -> bool:
+        return self.reply_to is not None
+
+    @property
+    def reply_to_msg_id(self) -> Optional[int]:
+        return self.reply_to.reply_to_msg_id if self.reply_to else None
+
+    async def get_sender(self) -> Optional[FakeUser]:
+        return self.sender
+
+
+class FakeEvent:
+    """模拟 events.NewMessage.Event 的最小接口"""
+
+    def __init__(self, message: FakeMessage, source: Optional["FakeTelegramServer"] = None):
+        self.message = message
+        self.chat_id = message.chat_id
+        self.sender_id = message.sender_id
+        self._source = source
+
+    async def get_sender(self) -> Optional[FakeUser]:
+        return self.message.sender
+
+    async def get_reply_message(self) -> Optional[FakeMessage]:
+        if not self.message.reply_to or not self._source:
+            return None
+        self._source.calls["get_reply_message"] += 1
+        await self._source.sleep_latency()
+        return self._source.get_message(self.chat_id, self.message.reply_to.reply_to_msg_id)
+
+
+class FakeDeletedEvent:
+    """模拟 events.MessageDeleted.Event；普通群组的删除事件 chat_id 为 None"""
+
+    def __init__(self, deleted_ids: List[int], chat_id: Optional[int] = None):
+        self.deleted_ids = deleted_ids
+        self.deleted_id = deleted_ids[0] if deleted_ids else None
+        self.chat_id = chat_id
+
+
+class FakeTelegramServer:
+    """所有替身客户端共享的"服务端"状态：消息 id 分配、已发送消息与调用统计"""
+
+    def __init__(self, latency: Tuple[float, float] = (0.0, 0.0), flood_rate: float = 0.0,
+                 flood_seconds: int = 1, frozen_rate: float = 0.0, seed: Optional[int] = None,
+                 bandwidth: float = 0.0, stale_reference_rate: float = 0.0):
+        self.latency = latency
+        self.bandwidth = bandwidth  # 每个连接的带宽（字节/秒），0 表示不模拟传输耗时
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.frozen_rate = frozen_rate
+        self.stale_reference_rate = stale_reference_rate  # 按引用发送时 file_reference 已过期的媒体比例
+        self.stale_references: set = set()
+        self._checked_references: set = set()
+        self.random = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.bytes_down = 0
+        self.bytes_up = 0
+        self.messages: Dict[Tuple[int, int], FakeMessage] = {}
+        self.sent: Dict[int, FakeMessage] = {}
+        self.members: set = set()  # 已加入目标群组的账号 id
+        self.participants: Dict[int, List[FakeUser]] = {}  # 源群组成员
+        self._ids = itertools.count(1)
+        self.tmp_dir = tempfile.mkdtemp(prefix="fake_tg_")
+
+    async def sleep_latency(self) -> None:
+        low, high = self.latency
+        if high > 0:
+            await asyncio.sleep(self.random.uniform(low, high))
+        else:
+            await asyncio.sleep(0)
+
+    def get_message(self, chat_id: int, msg_id: int) -> Optional[FakeMessage]:
+        return self.messages.get((chat_id, msg_id))
+
+    def add_source_message(self, message: FakeMessage) -> None:
+        self.messages[(message.chat_id, message.id)] = message
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def reference_expired(self, media: FakeMedia) -> bool:
+        """每个媒体第一次按引用发送时按比例决定引用是否已过期；重新获取源消息后恢复有效"""
+        if media.file_id not in self._checked_references:
+            self._checked_references.add(media.file_id)
+            if self.stale_reference_rate and self.random.random() < self.stale_reference_rate:
+                self.stale_references.add(media.file_id)
+        return media.file_id in self.stale_references
+
+
+class FakeFileConnection:
+    """并行下载/上传使用的连接替身：每条连接独立的带宽，按请求的分片大小计时"""
+
+    def __init__(self, server: FakeTelegramServer):
+        self.server = server
+        self._link = asyncio.Lock()
+
+    async def send(self, request):
+        server = self.server
+        uploading = hasattr(request, "bytes")
+        if uploading:
+            chunk = len(request.bytes)
+            server.calls["save_file_part"] += 1
+        else:
+            chunk = max(0, min(request.limit, getattr(request.location, "size", 0) - request.offset))
+            server.calls["get_file"] += 1
+        await server.sleep_latency()
+        if server.bandwidth:
+            async with self._link:
+                await asyncio.sleep(chunk / server.bandwidth)
+        if uploading:
+            server.bytes_up += chunk
+            return True
+        server.bytes_down += chunk
+        return SimpleNamespace(bytes=bytes(chunk))
+
+    async def disconnect(self) -> None:
+        pass
+
+
+async def fake_file_connections(server: FakeTelegramServer, dc_id: int, count: int) -> List[FakeFileConnection]:
+    return [FakeFileConnection(server) for _ in range(count)]
+
+
+def fake_file_location(message) -> Tuple[int, object, int]:
+    media = getattr(message, "media", None) or message
+    return 2, media, getattr(media, "size", 0)
+
+
+class FakeTelegramClient:
+    """TelegramClient 替身，只实现 core 用到的方法"""
+
+    def __init__(self, server: FakeTelegramServer, phone: str, frozen: bool = False):
+        self.server = server
+        self.phone = phone
+        self.frozen = frozen
+        self.me = FakeUser(int(phone) if phone.isdigit() else abs(hash(phone)) % 10 ** 9, phone=phone)
+        self.session = type("FakeSession", (), {"filename": f"sessions/{phone}.session", "dc_id": 2})()
+        self._connected = False
+        self.proxy = None
+        self._link = asyncio.Lock()  # 一个连接同一时刻只传输一个请求的数据，大文件会阻塞后面的小请求
+
+    def __repr__(self):
+        return f"<FakeTelegramClient {self.phone}>"
+
+    async def _transfer(self, size: int) -> None:
+        if self.server.bandwidth:
+            async with self._link:
+                await asyncio.sleep(size / self.server.bandwidth)
+
+    async def _rpc(self, name: str, write: bool = True, size: int = 0) -> None:
+        server = self.server
+        server.calls[name] += 1
+        await server.sleep_latency()
+        await self._transfer(size)
+        if write and (self.frozen or (server.frozen_rate and server.random.random() < server.frozen_rate)):
+            self.frozen = True
+            raise RPCError(None, "FROZEN_METHOD_INVALID", 400)
+        if write and server.flood_rate and server.random.random() < server.flood_rate:
+            raise FloodWaitError(None, capture=server.flood_seconds)
+
+    async def connect(self) -> None:
+        self._connected = True
+
+    async def disconnect(self) -> None:
+        self._connected = False
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def set_proxy(self, proxy) -> None:
+        self.proxy = proxy
+
+    async def is_user_authorized(self) -> bool:
+        return True
+
+    async def get_me(self, input_peer: bool = False) -> FakeUser:
+        await self._rpc("get_me", write=False)
+        return self.me
+
+    async def get_input_entity(self, peer):
+        await self._rpc("get_input_entity", write=False)
+        return peer
+
+    async def get_profile_photos(self, entity, limit: Optional[int] = None) -> List[FakePhoto]:
+        await self._rpc("get_profile_photos", write=False)
+        count = getattr(entity, "photo_count", 0)
+        photos = [FakePhoto(getattr(entity, "id", 0) * 10 + i) for i in range(count)]
+        return photos[:limit] if limit else photos
+
+    async def download_media(self, message, file=None) -> Optional[str]:
+        media = getattr(message, "media", None) or message
+        size = getattr(media, "size", 0)
+        # 与 telethon 一样在一条连接上逐片顺序请求，每片一个往返
+        await self._rpc("download_media", write=False, size=min(size, FAKE_PART_SIZE))
+        for _ in range(FAKE_PART_SIZE, size, FAKE_PART_SIZE):
+            await self.server.sleep_latency()
+            await self._transfer(FAKE_PART_SIZE)
+        if not size:
+            return None
+        path = file if isinstance(file, str) else os.path.join(
+            self.server.tmp_dir, f"{self.phone}_{self.server.next_id()}.bin")
+        with open(path, "wb") as f:
+            f.truncate(size)
+        self.server.bytes_down += size
+        return path
+
+    async def _upload_sequential(self, size: int) -> None:
+        """与 telethon 一样逐片上传，每片一个往返"""
+        for _ in range(0, size, FAKE_PART_SIZE):
+            await self.server.sleep_latency()
+            await self._transfer(FAKE_PART_SIZE)
+        self.server.bytes_up += size
+
+    async def upload_file(self, file, **kwargs):
+        await self._rpc("upload_file")
+        if isinstance(file, str) and os.path.exists(file):
+            await self._upload_sequential(os.path.getsize(file))
+        return object()
+
+    def _store(self, entity, text: str, media=None, reply_to: Optional[int] = None) -> FakeMessage:
+        msg = FakeMessage(0, self.server.next_id(), text=text or "", sender=self.me,
+                          media=media, reply_to_msg_id=reply_to)
+        self.server.sent[msg.id] = msg
+        return msg
+
+    async def send_message(self, entity, message: str = "", reply_to: Optional[int] = None, **kwargs) -> FakeMessage:
+        await self._rpc("send_message")
+        return self._store(entity, message, reply_to=reply_to)
+
+    async def send_file(self, entity, file, caption=None, reply_to: Optional[int] = None, **kwargs):
+        files = file if isinstance(file, (list, tuple)) else [file]
+        await self._rpc("send_file")
+        references = [f for f in files if isinstance(f, FakeMedia)]
+        if references:
+            # 按引用发送：不传输文件数据，引用过期时与服务端一样报错
+            self.server.calls["send_by_reference"] += 1
+            if any([self.server.reference_expired(f) for f in references]):
+                raise RPCError(None, "FILE_REFERENCE_EXPIRED", 400)
+        for f in files:
+            if isinstance(f, str) and os.path.exists(f):
+                await self._upload_sequential(os.path.getsize(f))
+        captions = caption if isinstance(caption, (list, tuple)) else [caption] + [""] * (len(files) - 1)
+        sent = []
+        for f, cap in zip(files, captions):
+            sent.append(self._store(entity, cap or "", reply_to=reply_to))
+        return sent if isinstance(file, (list, tuple)) else sent[0]
+
+    async def iter_participants(self, entity, limit: Optional[int] = None, filter=None):
+        """按 200 人一页返回源群组成员，每页计一次请求"""
+        users = self.server.participants.get(entity, [])[:limit]
+        for start in range(0, len(users), 200):
+            await self._rpc("get_participants", write=False)
+            for user in users[start:start + 200]:
+                yield user
+
+    async def iter_messages(self, entity, limit: Optional[int] = None, min_id: int = 0, max_id: int = 0,
+                            reverse: bool = False, **kwargs):
+        await self._rpc("iter_messages", write=False)
+        ids = sorted((msg_id for chat, msg_id in self.server.messages if chat == entity
+                      and msg_id > min_id and (not max_id or msg_id < max_id)), reverse=not reverse)
+        for msg_id in ids[:limit] if limit else ids:
+            yield self.server.messages[(entity, msg_id)]
+
+    async def get_messages(self, entity, limit: Optional[int] = None, ids: Optional[List[int]] = None,
+                           **kwargs) -> List[FakeMessage]:
+        if ids is not None:
+            await self._rpc("get_messages", write=False)
+            found = [self.server.messages.get((entity, msg_id)) for msg_id in ids]
+            for message in found:
+                if message is not None and message.media is not None:
+                    self.server.stale_references.discard(message.media.file_id)  # 新取到的消息带着新的引用
+            return found
+        return [m async for m in self.iter_messages(entity, limit=limit, **kwargs)]
+
+    async def edit_message(self, entity, message, text: Optional[str] = None, **kwargs) -> FakeMessage:
+        await self._rpc("edit_message")
+        sent = self.server.sent[message]
+        sent.text = sent.raw_text = text or ""
+        return sent
+
+    async def delete_messages(self, entity, message_ids, **kwargs) -> list:
+        await self._rpc("delete_messages")
+        ids = message_ids if isinstance(message_ids, (list, tuple)) else [message_ids]
+        for msg_id in ids:
+            self.server.sent.pop(msg_id, None)
+        return []
+
+    async def __call__(self, request):
+        name = type(request).__name__
+        if name in ("SaveFilePartRequest", "SaveBigFilePartRequest"):
+            await self._rpc("save_file_part", write=False, size=len(request.bytes))
+            self.server.bytes_up += len(request.bytes)
+            return True
+        await self._rpc(name, write=name != "GetParticipantRequest")
+        if name == "GetParticipantRequest" and self.me.id not in self.server.members:
+            raise UserNotParticipantError(request)
+        if name == "JoinChannelRequest":
+            self.server.members.add(self.me.id)
+        return None
+
+
+def synthetic_events(server: FakeTelegramServer, count: int, senders: int = 100, chat_id: int = -1001000000001,
+                     media_ratio: float = 0.0, media_size: int = 256 * 1024, reply_ratio: float = 0.0,
+                     album_ratio: float = 0.0, large_ratio: float = 0.0, large_size: int = 50 * 1024 * 1024,
+                     duplicate_ratio: float = 0.0, seed: Optional[int] = None) -> List[FakeEvent]:
+    """
+    生成合成事件：指定发送者数量、媒体占比、回复占比、相册占比（每个相册 2-10 张）、大文件占媒体的比例，
+    以及重复内容的占比（由任意发送者重发之前某条单条消息的文本与媒体）
+    """
+    rnd = random.Random(seed)
+    users = [FakeUser(10_000 + i, first_name=f"user{i}", last_name="") for i in range(senders)]
+    server.participants[chat_id] = users
+    events = []
+    msg_id = 0
+    singles: List[FakeMessage] = []
+    while msg_id < count:
+        sender = users[rnd.randrange(senders)]
+        if singles and rnd.random() < duplicate_ratio:
+            original = rnd.choice(singles)
+            msg_id += 1
+            message = FakeMessage(chat_id, msg_id, text=original.text, sender=sender, media=original.media)
+            server.add_source_message(message)
+            events.append(FakeEvent(message, server))
+            continue
+        reply_to = rnd.randrange(1, msg_id + 1) if msg_id and rnd.random() < reply_ratio else None
+        if rnd.random() < album_ratio:
+            size, grouped_id = rnd.randint(2, 10), rnd.getrandbits(62)
+        else:
+            size, grouped_id = 1, None
+        for i in range(min(size, count - msg_id)):
+            msg_id += 1
+            media = None
+            if grouped_id or rnd.random() < media_ratio:
+                if large_ratio and not grouped_id and rnd.random() < large_ratio:
+                    media = FakeMedia("video", msg_id, large_size)
+                else:
+                    media = FakeMedia("photo" if rnd.random() < 0.5 else "video", msg_id, media_size)
+            message = FakeMessage(chat_id, msg_id, text=f"message {msg_id}" if i == 0 else "", sender=sender,
+                                  media=media, reply_to_msg_id=reply_to if i == 0 else None, grouped_id=grouped_id)
+            server.add_source_message(message)
+            events.append(FakeEvent(message, server))
+            if not grouped_id:
+                singles.append(message)
+    return events
+
+
+def load_recording(server: FakeTelegramServer, path: str) -> List[Tuple[float, FakeEvent]]:
+    """
+    读取录制的事件（JSONL，每行一条），返回 (相对时间, 事件) 列表
+
+    字段: chat_id, id, sender_id, first_name, last_name, bot, text,
+          media_kind, media_size, reply_to, grouped_id, t（相对秒数，可选）
+    """
+    users: Dict[int, FakeUser] = {}
+    result = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            sender_id = int(row["sender_id"])
+            user = users.get(sender_id)
+            if user is None:
+                user = users[sender_id] = FakeUser(sender_id, row.get("first_name", ""),
+                                                   row.get("last_name", ""), bot=row.get("bot", False))
+            media = None
+            if row.get("media_kind"):
+                media = FakeMedia(row["media_kind"], int(row["id"]), int(row.get("media_size", 0)))
+            message = FakeMessage(int(row["chat_id"]), int(row["id"]), text=row.get("text", ""),
+                                  sender=user, media=media, reply_to_msg_id=row.get("reply_to"),
+                                  grouped_id=row.get("grouped_id"))
+            server.add_source_message(message)
+            result.append((float(row.get("t", 0.0)), FakeEvent(message, server)))
+    return result
+
+
+async def replay(events: Iterable, handler, rate: Optional[float] = None,
+                 timed: bool = False) -> List[float]:
+    """
+    按 telethon 的方式（每个更新一个 task）把事件交给 handler，返回每条事件的处理耗时
+
+    events: FakeEvent 或 (相对时间, FakeEvent)；timed=True 时按录制时间间隔投递
+    rate:   每秒投递事件数上限，None 表示尽快投递
+    """
+    latencies: List[float] = []
+
+    async def run(event):
+        start = time.perf_counter()
+        await handler(event)
+        latencies.append(time.perf_counter() - start)
+
+    tasks = []
+    begin = time.perf_counter()
+    for i, item in enumerate(events):
+        offset, event = item if isinstance(item, tuple) else (None, item)
+        if timed and offset is not None:
+            delay = offset - (time.perf_counter() - begin)
+        elif rate:
+            delay = i / rate - (time.perf_counter() - begin)
+        else:
+            delay = 0
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run(event)))
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies
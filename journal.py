@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+已接收未发送消息的预写日志
+
+处理函数接收一条消息时记一条 accept，处理完成后记一条 done；程序崩溃或关闭时被取消的消息
+只有 accept 没有 done，下次启动时重新转发。发送请求一返回就记一条 sent（目标消息 id 与克隆账号），
+之后没来得及记 done 的消息在重新转发前据此判断已经发出过，不会重复发送。每次重启重新转发前记一条 replay
+（第几次），一直转发失败的消息超过次数上限后由调用方放弃，不会每次启动都重试。每个群组已转发到的位置
+（补发进度）也随同一次提交写入，崩溃后启动时不会落后于 done 记录。记录先放进内存缓冲区，
+由 run() 每隔 interval 在线程池中批量写入并 fsync（组提交），事件循环上每条消息只有一次内存追加。
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[int, int]  # (chat_id, msg_id)
+Sent = Tuple[int, Optional[str]]  # (目标消息 id, 发送它的克隆账号 session 名)
+State = Tuple[List[Key], Dict[Key, Sent], Dict[Key, int], Dict[int, int]]  # 压缩日志用的 (未完成, 已发出, 重新转发次数, 进度)
+
+
+class Journal:
+    def __init__(self, path: str = "setting/journal.log", interval: float = 0.05, fsync: bool = True,
+                 compact_after: int = 10_000):
+        self.path = path
+        self.interval = interval
+        self.fsync = fsync
+        self.compact_after = compact_after
+        self.pending: Dict[Key, None] = {}  # 未完成的消息，按接收顺序
+        self.sent: Dict[Key, Sent] = {}  # 未完成但已经发出的消息
+        self.replays: Dict[Key, int] = {}  # 未完成的消息已在重启后重新转发过几次
+        self.checkpoints: Dict[int, int] = {}  # {chat_id: 已转发到的最大消息 id}
+        self._checkpoints_dirty: set = set()  # 上次提交后推进过的群组，每次提交每个群组只写一条
+        self._buffer: List[str] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._file = None
+        self._lines = 0  # 上次压缩后写入的行数
+        self._write_lock = threading.Lock()
+        self.commits = 0
+        self.records = 0
+
+    def load(self) -> List[Key]:
+        """读取日志，返回上次运行中未完成的消息，并把日志压缩成只含这些消息"""
+        pending: Dict[Key, None] = {}
+        sent: Dict[Key, Sent] = {}
+        replays: Dict[Key, int] = {}
+        checkpoints: Dict[int, int] = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        op, chat_id, msg_id, *extra = json.loads(line)
+                    except ValueError:
+                        continue  # 崩溃时写了一半的最后一行
+                    key = (chat_id, msg_id)
+                    if op == "A":
+                        pending[key] = None
+                    elif op == "S":
+                        if key in pending:
+                            sent[key] = (extra[0], extra[1] if len(extra) > 1 else None)
+                    elif op == "R":
+                        if key in pending:
+                            replays[key] = extra[0]
+                    elif op == "C":
+                        checkpoints[chat_id] = max(msg_id, checkpoints.get(chat_id, 0))
+                    else:
+                        pending.pop(key, None)
+                        sent.pop(key, None)
+                        replays.pop(key, None)
+        except FileNotFoundError:
+            pass
+        self.pending = pending
+        self.sent = sent
+        self.replays = replays
+        self.checkpoints = checkpoints
+        self._checkpoints_dirty = set()
+        self._lines = len(pending) + len(sent) + len(replays) + len(checkpoints)
+        with self._write_lock:
+            self._compact(list(pending), dict(sent), dict(replays), dict(checkpoints))
+        return list(pending)
+
+    def accept(self, chat_id: int, msg_id: int) -> None:
+        key = (chat_id, msg_id)
+        if key in self.pending:
+            return
+        self.pending[key] = None
+        self._append("A", chat_id, msg_id)
+
+    def mark_sent(self, chat_id: int, msg_id: int, target_id: int, client_name: Optional[str] = None) -> None:
+        """发送请求已返回；只记录日志中未完成的消息"""
+        key = (chat_id, msg_id)
+        if key in self.pending and key not in self.sent:
+            self.sent[key] = (target_id, client_name)
+            self._buffer.append(json.dumps(["S", chat_id, msg_id, target_id, client_name], ensure_ascii=False) + "\n")
+            if self._wake is not None:
+                self._wake.set()
+
+    def replayed(self, chat_id: int, msg_id: int) -> int:
+        """重启后准备重新转发一条未完成的消息，返回这是第几次（先记录再转发，转发时崩溃也算一次）"""
+        key = (chat_id, msg_id)
+        if key not in self.pending:
+            return 0
+        count = self.replays.get(key, 0) + 1
+        self.replays[key] = count
+        self._buffer.append(f'["R",{chat_id},{msg_id},{count}]\n')
+        if self._wake is not None:
+            self._wake.set()
+        return count
+
+    def done(self, chat_id: int, msg_id: int) -> None:
+        key = (chat_id, msg_id)
+        if key in self.pending:
+            del self.pending[key]
+            self.sent.pop(key, None)
+            self.replays.pop(key, None)
+            self._append("D", chat_id, msg_id)
+
+    def checkpoint(self, chat_id: int, msg_id: int) -> None:
+        """群组已转发到 msg_id：与其他记录一起组提交（同一批内只写最新的位置）"""
+        if msg_id > self.checkpoints.get(chat_id, 0):
+            self.checkpoints[chat_id] = msg_id
+            self._checkpoints_dirty.add(chat_id)
+            if self._wake is not None:
+                self._wake.set()
+
+    def is_pending(self, chat_id: int, msg_id: int) -> bool:
+        return (chat_id, msg_id) in self.pending
+
+    def sent_target(self, chat_id: int, msg_id: int) -> Optional[Sent]:
+        return self.sent.get((chat_id, msg_id))
+
+    def _append(self, op: str, chat_id: int, msg_id: int) -> None:
+        self._buffer.append(f'["{op}",{chat_id},{msg_id}]\n')
+        if self._wake is not None:
+            self._wake.set()
+
+    def _take_batch(self) -> Tuple[List[str], Optional[State]]:
+        """在事件循环线程上取走缓冲区；写入行数过多时附带当前未完成列表（及其中已发出的、重新转发次数）与进度，用于压缩"""
+        batch, self._buffer = self._buffer, []
+        batch.extend(f'["C",{chat_id},{self.checkpoints[chat_id]}]\n' for chat_id in self._checkpoints_dirty)
+        self._checkpoints_dirty = set()
+        self._lines += len(batch)
+        snapshot = None
+        if self._lines >= self.compact_after:
+            snapshot = (list(self.pending), dict(self.sent), dict(self.replays), dict(self.checkpoints))
+            self._lines = len(self.pending) + len(self.sent) + len(self.replays) + len(self.checkpoints)
+        return batch, snapshot
+
+    def _write(self, batch: List[str], snapshot: Optional[State] = None) -> None:
+        with self._write_lock:
+            if snapshot is not None:
+                # 未完成列表已包含这一批的结果，直接重写日志
+                self._compact(*snapshot)
+            else:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write("".join(batch))
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            self.commits += 1
+            self.records += len(batch)
+
+    def _compact(self, pending: List[Key], sent: Dict[Key, Sent], replays: Dict[Key, int],
+                 checkpoints: Dict[int, int]) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(f'["A",{chat_id},{msg_id}]\n' for chat_id, msg_id in pending)
+            f.writelines(json.dumps(["S", chat_id, msg_id, target_id, name], ensure_ascii=False) + "\n"
+                         for (chat_id, msg_id), (target_id, name) in sent.items())
+            f.writelines(f'["R",{chat_id},{msg_id},{count}]\n' for (chat_id, msg_id), count in replays.items())
+            f.writelines(f'["C",{chat_id},{msg_id}]\n' for chat_id, msg_id in checkpoints.items())
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def flush(self) -> None:
+        """同步写入缓冲区（退出时调用）"""
+        if self._buffer or self._checkpoints_dirty:
+            self._write(*self._take_batch())
+
+    async def run(self) -> None:
+        """组提交：有新记录时等待 interval 收集同一批记录，再在线程池中一次写入"""
+        self._wake = asyncio.Event()
+        try:
+            while True:
+                await self._wake.wait()
+                await asyncio.sleep(self.interval)
+                self._wake.clear()
+                try:
+                    await asyncio.to_thread(self._write, *self._take_batch())
+                except Exception as e:
+                    logger.error(f"写入消息日志失败: {e}")
+        finally:
+            self._wake = None
+            self.flush()
+
+    def stats(self) -> dict:
+        return {"pending": len(self.pending), "commits": self.commits, "records": self.records}
+
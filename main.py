@@ -20,9 +20,13 @@ from qasync import QEventLoop
 
 # 你的模块（请确保存在且接口一致）
 from core import (
-    Config, load_config, load_existing_sessions, start_monitor,
-    clients_pool, cloned_users, message_id_mapping, check_and_join_target
+    Config, load_config, load_existing_sessions, start_monitor, watch_config, register_client, recycle_stats,
+    get_me_cached, rpc_cache, bulk_join_target, clients_pool, cloned_users, message_id_mapping,
+    check_and_join_target, cached_me, client_names, proxy_pool, session_db, transfer_lanes, dedupe, journal,
+    account_health, health_stats, HEALTH_LABELS, file_blacklist, reference_stats,
+    workspace, monitor_events, monitor_clients
 )
+from rules import ACTION_LABELS
 
 # 导入使用说明模块
 from help_module import show_help
@@ -52,6 +56,12 @@ class UILogHandler(_logging.Handler):
 # -------------------------
 # Login dialog (async)
 # -------------------------
+def release_login_proxy(phone: str) -> None:
+    """登录未完成时归还代理名额；同名账号已在账号池中时继续占用"""
+    if phone not in client_names.values():
+        proxy_pool.release(phone)
+
+
 class LoginDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -63,6 +73,7 @@ class LoginDialog(QDialog):
         self.code = ""
         self.password = ""
         self._phone_code_hash = None
+        self._proxy_phones = set()  # 发送验证码时占用了代理名额的手机号
 
         self._setup_ui()
 
@@ -135,13 +146,13 @@ class LoginDialog(QDialog):
         try:
             api_id = getattr(Config, "API_ID", None)
             api_hash = getattr(Config, "API_HASH", None)
-            proxy = getattr(Config, "PROXY", None) if hasattr(Config, "PROXY") else None
             if not api_id or not api_hash:
                 raise RuntimeError("Config.API_ID / API_HASH 未设置，请先在配置中填写并重新加载。")
+            proxy = proxy_pool.assign(phone) or getattr(Config, "PROXY", None)
+            self._proxy_phones.add(phone)
 
-            session_name = f"{phone}"
-            # 使用 async client
-            client = TelegramClient(session_name, api_id, api_hash, proxy=proxy)
+            # 使用 async client（与后续登录共用同一个 session，保证 phone_code_hash 有效）
+            client = TelegramClient(session_db.session(phone), api_id, api_hash, proxy=proxy)
             await client.connect()
             res = await client.send_code_request(phone)
             phone_code_hash = getattr(res, "phone_code_hash", None)
@@ -154,6 +165,8 @@ class LoginDialog(QDialog):
                 self.sent_info_label.setText("验证码已发送，请查看短信或 Telegram")
                 logging.info("send_code_request succeeded; phone_code_hash saved.")
         except Exception as e:
+            release_login_proxy(phone)
+            self._proxy_phones.discard(phone)
             self.sent_info_label.setText("发送失败")
             logging.exception("send_code_request error")
             QMessageBox.critical(self, "发送验证码失败", str(e))
@@ -173,8 +186,17 @@ class LoginDialog(QDialog):
         self.phone = phone
         self.code = code
         self.password = password
+        # 改过手机号时，之前发送验证码占用的名额不再使用
+        for other in self._proxy_phones - {phone}:
+            release_login_proxy(other)
         super().accept()
 
+    def reject(self):
+        # 取消或关闭对话框：归还发送验证码时占用的代理名额
+        for phone in self._proxy_phones:
+            release_login_proxy(phone)
+        super().reject()
+
     def get_phone_code_hash(self) -> Optional[str]:
         return self._phone_code_hash
 
@@ -193,6 +215,7 @@ class ModernUI(QMainWindow):
         self.secondary_color = "#FF9800"
 
         self.is_monitoring = False
+        self.monitor_task: Optional[asyncio.Task] = None
         self.async_tasks: List[asyncio.Task] = []  # 保存由 asyncio.create_task 创建的任务引用，防止被 GC
 
         self.config_entries = {}
@@ -357,9 +380,20 @@ class ModernUI(QMainWindow):
         self.status_labels = {}
         items = [
             ("监听状态", "未开始"),
+            ("监听账号", "-"),
             ("克隆账号数量", "0"),
             ("已克隆用户", "0"),
-            ("消息映射", "0")
+            ("消息映射", "0"),
+            ("账号回收", "0"),
+            ("RPC 缓存", "0"),
+            ("在线连接", "0"),
+            ("传输通道", "-"),
+            ("内容去重", "0"),
+            ("引用重发", "0"),
+            ("临时媒体", "-"),
+            ("账号健康", "-"),
+            ("文件黑名单", "0"),
+            ("过滤规则", "-")
         ]
         for key, val in items:
             h = QHBoxLayout()
@@ -490,12 +524,15 @@ class ModernUI(QMainWindow):
             if hasattr(Config, 'TARGET_GROUP'):
                 self.config_entries['target_group'].setText(str(getattr(Config, 'TARGET_GROUP', '') or ''))
             proxy = getattr(Config, 'PROXY', None)
-            if proxy and isinstance(proxy, (list, tuple)):
-                try:
-                    host = proxy[0][0] if isinstance(proxy[0], (list, tuple)) else ''
-                    self.config_entries['proxy_host'].setText(host or '')
-                except Exception:
-                    pass
+            self.config_entries['proxy_enabled'].setChecked(bool(proxy))
+            if proxy and isinstance(proxy, (list, tuple)) and len(proxy) >= 3:
+                self.config_entries['proxy_type'].setText(str(proxy[0] or ''))
+                self.config_entries['proxy_host'].setText(str(proxy[1] or ''))
+                self.config_entries['proxy_port'].setText(str(proxy[2] or ''))
+            # 黑名单 / 替换词回填，保证在界面上删除条目后保存、重新加载能真正移除
+            self.config_entries['blacklist_user_ids'].setText(','.join(str(uid) for uid in sorted(Config.BLACK_LIST)))
+            self.config_entries['blacklist_keywords'].setText(','.join(sorted(Config.KEY_WORDS)))
+            self.config_entries['replacements'].setText(','.join(f"{k}={v}" for k, v in Config.REPLACEMENTS.items()))
             self.update_status()
         except Exception as e:
             logging.error(f"load_config_to_ui error: {e}")
@@ -562,6 +599,49 @@ class ModernUI(QMainWindow):
             self.status_labels["克隆账号数量"].setText(str(len(clients_pool)))
             self.status_labels["已克隆用户"].setText(str(len(cloned_users)))
             self.status_labels["消息映射"].setText(str(len(message_id_mapping)))
+            stats = recycle_stats()
+            self.status_labels["账号回收"].setText(f"{stats['total']} 次（近1小时 {stats['last_hour']} 次）")
+            cache = rpc_cache.stats()
+            self.status_labels["RPC 缓存"].setText(
+                f"命中 {cache['hits']} / 未命中 {cache['misses']} / 合并 {cache['shared']}（{cache['hit_rate']:.0%}）")
+            online = sum(1 for client in clients_pool if client.is_connected())
+            healthy = sum(1 for _, ok, _ in proxy_pool.stats() if ok)
+            self.status_labels["在线连接"].setText(
+                f"{online} / {len(clients_pool)}（可用代理 {healthy} / {len(proxy_pool.proxies)}）")
+            lanes = transfer_lanes.stats()
+            self.status_labels["传输通道"].setText("  ".join(
+                f"{label} {lanes[name][0]}（排队 {lanes[name][1]}）"
+                for name, label in (("text", "文本"), ("small", "小媒体"), ("large", "大媒体"))))
+            dup = dedupe.stats()
+            self.status_labels["内容去重"].setText(
+                f"跳过 {dup['hits']} / {dup['checks']}（{dup['hit_rate']:.0%}，窗口内 {dup['entries']} 条）")
+            self.status_labels["引用重发"].setText(
+                f"{reference_stats['hits']} 条（刷新引用 {reference_stats['refreshed']} 次，"
+                f"改为下载上传 {reference_stats['fallbacks']} 条）")
+            monitors = []
+            for name, s in monitor_events.stats().items():
+                client = monitor_clients.get(name)
+                state = "在线" if client is not None and client.is_connected() else "离线"
+                idle = f"{s['idle']:.0f}s 前" if s['idle'] is not None else "-"
+                monitors.append(f"{name} {state} 最先 {s['first_rate']:.0%} 延迟 p50 {s['lag_p50']:.1f}s/p99 "
+                                f"{s['lag_p99']:.1f}s 落后 {s['behind_p50'] * 1000:.0f}ms 最近事件 {idle}")
+            self.status_labels["监听账号"].setText("\n".join(monitors) or "-")
+            ws = workspace.stats()
+            budget = f"{ws['budget'] / 1024 / 1024:.0f}MB" if ws['budget'] else "不限"
+            self.status_labels["临时媒体"].setText(
+                f"占用 {ws['reserved'] / 1024 / 1024:.1f}MB / {budget}（传输中 {ws['active']}，等待空间 {ws['waiting']}）"
+                f"  已清理残留 {ws['reclaimed_files']} 个")
+            health = health_stats()
+            self.status_labels["账号健康"].setText(
+                "  ".join(f"{HEALTH_LABELS[s]} {health[s]}" for s in ("ok", "restricted"))
+                + f"  未检查 {health['unchecked']}  已移除 {health['removed']}")
+            black = file_blacklist.stats()
+            self.status_labels["文件黑名单"].setText(
+                f"{black['entries']} 个 id / {black['files']} 个文件（映射 {black['mapped_bytes'] / 1024 / 1024:.1f}MB）")
+            rules = Config.SNAPSHOT.rules.stats()
+            self.status_labels["过滤规则"].setText("\n".join(
+                f"{r['name']}（{ACTION_LABELS[r['action']]}，{'发送者' if r['stage'] == 'sender' else '消息头'}）"
+                f" 命中 {r['hits']} / {r['evaluations']}  平均 {r['avg_us']:.1f}µs" for r in rules) or "-")
             self.account_listbox.clear()
             self.left_account_list.clear()
             
@@ -605,7 +685,9 @@ class ModernUI(QMainWindow):
         try:
             try:
                 loop = asyncio.get_running_loop()
-                # 如果成功获取到运行中的事件循环，记录日志
+                # 如果成功获取到运行中的事件循环，启动配置文件监视
+                self.async_tasks.append(asyncio.create_task(watch_config()))
+                self.async_tasks.append(asyncio.create_task(session_db.autosave()))
                 logging.info("事件循环已启动，任务工作器就绪")
             except RuntimeError:
                 # 如果没有运行中的事件循环，延迟执行
@@ -642,20 +724,20 @@ class ModernUI(QMainWindow):
         try:
             for client, cloned_user in list(clients_pool.items()):
                 try:
-                    # 使用 get_me() 获取真实的用户信息
-                    me = await client.get_me()
-                    phone = me.phone if me and me.phone else "未知手机号"
+                    # 只读缓存的用户信息：刷新列表不发请求，也不会把闲置断开的账号重新连上
+                    me = cached_me(client)
+                    phone = me.phone if me and me.phone else client_names.get(client, "未知手机号")
                     status = "已分配" if cloned_user else "空闲"
                     
-                    # 检查账号是否被限制/冻结
+                    # 账号状态取后台健康检查的结果
                     account_status = ""
-                    if me and hasattr(me, 'restricted') and me.restricted:
-                        account_status = " [冻结]"
-                    elif me and hasattr(me, 'deleted') and me.deleted:
-                        account_status = " [已删除]"
-                    elif me and hasattr(me, 'bot') and me.bot:
-                        account_status = " [机器人]"
+                    health = account_health.get(client)
+                    if health and health[0] != "ok":
+                        account_status = f" [{HEALTH_LABELS[health[0]]}]"
                     
+                    if not client.is_connected():
+                        account_status += " [未连接]"
+
                     item_text = f"{phone} - {status}{account_status}"
                 except Exception as e:
                     # 如果获取失败，尝试从 session 文件名获取
@@ -703,12 +785,11 @@ class ModernUI(QMainWindow):
         try:
             api_id = getattr(Config, "API_ID", None)
             api_hash = getattr(Config, "API_HASH", None)
-            proxy = getattr(Config, "PROXY", None) if hasattr(Config, "PROXY") else None
             if not api_id or not api_hash:
                 raise RuntimeError("Config.API_ID / API_HASH 未配置。")
+            proxy = proxy_pool.assign(phone) or getattr(Config, "PROXY", None)
 
-            session_path = f"sessions/{phone}"
-            client = TelegramClient(session_path, api_id, api_hash, proxy=proxy)
+            client = TelegramClient(session_db.session(phone), api_id, api_hash, proxy=proxy)
             await client.connect()
             try:
                 if not await client.is_user_authorized():
@@ -727,11 +808,12 @@ class ModernUI(QMainWindow):
                 await check_and_join_target(client)
             except Exception as e:
                 logging.warning(f"加入目标群时发生错误（可忽略）：{e}")
-            clients_pool[client] = None
+            register_client(client, phone)
             logging.info(f"账号 {phone} 添加成功")
             # UI updates
             self.on_operation_complete(f"账号 {phone} 添加成功")
         except Exception as e:
+            release_login_proxy(phone)
             logging.exception("添加账号失败")
             self.on_operation_error(f"添加账号失败: {e}")
         finally:
@@ -744,7 +826,7 @@ class ModernUI(QMainWindow):
         if self.is_monitoring:
             return
         # 直接创建监听任务
-        asyncio.create_task(self._start_monitor_wrapper())
+        self.monitor_task = asyncio.create_task(self._start_monitor_wrapper())
         self.is_monitoring = True
         self.start_monitor_btn.setEnabled(False)
         self.stop_monitor_btn.setEnabled(True)
@@ -757,15 +839,27 @@ class ModernUI(QMainWindow):
         try:
             # 不再重复加载 sessions，因为启动时已经加载过了
             # await load_existing_sessions('2')
+            # 超时只限制启动阶段（登录、加入源群组、注册处理函数），监听本身一直运行到停止或全部账号断开
+            ready = asyncio.Event()
+            monitor = asyncio.ensure_future(start_monitor(ready))
+            started = asyncio.ensure_future(ready.wait())
             try:
-                # 添加超时保护
-                await asyncio.wait_for(start_monitor(), timeout=60.0)
+                await asyncio.wait({monitor, started}, timeout=60.0, return_when=asyncio.FIRST_COMPLETED)
+                if not monitor.done() and not ready.is_set():
+                    monitor.cancel()
+                    raise asyncio.TimeoutError()
+                await monitor
             except asyncio.TimeoutError:
                 logging.warning("监听启动超时，可能网络较慢")
                 self.on_operation_error("监听启动超时，请检查网络连接")
+            except asyncio.CancelledError:
+                monitor.cancel()
+                logging.info("监听已停止")
             except KeyboardInterrupt:
                 logging.info("用户中断了监听")
                 self.on_operation_error("监听被用户中断")
+            finally:
+                started.cancel()
         except Exception as e:
             logging.exception("监听失败")
             self.on_operation_error(f"监听失败: {e}")
@@ -777,7 +871,10 @@ class ModernUI(QMainWindow):
         # 安全地停止监听
         if self.is_monitoring:
             self.is_monitoring = False
-            
+            if self.monitor_task is not None:
+                self.monitor_task.cancel()
+                self.monitor_task = None
+
         self.start_monitor_btn.setEnabled(True)
         self.stop_monitor_btn.setEnabled(False)
         self.status_labels["监听状态"].setText("已停止")
@@ -809,7 +906,7 @@ class ModernUI(QMainWindow):
                     for client in list(clients_pool.keys()):
                         try:
                             # 先检查账号状态
-                            me = await client.get_me()
+                            me = await get_me_cached(client)
                             if me and hasattr(me, 'restricted') and me.restricted:
                                 logging.warning(f"账号 {me.phone or '未知'} 被限制，跳过头像清理")
                                 continue
@@ -823,31 +920,19 @@ class ModernUI(QMainWindow):
                                 logging.warning(f"清理头像失败: {e}")
                     self.on_operation_complete("头像清理完成")
                 else:
-                    # 对现有客户端执行加入目标群
-                    for client in list(clients_pool.keys()):
-                        try:
-                            # 先检查账号状态
-                            me = await client.get_me()
-                            if me and hasattr(me, 'restricted') and me.restricted:
-                                logging.warning(f"账号 {me.phone or '未知'} 被限制，跳过加入目标群")
-                                continue
-                            
-                            from core import check_and_join_target
-                            await check_and_join_target(client)
-                        except Exception as e:
-                            if "FROZEN_METHOD_INVALID" in str(e) or "420" in str(e):
-                                logging.warning(f"账号被冻结，无法执行加入目标群操作")
-                            else:
-                                logging.warning(f"加入目标群失败: {e}")
+                    # 对现有客户端并发执行加入目标群，进度显示在进度条上
+                    await self._run_bulk_join()
                     self.on_operation_complete("加入目标群完成")
             else:
                 # 如果没有连接的客户端，才加载 sessions
                 try:
-                    # 添加超时保护
-                    await asyncio.wait_for(load_existing_sessions(flag), timeout=30.0)
+                    # 添加超时保护（只限制加载；批量加群数量多时耗时较长，不设超时）
                     if flag == '3':
+                        await asyncio.wait_for(load_existing_sessions(flag), timeout=30.0)
                         self.on_operation_complete("头像清理完成")
                     else:
+                        await asyncio.wait_for(load_existing_sessions('2'), timeout=30.0)
+                        await self._run_bulk_join()
                         self.on_operation_complete("加入目标群完成")
                 except asyncio.TimeoutError:
                     logging.warning("操作超时，可能网络较慢")
@@ -864,6 +949,16 @@ class ModernUI(QMainWindow):
         finally:
             self.progress_bar.setVisible(False)
 
+    async def _run_bulk_join(self):
+        def on_progress(done, total):
+            self.progress_bar.setRange(0, total)
+            self.progress_bar.setValue(done)
+            self.statusBar().showMessage(f"加入目标群: {done}/{total}")
+
+        summary = await bulk_join_target(list(clients_pool.keys()), progress=on_progress)
+        self.statusBar().showMessage(
+            f"加入目标群完成: 新加入 {summary['joined']}，已在群 {summary['member']}，失败 {summary['failed']}")
+
     def refresh_status(self):
         self.update_status()
         QMessageBox.information(self, "成功", "状态已刷新")
@@ -944,6 +1039,14 @@ class ModernUI(QMainWindow):
                             pass
             except Exception:
                 pass
+        try:
+            session_db.flush()
+        except Exception as e:
+            logging.error(f"保存 session 失败: {e}")
+        try:
+            journal.flush()
+        except Exception as e:
+            logging.error(f"保存消息日志失败: {e}")
         logging.info("异步清理完成。")
 
 # -------------------------
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多个监听账号的事件仲裁
+
+多个账号监听同一批源群组时，同一条消息会从每个账号各到达一次。EventArbiter 按
+(chat_id, msg_id) 等键记住最近 window 个事件，只放行最先到达的那一次，其余丢弃；
+某个账号卡顿、被限流或掉线时，其他账号的事件照常先到，自动接替，不需要切换逻辑。
+同时统计每个账号抢先的比例、相对消息发送时间的延迟，以及落后于最先到达者的时间。
+"""
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, Hashable, Optional, Tuple
+
+LAG_SAMPLES = 500  # 每个账号保留的延迟样本数
+
+
+class MonitorStats:
+    def __init__(self):
+        self.received = 0
+        self.first = 0
+        self.lags: deque = deque(maxlen=LAG_SAMPLES)  # 到达时间 - 消息发送时间（秒）
+        self.behind: deque = deque(maxlen=LAG_SAMPLES)  # 非最先到达时，落后于最先到达者的时间（秒）
+        self.last_event: Optional[float] = None
+
+
+def _percentile(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+class EventArbiter:
+    def __init__(self, window: int = 10_000, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._seen: "OrderedDict[Hashable, Tuple[str, float]]" = OrderedDict()
+        self.monitors: Dict[str, MonitorStats] = {}
+
+    def register(self, name: str) -> None:
+        self.monitors.setdefault(name, MonitorStats())
+
+    def first(self, name: str, key: Hashable, sent_at: Optional[datetime] = None) -> bool:
+        """name 账号收到 key 对应的事件；是最先到达的一次时返回 True"""
+        now = self.clock()
+        stats = self.monitors.setdefault(name, MonitorStats())
+        stats.received += 1
+        stats.last_event = now
+        if sent_at is not None:
+            stats.lags.append(max(0.0, time.time() - sent_at.timestamp()))
+        seen = self._seen.get(key)
+        if seen is not None:
+            stats.behind.append(now - seen[1])
+            return False
+        self._seen[key] = (name, now)
+        if len(self._seen) > self.window:
+            self._seen.popitem(last=False)
+        stats.first += 1
+        return True
+
+    def stats(self) -> Dict[str, dict]:
+        now = self.clock()
+        return {
+            name: {
+                "received": s.received,
+                "first": s.first,
+                "first_rate": s.first / s.received if s.received else 0.0,
+                "lag_p50": _percentile(s.lags, 50),
+                "lag_p99": _percentile(s.lags, 99),
+                "behind_p50": _percentile(s.behind, 50),
+                "idle": now - s.last_event if s.last_event is not None else None,
+            }
+            for name, s in self.monitors.items()
+        }
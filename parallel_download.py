@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并行分片下载
+
+telethon 的 download_media 在一条连接上逐片顺序请求，每片都要等一个往返。
+ParallelDownloader 在文件所在 DC 上建立多条连接，并发请求 GetFile 分片，
+按顺序写入文件；乱序到达的分片在内存中最多缓存 window 片。
+"""
+import asyncio
+import logging
+import os
+import tempfile
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telethon import TelegramClient, utils
+from telethon.errors import FileMigrateError
+from telethon.network import MTProtoSender
+from telethon.tl.alltlobjects import LAYER
+from telethon.tl.functions import InvokeWithLayerRequest
+from telethon.tl.functions.auth import ExportAuthorizationRequest, ImportAuthorizationRequest
+from telethon.tl.functions.upload import GetFileRequest
+from telethon.tl.types.upload import FileCdnRedirect
+
+logger = logging.getLogger(__name__)
+
+MAX_PART_SIZE = 1024 * 1024  # GetFile 单片上限；片大小须为 4KB 的倍数且能整除 1MB
+
+
+def file_location(message) -> Tuple[int, object, int]:
+    """消息或媒体 -> (所在 DC, 输入位置, 文件大小)"""
+    media = getattr(message, 'media', None) or message
+    dc_id, location = utils.get_input_location(media)
+    size = getattr(getattr(message, 'file', None), 'size', None) or 0
+    return dc_id, location, size
+
+
+async def open_senders(client: TelegramClient, dc_id: int, count: int) -> List[MTProtoSender]:
+    """在 dc_id 上为 client 的账号建立 count 条独立连接（不接收更新），用于并行传输文件分片"""
+    dc = await client._get_dc(dc_id)
+
+    async def open_sender(auth_key) -> MTProtoSender:
+        sender = MTProtoSender(auth_key, loggers=client._log)
+        await sender.connect(client._connection(dc.ip_address, dc.port, dc.id, loggers=client._log,
+                                                proxy=client._proxy, local_addr=client._local_addr))
+        return sender
+
+    if dc_id == client.session.dc_id:
+        auth_key = client.session.auth_key
+        first = await open_sender(auth_key)
+    else:
+        # 其他 DC：第一条连接生成新的授权密钥并导入登录状态，其余连接复用该密钥
+        first = await open_sender(None)
+        auth = await client(ExportAuthorizationRequest(dc_id))
+        client._init_request.query = ImportAuthorizationRequest(id=auth.id, bytes=auth.bytes)
+        await first.send(InvokeWithLayerRequest(LAYER, client._init_request))
+        auth_key = first.auth_key
+    rest = await asyncio.gather(*(open_sender(auth_key) for _ in range(count - 1)))
+    return [first, *rest]
+
+
+def valid_part_size(part_size: int) -> int:
+    part_size = max(4096, min(MAX_PART_SIZE, part_size) // 4096 * 4096)
+    while MAX_PART_SIZE % part_size:
+        part_size -= 4096
+    return part_size
+
+
+class ParallelDownloader:
+    """
+    多连接分片下载，接口与 TelegramClient.download_media 相同（返回本地路径）
+
+    connect(dc_id, count) 返回 count 条可 send(request) 的连接，默认直接建立 MTProtoSender；
+    locate(message) 返回 (dc_id, location, size)。两者可替换，用于离线压测。
+    """
+
+    def __init__(self, client: TelegramClient, connections: int = 4, part_size: int = 512 * 1024,
+                 window: Optional[int] = None, directory: Optional[str] = None,
+                 connect: Optional[Callable[[int, int], Awaitable[list]]] = None,
+                 locate: Callable[[object], Tuple[int, object, int]] = file_location):
+        self.client = client
+        self.connections = max(1, connections)
+        self.part_size = valid_part_size(part_size)
+        self.window = window or self.connections * 4
+        self.directory = directory
+        self._connect = connect or partial(open_senders, client)
+        self._locate = locate
+        self._senders: Dict[int, list] = {}
+        self._sender_locks: Dict[int, asyncio.Lock] = {}
+        self.downloads = 0
+        self.fallbacks = 0
+
+    async def _senders_for(self, dc_id: int) -> list:
+        lock = self._sender_locks.setdefault(dc_id, asyncio.Lock())
+        async with lock:
+            senders = self._senders.get(dc_id)
+            if senders is None:
+                senders = self._senders[dc_id] = await self._connect(dc_id, self.connections)
+                logger.info(f"已建立 DC {dc_id} 的 {len(senders)} 条下载连接")
+            return senders
+
+    async def download_media(self, message, file: Optional[str] = None) -> Optional[str]:
+        try:
+            dc_id, location, size = self._locate(message)
+        except TypeError:
+            dc_id = location = None
+            size = 0
+        if location is None or size <= self.part_size:
+            return await self.client.download_media(message, file=file)
+
+        path = file or os.path.join(self.directory or tempfile.gettempdir(),
+                                    f"dl_{id(message):x}_{getattr(message, 'id', 0)}{media_extension(message)}")
+        try:
+            await self._download(dc_id, location, size, path)
+        except FileMigrateError as e:
+            await self._download(e.new_dc, location, size, path)
+        except _Fallback as e:
+            # CDN 重定向等少见情况交给 telethon 自己处理
+            logger.info(f"分片下载回退到普通下载: {e}")
+            self.fallbacks += 1
+            if os.path.exists(path):
+                os.remove(path)
+            return await self.client.download_media(message, file=file)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        self.downloads += 1
+        return path
+
+    async def _download(self, dc_id: int, location, size: int, path: str) -> None:
+        senders = await self._senders_for(dc_id)
+        part_size = self.part_size
+        parts = (size + part_size - 1) // part_size
+        loop = asyncio.get_running_loop()
+        results = [loop.create_future() for _ in range(parts)]
+        pending = iter(range(parts))
+        # 先占窗口再取分片序号：尚未写入的最小分片一定已经在请求中，不会互相等待
+        window = asyncio.Semaphore(self.window)
+
+        async def worker(sender) -> None:
+            while True:
+                await window.acquire()
+                index = next(pending, None)
+                if index is None:
+                    window.release()
+                    return
+                try:
+                    result = await sender.send(GetFileRequest(location, offset=index * part_size, limit=part_size))
+                    if isinstance(result, FileCdnRedirect):
+                        raise _Fallback("CDN 重定向")
+                    results[index].set_result(result.bytes)
+                except Exception as e:
+                    results[index].set_exception(e)
+                    return
+
+        # 每条连接同时挂两个请求，隐藏往返延迟
+        workers = [asyncio.ensure_future(worker(s)) for s in senders for _ in range(2)]
+        try:
+            with open(path, "wb") as f:
+                for index in range(parts):
+                    f.write(await results[index])
+                    window.release()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            for future in results:
+                if future.done() and not future.cancelled():
+                    future.exception()  # 已失败的分片不再单独报警
+
+    async def close(self) -> None:
+        senders, self._senders = self._senders, {}
+        for group in senders.values():
+            for sender in group:
+                try:
+                    await sender.disconnect()
+                except Exception as e:
+                    logger.warning(f"关闭下载连接失败: {e}")
+
+
+class _Fallback(Exception):
+    pass
+
+
+def media_extension(message) -> str:
+    # send_file 根据扩展名判断文件类型，下载路径保留原扩展名
+    try:
+        return utils.get_extension(getattr(message, 'media', None) or message)
+    except Exception:
+        return ""
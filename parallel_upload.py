@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并行分片上传
+
+telethon 的 upload_file / send_file 逐片上传，每片等一个往返。
+ParallelUploader 按顺序读取文件分片，同时保持 window 个 SaveFilePart / SaveBigFilePart 请求在途，
+内存中最多只有 window 片数据；不可 seek 的流先写入 SpooledTemporaryFile 以得到文件大小。
+返回的 InputFile / InputFileBig 可直接交给 send_file 或 UploadProfilePhotoRequest。
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import random
+import shutil
+import tempfile
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from telethon import TelegramClient
+from telethon.tl.custom import InputSizedFile
+from telethon.tl.functions.upload import SaveBigFilePartRequest, SaveFilePartRequest
+from telethon.tl.types import InputFileBig
+
+from parallel_download import open_senders
+
+logger = logging.getLogger(__name__)
+
+MAX_PART_SIZE = 512 * 1024  # SaveFilePart 单片上限；片大小须为 1KB 的倍数且能整除 512KB
+BIG_FILE_SIZE = 10 * 1024 * 1024  # 超过该大小必须使用 SaveBigFilePart
+
+
+def valid_part_size(part_size: int) -> int:
+    part_size = max(1024, min(MAX_PART_SIZE, part_size) // 1024 * 1024)
+    while MAX_PART_SIZE % part_size:
+        part_size -= 1024
+    return part_size
+
+
+class ParallelUploader:
+    """
+    在账号自己的连接上保持多个分片请求在途；connections > 1 时另建连接分摊分片
+
+    connect(client, dc_id, count) 可替换，用于离线压测。
+    """
+
+    def __init__(self, part_size: int = 512 * 1024, window: int = 8, connections: int = 1,
+                 connect: Optional[Callable[[TelegramClient, int, int], Awaitable[list]]] = None):
+        self.configure(part_size, window, connections)
+        self._connect = connect or open_senders
+        self._senders: Dict[TelegramClient, list] = {}
+        self._sender_locks: Dict[TelegramClient, asyncio.Lock] = {}
+        self.uploads = 0
+        self.bytes = 0
+
+    def configure(self, part_size: int = 512 * 1024, window: int = 8, connections: int = 1) -> None:
+        self.part_size = valid_part_size(part_size)
+        self.window = max(1, window)
+        self.connections = max(1, connections)
+
+    async def upload_file(self, client: TelegramClient, file: Union[str, bytes, io.IOBase],
+                          file_name: Optional[str] = None):
+        stream, size, name, spool = await asyncio.to_thread(_open_stream, file, self.part_size * self.window)
+        try:
+            return await self._upload(client, stream, size, file_name or name)
+        finally:
+            if spool or isinstance(file, (str, bytes)):
+                stream.close()
+
+    async def _upload(self, client: TelegramClient, stream, size: int, name: str):
+        part_size = self.part_size
+        part_count = max(1, (size + part_size - 1) // part_size)
+        is_big = size > BIG_FILE_SIZE
+        file_id = random.getrandbits(63)
+        md5 = hashlib.md5()
+        send = await self._sender(client)
+
+        window = asyncio.Semaphore(self.window)
+        in_flight: set = set()
+        failure: list = []
+
+        async def put(index: int, data: bytes) -> None:
+            try:
+                request = (SaveBigFilePartRequest(file_id, index, part_count, data) if is_big
+                           else SaveFilePartRequest(file_id, index, data))
+                if not await send(index, request):
+                    raise RuntimeError(f"上传分片 {index} 失败")
+            except Exception as e:
+                failure.append(e)
+            finally:
+                window.release()
+
+        try:
+            for index in range(part_count):
+                await window.acquire()
+                if failure:
+                    raise failure[0]
+                data = await asyncio.to_thread(stream.read, part_size)
+                if len(data) != part_size and index < part_count - 1:
+                    raise ValueError(f"读取分片 {index} 时文件提前结束")
+                if not is_big:
+                    md5.update(data)  # 小文件需要 md5，按读取顺序计算
+                task = asyncio.ensure_future(put(index, data))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            if in_flight:
+                await asyncio.gather(*in_flight)
+            if failure:
+                raise failure[0]
+        except BaseException:
+            for task in list(in_flight):
+                task.cancel()
+            raise
+
+        self.uploads += 1
+        self.bytes += size
+        if is_big:
+            return InputFileBig(file_id, part_count, name)
+        return InputSizedFile(file_id, part_count, name, md5=md5, size=size)
+
+    async def _sender(self, client: TelegramClient) -> Callable[[int, object], Awaitable]:
+        if self.connections <= 1:
+            return lambda index, request: client(request)
+        async with self._sender_locks.setdefault(client, asyncio.Lock()):  # 相册并发上传时只建一次连接
+            senders = self._senders.get(client)
+            if senders is None:
+                senders = self._senders[client] = await self._connect(client, client.session.dc_id, self.connections)
+        return lambda index, request: senders[index % len(senders)].send(request)
+
+    async def release(self, client: TelegramClient) -> None:
+        """账号断开或移除时关闭为它建立的额外上传连接"""
+        self._sender_locks.pop(client, None)
+        for sender in self._senders.pop(client, []):
+            try:
+                await sender.disconnect()
+            except Exception as e:
+                logger.warning(f"关闭上传连接失败: {e}")
+
+
+def _open_stream(file, spool_size: int) -> Tuple[io.IOBase, int, str, bool]:
+    """-> (可读流, 大小, 文件名, 是否为临时缓存)；在线程中调用，不阻塞事件循环"""
+    if isinstance(file, str):
+        return open(file, "rb"), os.path.getsize(file), os.path.basename(file), False
+    if isinstance(file, bytes):
+        return io.BytesIO(file), len(file), "file", False
+    name = os.path.basename(getattr(file, "name", "") or "file")
+    if file.seekable():
+        start = file.tell()
+        size = file.seek(0, io.SEEK_END) - start
+        file.seek(start)
+        return file, size, name, False
+    # 不可 seek 的流：先写入临时文件（小于 spool_size 时留在内存）
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    shutil.copyfileobj(file, spool)
+    size = spool.tell()
+    spool.seek(0)
+    return spool, size, name, True
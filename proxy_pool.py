@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理池
+
+把克隆账号分散到多个代理上：每个代理有账号数上限，定期做 TCP 连通性检查，
+不可用的代理不再分配，已分配在上面的账号下次连接时换到其他代理。
+"""
+import asyncio
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+logger = logging.getLogger(__name__)
+
+Proxy = Tuple
+
+
+def parse_proxy_url(url: str) -> Proxy:
+    """socks5://[user:pass@]host:port -> telethon 使用的 (type, host, port, rdns, username, password)"""
+    parts = urlsplit(url.strip())
+    if not parts.scheme or not parts.hostname or not parts.port:
+        raise ValueError(f"代理地址格式应为 type://[user:pass@]host:port: {url}")
+    return (parts.scheme, parts.hostname, parts.port, True,
+            unquote(parts.username) if parts.username else None,
+            unquote(parts.password) if parts.password else None)
+
+
+def proxy_label(proxy: Optional[Proxy]) -> str:
+    return f"{proxy[0]}://{proxy[1]}:{proxy[2]}" if proxy else "直连"
+
+
+class ProxyPool:
+    def __init__(self, proxies: Optional[List[Proxy]] = None, per_proxy_limit: int = 0):
+        self.proxies: List[Proxy] = []
+        self.per_proxy_limit = 0
+        self.healthy: Dict[Proxy, bool] = {}
+        self._assigned: Dict[str, Proxy] = {}
+        self._load: Counter = Counter()
+        self.configure(proxies or [], per_proxy_limit)
+
+    def configure(self, proxies: List[Proxy], per_proxy_limit: int = 0) -> None:
+        """更新代理列表；仍在列表中的代理保留原有的账号分配"""
+        self.proxies = list(dict.fromkeys(proxies))
+        self.per_proxy_limit = per_proxy_limit
+        self.healthy = {proxy: self.healthy.get(proxy, True) for proxy in self.proxies}
+        for name, proxy in list(self._assigned.items()):
+            if proxy not in self.healthy:
+                self.release(name)
+
+    def assign(self, name: str) -> Optional[Proxy]:
+        """为账号选择代理：沿用已分配的健康代理，否则选负载最低且未达上限的健康代理"""
+        if not self.proxies:
+            return None
+        current = self._assigned.get(name)
+        if current is not None and self.healthy.get(current):
+            return current
+        self.release(name)
+
+        healthy = [p for p in self.proxies if self.healthy.get(p)]
+        under_limit = [p for p in healthy if not self.per_proxy_limit or self._load[p] < self.per_proxy_limit]
+        candidates = under_limit or healthy or self.proxies
+        if not under_limit:
+            logger.warning("没有未满且可用的代理，账号将分配到负载最低的代理")
+        proxy = min(candidates, key=lambda p: self._load[p])
+        self._assigned[name] = proxy
+        self._load[proxy] += 1
+        return proxy
+
+    def release(self, name: str) -> None:
+        proxy = self._assigned.pop(name, None)
+        if proxy is not None:
+            self._load[proxy] -= 1
+
+    def is_healthy(self, name: str) -> bool:
+        proxy = self._assigned.get(name)
+        return proxy is None or self.healthy.get(proxy, False)
+
+    async def check_health(self, timeout: float = 5.0) -> None:
+        async def probe(proxy: Proxy) -> bool:
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(proxy[1], proxy[2]), timeout)
+                writer.close()
+                return True
+            except Exception:
+                return False
+
+        results = await asyncio.gather(*(probe(p) for p in self.proxies))
+        for proxy, ok in zip(self.proxies, results):
+            if self.healthy.get(proxy) != ok:
+                logger.warning(f"代理 {proxy_label(proxy)} {'恢复可用' if ok else '不可用'}")
+            self.healthy[proxy] = ok
+
+    async def run_health_checks(self, interval: float = 60.0) -> None:
+        while True:
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error(f"代理健康检查失败: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self) -> List[Tuple[str, bool, int]]:
+        return [(proxy_label(p), self.healthy.get(p, False), self._load[p]) for p in self.proxies]
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RPC 去重与短期缓存
+
+SingleFlight: 相同 key 的并发调用共享同一个进行中的请求；
+CachedRPC:    在 SingleFlight 之上加一层带 TTL 的结果缓存，并统计命中/未命中/合并次数。
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class SingleFlight:
+    """相同 key 的并发调用只发出一次请求，其余调用等待同一个结果"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.shared += 1
+        # shield: 某个调用方被取消时不影响其他等待同一结果的调用方
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # 标记异常已读取，避免所有调用方都被取消时出现警告
+
+
+class TTLCache:
+    """带过期时间与容量上限的缓存，超出容量时淘汰最早写入的条目"""
+
+    def __init__(self, maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = _MISSING) -> Any:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class CachedRPC:
+    """先查 TTL 缓存，未命中时通过 SingleFlight 发出请求并缓存结果（异常不缓存）"""
+
+    def __init__(self, maxsize: int = 50_000, ttl: float = 300.0):
+        self.ttl = ttl
+        self.cache = TTLCache(maxsize)
+        self.flight = SingleFlight()
+
+    async def call(self, key: Hashable, factory: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        value = self.cache.get(key)
+        if value is not _MISSING:
+            return value
+
+        async def fetch():
+            result = await factory()
+            self.cache.set(key, result, self.ttl if ttl is None else ttl)
+            return result
+
+        return await self.flight.do(key, fetch)
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """只读缓存，不发请求，也不计入命中统计"""
+        entry = self.cache._data.get(key)
+        return entry[1] if entry is not None and entry[0] > time.monotonic() else default
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self.cache.set(key, value, self.ttl if ttl is None else ttl)
+
+    def invalidate(self, key: Hashable) -> None:
+        self.cache.pop(key)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.cache.hits + self.cache.misses
+        return {
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "shared": self.flight.shared,
+            "hit_rate": self.cache.hits / lookups if lookups else 0.0,
+            "size": len(self.cache),
+        }
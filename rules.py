@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+消息过滤规则
+
+config.ini 的 [rules] 段每项一条规则，加载配置时编译成有序的规则链：
+
+    no_stickers = drop
+        media = sticker, gif
+    vip = allow
+        sender = 123, 456
+
+第一行是动作（drop 丢弃 / allow 放行并跳过之后的全部规则），其后每行一个条件，
+全部条件成立时规则命中；条件名后加 ! 表示取反（如 media != text）。按声明顺序第一条命中的规则生效。
+
+条件按开销从低到高检查，任一不成立即停止。相邻的 drop 规则之间顺序不影响结果，编译时
+把其中只依赖消息头、开销低的排到前面，allow 规则保持原位。只依赖消息本身的规则（消息头阶段）
+在请求发送者实体之前执行：需要发送者的 drop 规则先跳过，之后任一 drop 规则命中即可直接丢弃；
+只有结果取决于被跳过的规则时才需要请求发送者。每条规则记录检查次数、命中次数与耗时。
+"""
+import re
+import time
+from typing import Callable, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from telethon import utils
+
+Pending = Tuple[int, int, bool]  # 消息头阶段未能决定时留给发送者阶段的位置，见 RuleChain.check_header
+ACTIONS = ("drop", "allow")
+ACTION_LABELS = {"drop": "丢弃", "allow": "放行"}
+MEDIA_KINDS = ("text", "photo", "video", "round", "gif", "sticker", "voice", "audio", "document",
+               "webpage", "other")
+
+_LENGTH = re.compile(r"^(<=|>=|<|>)?\s*(\d+)(?:\s*-\s*(\d+))?$")
+
+
+class RuleStats:
+    def __init__(self):
+        self.evaluations = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+
+class Condition:
+    def __init__(self, name: str, test: Callable, cost: int, needs_sender: bool = False, negate: bool = False):
+        self.name = name
+        self.test = test  # (message, sender) -> bool；消息头阶段 sender 为 None
+        self.cost = cost
+        self.needs_sender = needs_sender
+        self.negate = negate
+
+    def __call__(self, message, sender) -> bool:
+        return self.test(message, sender) != self.negate
+
+
+class Rule:
+    def __init__(self, name: str, action: str, conditions: Sequence[Condition]):
+        self.name = name
+        self.action = action
+        self.conditions = sorted(conditions, key=lambda c: (c.needs_sender, c.cost))  # 便宜的条件先检查
+        self.needs_sender = any(c.needs_sender for c in conditions)
+        self.cost = sum(c.cost for c in conditions)
+        self.stats = RuleStats()
+
+    def matches(self, message, sender=None) -> bool:
+        started = time.perf_counter()
+        hit = True
+        for condition in self.conditions:
+            if not condition(message, sender):
+                hit = False
+                break
+        stats = self.stats
+        stats.evaluations += 1
+        stats.hits += hit
+        stats.seconds += time.perf_counter() - started
+        return hit
+
+
+class RuleChain:
+    def __init__(self, rules: Iterable[Rule] = ()):
+        self.rules = _reorder(list(rules))
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def check_header(self, message) -> Tuple[Optional[str], Optional[Pending]]:
+        """
+        消息头阶段，返回 (动作, pending)：动作为命中规则的 drop/allow，没有规则命中时为 None；
+        结果取决于需要发送者的规则时 pending 不为 None，拿到发送者后交给 check_sender
+
+        pending = (第一条被跳过的规则, 停下的位置, 停下的规则是否已命中)：两者之间只依赖消息头的规则都未命中。
+        """
+        deferred = None
+        for i, rule in enumerate(self.rules):
+            if rule.needs_sender:
+                if rule.action == "allow":  # 之后的 drop 命中也不能确定结果
+                    return None, (i if deferred is None else deferred, i, False)
+                if deferred is None:
+                    deferred = i
+                continue
+            if rule.matches(message):
+                if rule.action == "drop" or deferred is None:
+                    return rule.action, None
+                return None, (deferred, i, True)
+        return None, (None if deferred is None else (deferred, len(self.rules), False))
+
+    def check_sender(self, message, sender, pending: Pending) -> Optional[str]:
+        """从被跳过的第一条规则继续，返回命中规则的动作；没有规则命中时返回 None"""
+        resume, stop, matched = pending
+        for i in range(resume, len(self.rules)):
+            rule = self.rules[i]
+            if i < stop and not rule.needs_sender:
+                continue
+            if i == stop and matched:
+                return rule.action
+            if rule.matches(message, sender):
+                return rule.action
+        return None
+
+    def adopt(self, previous: "RuleChain") -> None:
+        """重新加载配置时沿用同名规则的统计"""
+        old = {rule.name: rule.stats for rule in previous.rules}
+        for rule in self.rules:
+            if rule.name in old:
+                rule.stats = old[rule.name]
+
+    def stats(self) -> List[dict]:
+        return [{"name": rule.name, "action": rule.action, "stage": "sender" if rule.needs_sender else "header",
+                 "evaluations": rule.stats.evaluations, "hits": rule.stats.hits,
+                 "avg_us": rule.stats.seconds / rule.stats.evaluations * 1e6 if rule.stats.evaluations else 0.0}
+                for rule in self.rules]
+
+
+def _reorder(rules: List[Rule]) -> List[Rule]:
+    # 连续的 drop 规则互相交换顺序不改变结果：只依赖消息头、开销低的排前面；allow 规则是分隔点
+    result: List[Rule] = []
+    segment: List[Rule] = []
+    for rule in rules + [None]:
+        if rule is not None and rule.action == "drop":
+            segment.append(rule)
+            continue
+        result.extend(sorted(segment, key=lambda r: (r.needs_sender, r.cost)))
+        segment = []
+        if rule is not None:
+            result.append(rule)
+    return result
+
+
+def media_kind(message) -> str:
+    media = message.media
+    if media is None:
+        return "text"
+    if getattr(media, "photo", None) is not None:
+        return "photo"
+    if getattr(media, "webpage", None) is not None:
+        return "webpage"
+    document = getattr(media, "document", None)
+    if document is None:
+        return "other"
+    for attribute in getattr(document, "attributes", None) or ():
+        name = type(attribute).__name__
+        if name == "DocumentAttributeSticker":
+            return "sticker"
+        if name == "DocumentAttributeAnimated":
+            return "gif"
+        if name == "DocumentAttributeVideo":
+            return "round" if getattr(attribute, "round_message", False) else "video"
+        if name == "DocumentAttributeAudio":
+            return "voice" if getattr(attribute, "voice", False) else "audio"
+    mime_type = getattr(document, "mime_type", None) or ""
+    if mime_type.startswith("video/"):
+        return "video"
+    return "document"
+
+
+def forwarded_from(message) -> Optional[int]:
+    """转发来源的 peer id；隐藏了来源的转发返回 0，不是转发返回 None"""
+    header = message.fwd_from
+    if header is None:
+        return None
+    return utils.get_peer_id(header.from_id) if header.from_id is not None else 0
+
+
+def _ids(value: str) -> FrozenSet[int]:
+    try:
+        return frozenset(int(item) for item in _items(value))
+    except ValueError:
+        raise ValueError(f"id 列表只能包含数字: {value}") from None
+
+
+def _items(value: str) -> List[str]:
+    return [item.strip() for item in re.split(r"[,，]", value) if item.strip()]
+
+
+def _boolean(value: str) -> bool:
+    lowered = value.strip().lower()
+    if lowered not in ("true", "false", "yes", "no", "1", "0"):
+        raise ValueError(f"应为 true/false: {value}")
+    return lowered in ("true", "yes", "1")
+
+
+def _length(value: str) -> Tuple[int, float]:
+    match = _LENGTH.match(value.strip())
+    if not match:
+        raise ValueError(f"长度条件应为 <N、>N、<=N、>=N 或 N-M: {value}")
+    op, low, high = match.group(1), int(match.group(2)), match.group(3)
+    if high is not None:
+        return low, int(high)
+    return {"<": (0, low - 1), "<=": (0, low), ">": (low + 1, float("inf")),
+            ">=": (low, float("inf")), None: (low, low)}[op]
+
+
+def _text(message) -> str:
+    return message.raw_text or ""
+
+
+def build_condition(key: str, value: str) -> Condition:
+    key = key.strip()
+    negate = key.endswith("!")
+    key = key.rstrip("!").strip().lower()
+    value = value.strip()
+    if key == "chat":
+        chats = _ids(value)
+        return Condition(key, lambda m, s: m.chat_id in chats, 1, negate=negate)
+    if key == "sender":
+        senders = _ids(value)
+        return Condition(key, lambda m, s: m.sender_id in senders, 1, negate=negate)
+    if key == "reply":
+        expected = _boolean(value)
+        return Condition(key, lambda m, s: (m.reply_to is not None) == expected, 1, negate=negate)
+    if key == "forwarded":
+        if value.lower() == "any":
+            return Condition(key, lambda m, s: m.fwd_from is not None, 1, negate=negate)
+        sources = _ids(value)
+        return Condition(key, lambda m, s: forwarded_from(m) in sources, 1, negate=negate)
+    if key == "media":
+        kinds = frozenset(item.lower() for item in _items(value))
+        unknown = kinds - set(MEDIA_KINDS) - {"any"}
+        if unknown:
+            raise ValueError(f"未知的媒体类型 {', '.join(sorted(unknown))}，可选: {', '.join(MEDIA_KINDS)}, any")
+        if "any" in kinds:
+            return Condition(key, lambda m, s: m.media is not None, 1, negate=negate)
+        return Condition(key, lambda m, s: media_kind(m) in kinds, 2, negate=negate)
+    if key == "length":
+        low, high = _length(value)
+        return Condition(key, lambda m, s: low <= len(_text(m)) <= high, 2, negate=negate)
+    if key == "regex":
+        try:
+            pattern = re.compile(value)
+        except re.error as e:
+            raise ValueError(f"正则无效 {value}: {e}") from None
+        return Condition(key, lambda m, s: pattern.search(_text(m)) is not None, 5, negate=negate)
+    if key == "bot":
+        expected = _boolean(value)
+        return Condition(key, lambda m, s: bool(getattr(s, "bot", False)) == expected, 1, True, negate)
+    if key == "username":
+        names = frozenset(item.lstrip("@").lower() for item in _items(value))
+        return Condition(key, lambda m, s: (getattr(s, "username", None) or "").lower() in names, 2, True, negate)
+    raise ValueError(f"未知的规则条件: {key}")
+
+
+def parse_rules(items: Iterable[Tuple[str, str]]) -> List[Rule]:
+    """解析 [rules] 段的 (规则名, 内容)；格式错误时抛出 ValueError 并指出规则名"""
+    rules = []
+    for name, body in items:
+        lines = [line.strip() for line in body.splitlines() if line.strip()]
+        action = lines[0].lower() if lines else ""
+        if action not in ACTIONS:
+            raise ValueError(f"规则 {name} 的动作只能是 {'/'.join(ACTIONS)}: {action}")
+        conditions = []
+        for line in lines[1:]:
+            key, sep, value = line.partition("=")
+            if not sep or not key.strip():
+                raise ValueError(f"规则 {name} 的条件应为 名称 = 值: {line}")
+            try:
+                conditions.append(build_condition(key, value))
+            except ValueError as e:
+                raise ValueError(f"规则 {name}: {e}") from None
+        rules.append(Rule(name, action, conditions))
+    return rules
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+集中式 session 存储
+
+所有克隆账号的 session 保存在同一个 SQLite 文件里，启动时一次查询全部读入内存；
+运行中的修改（授权密钥、实体缓存、更新状态）先记在内存里，由 autosave 定期在线程池中批量写入，
+不再在事件循环上做同步磁盘写。首次运行时自动导入 sessions/ 下原有的 .session 文件（原文件保留）。
+"""
+import asyncio
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from telethon import utils
+from telethon.crypto import AuthKey
+from telethon.sessions import MemorySession
+from telethon.tl.types import PeerChannel, PeerChat, PeerUser, updates
+
+logger = logging.getLogger(__name__)
+
+EntityRow = Tuple[int, int, Optional[str], Optional[str], Optional[str]]  # (id, hash, username, phone, name)
+
+SCHEMA = (
+    """create table if not exists sessions (
+        name text primary key,
+        dc_id integer,
+        server_address text,
+        port integer,
+        auth_key blob,
+        takeout_id integer
+    )""",
+    """create table if not exists entities (
+        name text,
+        id integer,
+        hash integer not null,
+        username text,
+        phone integer,
+        display_name text,
+        date integer,
+        primary key (name, id)
+    )""",
+    """create table if not exists update_state (
+        name text,
+        id integer,
+        pts integer,
+        qts integer,
+        date integer,
+        seq integer,
+        primary key (name, id)
+    )""",
+    # 已导入过的 .session 文件名：账号登出删除后不会被重新导入
+    "create table if not exists imported (name text primary key)",
+)
+
+
+class DBSession(MemorySession):
+    """数据保存在内存中的 telethon session，修改通过 SessionDB 批量落盘"""
+
+    def __init__(self, db: "SessionDB", name: str):
+        super().__init__()
+        self.db = db
+        self.name = name
+        self._entities: Dict[int, EntityRow] = {}  # {marked id: row}，按 id 查找是 O(1)
+
+    def __repr__(self):
+        return f"<DBSession {self.name}>"
+
+    def set_dc(self, dc_id, server_address, port):
+        super().set_dc(dc_id, server_address, port)
+        self.db.mark_session(self)
+
+    @MemorySession.auth_key.setter
+    def auth_key(self, value):
+        self._auth_key = value
+        self.db.mark_session(self)
+
+    @MemorySession.takeout_id.setter
+    def takeout_id(self, value):
+        self._takeout_id = value
+        self.db.mark_session(self)
+
+    def set_update_state(self, entity_id, state):
+        super().set_update_state(entity_id, state)
+        self.db.mark_update_state(self, entity_id, state)
+
+    def process_entities(self, tlo):
+        # 只把新出现或有变化的实体加入写队列，同一批用户反复出现时不产生磁盘写
+        for row in self._entities_to_rows(tlo):
+            if self._entities.get(row[0]) != row:
+                self._entities[row[0]] = row
+                self.db.mark_entity(self, row)
+
+    def get_entity_rows_by_phone(self, phone):
+        return next(((row[0], row[1]) for row in self._entities.values() if row[3] == phone), None)
+
+    def get_entity_rows_by_username(self, username):
+        return next(((row[0], row[1]) for row in self._entities.values() if row[2] == username), None)
+
+    def get_entity_rows_by_name(self, name):
+        return next(((row[0], row[1]) for row in self._entities.values() if row[4] == name), None)
+
+    def get_entity_rows_by_id(self, id, exact=True):
+        ids = (id,) if exact else tuple(utils.get_peer_id(peer(id)) for peer in (PeerUser, PeerChat, PeerChannel))
+        for marked in ids:
+            row = self._entities.get(marked)
+            if row is not None:
+                return row[0], row[1]
+        return None
+
+    def clone(self, to_instance=None):
+        # telethon 只在连接 CDN 时克隆 session，这类临时 session 不需要落盘
+        return super().clone(to_instance or MemorySession())
+
+    def save(self):
+        # telethon 在授权、切换 DC 等时机调用 save；实际写入由 SessionDB.autosave 批量完成
+        pass
+
+    def delete(self):
+        self.db.delete(self.name)
+
+
+class SessionDB:
+    def __init__(self, path: str = "setting/sessions.db"):
+        self.path = path
+        self.sessions: Dict[str, DBSession] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.Lock()
+        self._loaded = False
+        # 待写入的修改
+        self._dirty_sessions: Dict[str, DBSession] = {}
+        self._dirty_entities: Dict[Tuple[str, int], EntityRow] = {}
+        self._dirty_states: Dict[Tuple[str, int], object] = {}
+        self._deleted: set = set()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("pragma journal_mode=wal")
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+            self._conn.commit()
+        return self._conn
+
+    def load(self, legacy_dir: Optional[str] = "sessions") -> Dict[str, DBSession]:
+        """读入全部 session（只在第一次调用时读库），并导入 legacy_dir 中尚未导入的 .session 文件"""
+        if self._loaded:
+            return self.sessions
+        conn = self._connect()
+        if legacy_dir and os.path.isdir(legacy_dir):
+            self._import_legacy(conn, legacy_dir)
+
+        for name, dc_id, address, port, key, takeout_id in conn.execute("select * from sessions"):
+            session = DBSession(self, name)
+            session._dc_id, session._server_address, session._port = dc_id or 0, address, port
+            session._auth_key = AuthKey(data=key) if key else None
+            session._takeout_id = takeout_id
+            self.sessions[name] = session
+        for name, id, hash, username, phone, display_name, _ in conn.execute("select * from entities"):
+            session = self.sessions.get(name)
+            if session is not None:
+                session._entities[id] = (id, hash, username, phone, display_name)
+        for name, id, pts, qts, date, seq in conn.execute("select * from update_state"):
+            session = self.sessions.get(name)
+            if session is not None:
+                session._update_states[id] = updates.State(
+                    pts, qts, datetime.datetime.fromtimestamp(date, tz=datetime.timezone.utc), seq, unread_count=0)
+        self._loaded = True
+        return self.sessions
+
+    def _import_legacy(self, conn: sqlite3.Connection, legacy_dir: str) -> None:
+        known = {row[0] for row in conn.execute("select name from imported")}
+        imported = 0
+        for filename in sorted(os.listdir(legacy_dir)):
+            name, ext = os.path.splitext(filename)
+            if ext != ".session" or name in known:
+                continue
+            try:
+                legacy = sqlite3.connect(f"file:{os.path.join(legacy_dir, filename)}?mode=ro", uri=True)
+                try:
+                    row = legacy.execute("select dc_id, server_address, port, auth_key, takeout_id from sessions").fetchone()
+                    entities = legacy.execute("select id, hash, username, phone, name, date from entities").fetchall()
+                finally:
+                    legacy.close()
+            except sqlite3.Error as e:
+                logger.warning(f"导入 session 文件失败 {filename}: {e}")
+                continue
+            conn.execute("insert or replace into imported values (?)", (name,))
+            if row is None:
+                continue
+            conn.execute("insert or replace into sessions values (?,?,?,?,?,?)", (name,) + tuple(row))
+            conn.executemany("insert or replace into entities values (?,?,?,?,?,?,?)",
+                             [(name,) + tuple(entity) for entity in entities])
+            imported += 1
+        conn.commit()
+        if imported:
+            logger.info(f"已将 {imported} 个 .session 文件导入 {self.path}")
+
+    def session(self, name: str) -> DBSession:
+        """取得账号的 session，不存在时新建（例如登录新账号）"""
+        self.load()
+        session = self.sessions.get(name)
+        if session is None:
+            session = self.sessions[name] = DBSession(self, name)
+            self._deleted.discard(name)
+        return session
+
+    def names(self) -> List[str]:
+        return sorted(self.load())
+
+    def mark_session(self, session: DBSession) -> None:
+        self._dirty_sessions[session.name] = session
+
+    def mark_entity(self, session: DBSession, row: EntityRow) -> None:
+        self._dirty_entities[(session.name, row[0])] = row
+
+    def mark_update_state(self, session: DBSession, entity_id: int, state) -> None:
+        self._dirty_states[(session.name, entity_id)] = state
+
+    def delete(self, name: str) -> None:
+        self.sessions.pop(name, None)
+        self._dirty_sessions.pop(name, None)
+        self._deleted.add(name)
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty_sessions) + len(self._dirty_entities) + len(self._dirty_states) + len(self._deleted)
+
+    def _take_batch(self) -> tuple:
+        """在事件循环线程上取走待写入的修改，转换成纯数据行"""
+        now = int(time.time())
+        sessions = [(name, s.dc_id, s.server_address, s.port, s.auth_key.key if s.auth_key else None, s.takeout_id)
+                    for name, s in self._dirty_sessions.items()]
+        entities = [(name,) + row + (now,) for (name, _), row in self._dirty_entities.items() if name not in self._deleted]
+        states = [(name, entity_id, state.pts, state.qts, state.date.timestamp(), state.seq)
+                  for (name, entity_id), state in self._dirty_states.items() if name not in self._deleted]
+        deleted = list(self._deleted)
+        self._dirty_sessions, self._dirty_entities, self._dirty_states, self._deleted = {}, {}, {}, set()
+        return sessions, entities, states, deleted
+
+    def _write(self, batch: tuple) -> None:
+        sessions, entities, states, deleted = batch
+        with self._write_lock:
+            conn = self._connect()
+            with conn:  # 一个事务
+                for name in deleted:
+                    for table in ("sessions", "entities", "update_state"):
+                        conn.execute(f"delete from {table} where name = ?", (name,))
+                conn.executemany("insert or replace into sessions values (?,?,?,?,?,?)", sessions)
+                conn.executemany("insert or replace into entities values (?,?,?,?,?,?,?)", entities)
+                conn.executemany("insert or replace into update_state values (?,?,?,?,?,?)", states)
+
+    def flush(self) -> None:
+        """同步写入全部修改（退出时调用）"""
+        if self.pending:
+            self._write(self._take_batch())
+
+    async def flush_async(self) -> None:
+        if self.pending:
+            await asyncio.to_thread(self._write, self._take_batch())
+
+    async def autosave(self, interval: float = 2.0) -> None:
+        """定期在线程池中批量写入，取消时把剩余修改写完"""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.flush_async()
+                except Exception as e:
+                    logger.error(f"保存 session 失败: {e}")
+        finally:
+            self.flush()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+在原始文本 + 格式实体上做替换
+
+message.text 是 telethon 把 raw_text 与 entities 渲染成的 markdown，发送时又要重新解析一遍，
+替换词碰到 * _ ` [ 等字符时还会破坏格式。这里直接在 raw_text 上替换，并按 UTF-16 偏移
+（Telegram 实体的单位）重新计算每个实体的 offset/length，发送时用 formatting_entities 原样带上。
+"""
+from bisect import bisect_right
+from typing import Callable, List, Optional, Pattern, Sequence, Tuple
+
+
+def utf16_len(text: str) -> int:
+    """字符串的 UTF-16 长度：BMP 以外的字符（多数 emoji）占两个单位"""
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) // 2
+
+
+def replace_with_entities(pattern: Pattern, replace: Callable, text: str,
+                          entities: Optional[Sequence]) -> Tuple[str, list]:
+    """
+    等价于 pattern.sub(replace, text)，同时返回调整后的实体副本（原实体不修改）
+
+    实体的起点落在被替换的片段内部时移到替换结果的开头，终点落在内部时移到替换结果的末尾；
+    整个被替换掉（长度变为 0）的实体丢弃。
+    """
+    entities = list(entities or [])
+    parts: List[str] = []
+    starts: List[int] = []  # 每处替换在原文中的 UTF-16 起点
+    ends: List[int] = []  # 终点
+    sizes: List[int] = []  # 替换结果的 UTF-16 长度
+    position = 0  # 已处理到的原文下标（Python 字符）
+    offset = 0  # 同一位置的 UTF-16 偏移
+    for match in pattern.finditer(text):
+        start, end = match.span()
+        new = replace(match)
+        offset += utf16_len(text[position:start])
+        starts.append(offset)
+        offset += utf16_len(text[start:end])
+        ends.append(offset)
+        sizes.append(utf16_len(new))
+        parts.append(text[position:start])
+        parts.append(new)
+        position = end
+    if not starts:
+        return text, entities
+    parts.append(text[position:])
+    if not entities:
+        return "".join(parts), entities
+
+    # deltas[k]: 前 k 处替换造成的累计长度变化
+    deltas = [0]
+    for start, end, size in zip(starts, ends, sizes):
+        deltas.append(deltas[-1] + size - (end - start))
+
+    def remap(point: int, is_end: bool) -> int:
+        k = bisect_right(ends, point)  # 终点不超过 point 的替换都在它之前
+        if k < len(starts) and starts[k] < point:  # point 落在第 k 处替换内部
+            return starts[k] + deltas[k] + (sizes[k] if is_end else 0)
+        return point + deltas[k]
+
+    result = []
+    for entity in entities:
+        begin = remap(entity.offset, False)
+        length = remap(entity.offset + entity.length, True) - begin
+        if length <= 0:
+            continue
+        if (begin, length) != (entity.offset, entity.length):
+            entity = _moved(entity, begin, length)
+        result.append(entity)
+    return "".join(parts), result
+
+
+def prepend(prefix: str, text: str, entities: Optional[Sequence]) -> Tuple[str, list]:
+    """在文本前加上无格式的前缀（如引用），实体整体后移"""
+    entities = list(entities or [])
+    if not prefix:
+        return text, entities
+    shift = utf16_len(prefix)
+    return prefix + text, [_moved(e, e.offset + shift, e.length) for e in entities]
+
+
+def _moved(entity, offset: int, length: int):
+    # 浅拷贝：比 copy.copy 快得多，长消息里可能有上百个实体
+    clone = object.__new__(type(entity))
+    clone.__dict__.update(entity.__dict__)
+    clone.offset, clone.length = offset, length
+    return clone
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+临时媒体工作目录
+
+下载的媒体与头像只写入这个目录（可以放在 tmpfs 上），每个文件名唯一，并发下载互不覆盖。
+lease(size) 先按预计大小占用磁盘预算，预算用完时新的下载排队等待；离开 with 块时
+删除租约内的全部文件并归还预算，异常退出也一样。janitor 在启动时和定时清理不属于任何租约的残留文件；
+目录可能与其他程序共用（/tmp、/dev/shm），只清理文件名符合租约格式（16 位十六进制前缀-序号）的文件。
+"""
+import asyncio
+import collections
+import contextlib
+import itertools
+import logging
+import os
+import re
+import time
+import uuid
+from typing import AsyncIterator, Deque, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+ORPHAN_GRACE = 60.0  # 定时清理时只删除修改时间早于该秒数的残留文件
+_LEASE_FILE = re.compile(r"^([0-9a-f]{16})-\d+(?:\.[^.]+)*$")  # Lease.path 生成的文件名
+
+
+class Lease:
+    """一次转发占用的预算与文件；path() 分配的文件在租约结束时统一删除"""
+
+    def __init__(self, directory: str, size: int, prefix: str):
+        self.directory = directory
+        self.size = size
+        self.prefix = prefix
+        self.paths: List[str] = []
+        self._ids = itertools.count()
+
+    def path(self, extension: str = "") -> str:
+        path = os.path.join(self.directory, f"{self.prefix}-{next(self._ids)}{extension}")
+        self.paths.append(path)
+        return path
+
+    def cleanup(self) -> int:
+        """删除租约内的文件，返回删除的字节数"""
+        freed = 0
+        for path in self.paths:
+            try:
+                freed += os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"删除临时文件失败 {path}: {e}")
+        return freed
+
+
+class MediaWorkspace:
+    def __init__(self, directory: str = "media_tmp", budget: int = 2 * 1024 * 1024 * 1024,
+                 default_size: int = 1024 * 1024):
+        self.directory = directory
+        self.budget = budget  # 字节，0 表示不限
+        self.default_size = default_size  # 大小未知的文件（如头像）按这个大小占用预算
+        self.reserved = 0
+        self._leases: Set[Lease] = set()
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = collections.deque()
+        self.waits = 0
+        self.reclaimed_files = 0
+        self.reclaimed_bytes = 0
+
+    def configure(self, directory: str = "media_tmp", budget: int = 2 * 1024 * 1024 * 1024) -> None:
+        """目录变化只影响之后的租约，进行中的下载继续使用原目录"""
+        self.directory = directory
+        self.budget = max(0, budget)
+        self._wake()
+
+    def _fits(self, size: int) -> bool:
+        # 超过整个预算的文件在没有其他占用时也放行，避免永远等待
+        return not self.budget or self.reserved + size <= self.budget or not self.reserved
+
+    def _wake(self) -> None:
+        """按先来先到唤醒放得下的等待者；排在前面的放不下时后面的也继续等"""
+        while self._waiters:
+            size, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(size):
+                return
+            self._waiters.popleft()
+            self.reserved += size
+            future.set_result(None)
+
+    async def _reserve(self, size: int) -> None:
+        if not self._waiters and self._fits(size):
+            self.reserved += size
+            return
+        self.waits += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((size, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.reserved -= size  # 已经分到预算后才被取消
+            self._wake()
+            raise
+
+    @contextlib.asynccontextmanager
+    async def lease(self, size: int = 0) -> AsyncIterator[Lease]:
+        size = size or self.default_size
+        await self._reserve(size)
+        lease = Lease(self.directory, size, uuid.uuid4().hex[:16])
+        self._leases.add(lease)
+        try:
+            os.makedirs(lease.directory, exist_ok=True)
+            yield lease
+        finally:
+            self._leases.discard(lease)
+            lease.cleanup()
+            self.reserved -= size
+            self._wake()
+
+    def _sweep(self, directory: str, active: Set[str], grace: float) -> Tuple[int, int]:
+        """在线程中执行：删除不属于进行中租约的文件"""
+        files = freed = 0
+        now = time.time()
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return 0, 0
+        for entry in entries:
+            match = _LEASE_FILE.match(entry.name)
+            if match is None or match.group(1) in active or not entry.is_file(follow_symlinks=False):
+                continue
+            try:
+                stat = entry.stat(follow_symlinks=False)
+                if now - stat.st_mtime < grace:
+                    continue
+                os.remove(entry.path)
+                files += 1
+                freed += stat.st_size
+            except OSError:
+                continue
+        return files, freed
+
+    async def sweep(self, grace: float = ORPHAN_GRACE) -> int:
+        active = {lease.prefix for lease in self._leases}
+        files, freed = await asyncio.to_thread(self._sweep, self.directory, active, grace)
+        if files:
+            self.reclaimed_files += files
+            self.reclaimed_bytes += freed
+            logger.info(f"清理临时媒体残留文件 {files} 个，共 {freed / 1024 / 1024:.1f}MB")
+        return files
+
+    async def run_janitor(self, interval: float = 600.0) -> None:
+        """启动时清理上次运行留下的全部文件，之后每隔 interval 清理一次"""
+        grace = 0.0
+        while True:
+            try:
+                await self.sweep(grace)
+            except Exception as e:
+                logger.error(f"清理临时媒体目录失败: {e}")
+            grace = ORPHAN_GRACE
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        return {"reserved": self.reserved, "budget": self.budget, "active": len(self._leases),
+                "waiting": len(self._waiters), "waits": self.waits,
+                "reclaimed_files": self.reclaimed_files, "reclaimed_bytes": self.reclaimed_bytes}